@@ -0,0 +1,31 @@
+"""Compares the callbacks with batched collection events against one event per element.
+
+    python -m benchmarks.bench_batches [dump.rdb ...]
+"""
+import sys
+from StringIO import StringIO
+
+from rdbtools import RdbParser, JSONCallback, MemoryCallback, StatsAggregator
+from benchmarks.common import dump_files, measure, report
+
+class ElementJSONCallback(JSONCallback):
+    wants_batches = False
+
+class ElementMemoryCallback(MemoryCallback):
+    wants_batches = False
+
+def parse_with(factory):
+    def parse(path):
+        RdbParser(factory()).parse(path)
+    return parse
+
+def main():
+    files = dump_files(sys.argv[1:])
+    for name, elements, batches in (
+            ('json', lambda: ElementJSONCallback(StringIO()), lambda: JSONCallback(StringIO())),
+            ('memory', lambda: ElementMemoryCallback(StatsAggregator(), 64), lambda: MemoryCallback(StatsAggregator(), 64))):
+        baseline = report(name + ', per element', *measure(parse_with(elements), files))
+        report(name + ', batches', *measure(parse_with(batches), files), baseline = baseline)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Measures the cost of verifying the CRC64 at the end of dump files.
+
+    python -m benchmarks.bench_checksum [dump.rdb ...]
+
+The dump files must be of RDB version 5 or later. When none is given, a dump of
+`KEYS` strings of 100 bytes is generated. Install crcmod to compare its CRC64 with
+the pure python one.
+"""
+import os
+import sys
+import shutil
+import tempfile
+
+from rdbtools import RdbParser
+from rdbtools.parser import StreamReader, verify_dump
+from rdbtools.crc64 import crc64, crc64_python, HAS_CRCMOD
+from tests.create_modern_rdbs import dump, select_db, string
+from benchmarks.common import NullCallback, measure, report
+
+KEYS = 50000
+
+def parse_with(verify_checksum, use_mmap = True):
+    def parse(path):
+        RdbParser(NullCallback(), verify_checksum = verify_checksum).parse(path, use_mmap)
+    return parse
+
+def parse_stream_and_verify(path):
+    # Read as standard input would be, folding the bytes as they leave the buffer
+    with open(path, 'rb') as f:
+        RdbParser(NullCallback(), verify_checksum = True).read_rdb(StreamReader(f, checksum = True))
+
+def crc_with(func):
+    def crc(path):
+        with open(path, 'rb') as f:
+            func(f.read())
+    return crc
+
+def write_dump(path):
+    body = [select_db(0)]
+    for n in range(0, KEYS):
+        body.append('\x00' + string('key:%d' % n) + string('%0100d' % n))
+    with open(path, 'wb') as f:
+        f.write(dump(9, ''.join(body)))
+
+def main():
+    tmpdir = None
+    files = sys.argv[1:]
+    if not files:
+        tmpdir = tempfile.mkdtemp(prefix = 'rdbbench')
+        files = [os.path.join(tmpdir, 'strings.rdb')]
+        write_dump(files[0])
+    try:
+        baseline = report('parse', *measure(parse_with(False), files))
+        report('parse and verify', *measure(parse_with(True), files), baseline = baseline)
+        report('parse file and verify', *measure(parse_with(True, False), files), baseline = baseline)
+        report('parse stream and verify', *measure(parse_stream_and_verify, files), baseline = baseline)
+        report('verify_dump', *measure(verify_dump, files), baseline = baseline)
+        report('crc64 python', *measure(crc_with(crc64_python), files), baseline = baseline)
+        if HAS_CRCMOD:
+            report('crc64 crcmod', *measure(crc_with(crc64), files), baseline = baseline)
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main()
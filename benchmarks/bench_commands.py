@@ -0,0 +1,144 @@
+"""Runs every command of the command line tools on a synthetic dump, and records their throughput and memory.
+
+    python -m benchmarks.bench_commands [--size 200M] [--seed S] [--mix MIX] [--repeat N]
+                                        [--output results.json] [--baseline results.json] [dump.rdb]
+
+Without a dump file, one is generated with benchmarks.synthetic. Every command runs in its own process,
+so that its peak RSS is measured; the best of `--repeat` runs is kept. The results are written as json
+with --output. With --baseline, they are compared to the results of an earlier run, and the exit status
+is 1 if a command got slower by more than --tolerance.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+from optparse import OptionParser
+
+from rdbtools import RdbParser
+from rdbtools.parser import dump_reader
+from benchmarks.synthetic import SyntheticDump, DEFAULT_MIX, parse_size
+
+COMMANDS = (
+    ('json', ['rdbtools.cli.rdb', '--command', 'json']),
+    ('json-profile', ['rdbtools.cli.rdb', '--command', 'json', '--profile']),
+    ('diff', ['rdbtools.cli.rdb', '--command', 'diff']),
+    ('protocol', ['rdbtools.cli.rdb', '--command', 'protocol']),
+    ('memory', ['rdbtools.cli.rdb', '--command', 'memory']),
+    ('keys', ['rdbtools.cli.rdb', '--command', 'keys']),
+    ('summary', ['rdbtools.cli.rdb', '--command', 'summary']),
+    ('verify', ['rdbtools.cli.rdb', '--command', 'verify']),
+    ('profiler', ['rdbtools.cli.redis_profiler']),
+)
+
+def count_keys(path):
+    with dump_reader(path) as f:
+        return sum(db.keys for db in RdbParser(None).summarize(f).databases)
+
+def run(args, path):
+    """Runs the module `args` on the dump, and returns (seconds, peak RSS in KB)"""
+    with open(os.devnull, 'wb') as devnull:
+        start = time.time()
+        process = subprocess.Popen([sys.executable, '-m'] + args + [path], stdout = devnull)
+        pid, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.time() - start
+    if status:
+        raise Exception('run', '%s failed with status %d' % (' '.join(args), os.WEXITSTATUS(status)))
+    # ru_maxrss is in KB on linux, and in bytes on OS X
+    rss = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+    return elapsed, rss
+
+def measure(commands, path, repeat):
+    size = os.path.getsize(path)
+    keys = count_keys(path)
+    results = {}
+    for name, args in commands:
+        runs = [run(args, path) for x in xrange(repeat)]
+        seconds = min(elapsed for elapsed, rss in runs)
+        results[name] = {
+            'seconds' : seconds,
+            'mb_per_s' : size / seconds / (1024.0 * 1024.0),
+            'keys_per_s' : keys / seconds,
+            'peak_rss_kb' : max(rss for elapsed, rss in runs),
+        }
+        print('%-14s %10.2f MB/s %12.0f keys/s %10d KB peak RSS' % (name, results[name]['mb_per_s'],
+                                                                   results[name]['keys_per_s'], results[name]['peak_rss_kb']))
+    return {'bytes' : size, 'keys' : keys}, results
+
+def compare(results, baseline, tolerance):
+    """Prints the ratios to the baseline, and returns the commands that got slower than the tolerance"""
+    regressions = []
+    print('\n%-14s %14s %14s' % ('vs baseline', 'throughput', 'peak RSS'))
+    for name, result in sorted(results.iteritems()):
+        if name not in baseline:
+            continue
+        speed = result['mb_per_s'] / baseline[name]['mb_per_s']
+        memory = float(result['peak_rss_kb']) / baseline[name]['peak_rss_kb']
+        flag = ''
+        if speed < 1 - tolerance:
+            flag = '   REGRESSION'
+            regressions.append(name)
+        print('%-14s %13.2fx %13.2fx%s' % (name, speed, memory, flag))
+    return regressions
+
+def main():
+    parser = OptionParser(usage = "usage: %prog [options] [dump.rdb]")
+    parser.add_option("--size", dest="size", default="200M",
+                      help="Size of the generated dump. Defaults to 200M")
+    parser.add_option("--seed", dest="seed", default=0, type="int",
+                      help="Seed of the generated dump. Defaults to 0")
+    parser.add_option("--mix", dest="mix", default=DEFAULT_MIX,
+                      help="Kinds of keys of the generated dump, see benchmarks.synthetic")
+    parser.add_option("--commands", dest="commands", default=None,
+                      help="Comma separated commands to run. Defaults to %s" % ','.join(name for name, args in COMMANDS))
+    parser.add_option("--repeat", dest="repeat", default=1, type="int",
+                      help="Number of runs of every command. The fastest is kept")
+    parser.add_option("--output", dest="output", default=None,
+                      help="File to write the results to, as json", metavar="FILE")
+    parser.add_option("--baseline", dest="baseline", default=None,
+                      help="Results of an earlier run to compare with", metavar="FILE")
+    parser.add_option("--tolerance", dest="tolerance", default=0.1, type="float",
+                      help="Slowdown against the baseline reported as a regression. Defaults to 0.1")
+    (options, args) = parser.parse_args()
+
+    commands = COMMANDS
+    if options.commands:
+        names = options.commands.split(',')
+        commands = [(name, command) for name, command in COMMANDS if name in names]
+
+    tmpdir = None
+    dump = {}
+    if args:
+        path = args[0]
+    else:
+        tmpdir = tempfile.mkdtemp(prefix = 'rdbbench')
+        path = os.path.join(tmpdir, 'synthetic.rdb')
+        with open(path, 'wb') as out:
+            SyntheticDump(options.seed, options.mix).write(out, size = parse_size(options.size))
+        dump = {'seed' : options.seed, 'mix' : options.mix}
+    try:
+        stats, results = measure(commands, path, options.repeat)
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+    dump.update(stats)
+    dump['path'] = args[0] if args else None
+
+    if options.output:
+        with open(options.output, 'w') as out:
+            json.dump({'dump' : dump, 'python' : platform.python_version(), 'platform' : platform.platform(),
+                       'time' : time.time(), 'results' : results}, out, indent = 2, sort_keys = True)
+            out.write('\n')
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        if baseline['dump'].get('bytes') != dump['bytes']:
+            print('\nThe baseline was measured on another dump')
+        if compare(results, baseline['results'], options.tolerance):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Compares the bulk decoders of intsets and ziplists against decoding them entry by entry.
+
+    python -m benchmarks.bench_compact [entries]
+
+Every value holds `entries` entries (128 by default). Ziplists mix strings and integers of every encoding.
+"""
+import sys
+import random
+import timeit
+
+from rdbtools import RdbParser
+from tests.create_modern_rdbs import ziplist, intset
+from tests.parser_tests import EntryDecodingParser
+
+def ziplist_entries(rng, count):
+    entries = []
+    for x in xrange(0, count):
+        bits = rng.choice((4, 8, 16, 24, 32, 64, None))
+        if bits is None:
+            entries.append('member:%d' % rng.randint(0, 1 << 20))
+        elif bits == 4:
+            entries.append(rng.randint(0, 12))
+        else:
+            entries.append(rng.randint(-(1 << (bits - 1)), (1 << (bits - 1)) - 1))
+    return entries
+
+def values(count):
+    rng = random.Random(0)
+    return (
+        ('intset 16 bits', 'read_intset_entries', intset([rng.randint(-(1 << 15), (1 << 15) - 1) for x in xrange(count)])),
+        ('intset 32 bits', 'read_intset_entries', intset([rng.randint(-(1 << 31), (1 << 31) - 1) for x in xrange(count)])),
+        ('intset 64 bits', 'read_intset_entries', intset([rng.randint(-(1 << 63), (1 << 63) - 1) for x in xrange(count)])),
+        ('ziplist', 'read_ziplist_entries', ziplist(ziplist_entries(rng, count))),
+        ('ziplist of strings', 'read_ziplist_entries', ziplist(['member:%d' % x for x in xrange(count)])),
+    )
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 128
+    bulk, reference = RdbParser(None), EntryDecodingParser(None)
+    for name, method, value in values(count):
+        decode_bulk, decode_entries = getattr(bulk, method), getattr(reference, method)
+        if decode_bulk(value) != decode_entries(value):
+            raise Exception('bench_compact', '%s decoded differently' % name)
+        number = max(1, 200000 // count)
+        per_entry = min(timeit.repeat(lambda: decode_entries(value), number = number, repeat = 3))
+        at_once = min(timeit.repeat(lambda: decode_bulk(value), number = number, repeat = 3))
+        print('%-20s %12.0f entries/s entry by entry %12.0f entries/s bulk   x%.2f' % (
+            name, number * count / per_entry, number * count / at_once, per_entry / at_once))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Compares parsing with every element event, with the lengths of elements only, and with none.
+
+    python -m benchmarks.bench_elements [keys]
+
+Every encoding of benchmarks.bench_encodings is measured with a callback that ignores every event,
+and with the memory profiler, which only needs the largest element of compactly encoded collections.
+"""
+import os
+import sys
+import shutil
+import tempfile
+
+from rdbtools import RdbParser, MemoryCallback, StatsAggregator
+from rdbtools.parser import ELEMENTS_VALUES, ELEMENTS_LENGTHS, ELEMENTS_NONE
+from benchmarks.common import NullCallback, measure, report
+from benchmarks.bench_encodings import ENCODINGS, write_dump
+
+class ElementsMemoryCallback(MemoryCallback):
+    wants_elements = ELEMENTS_VALUES
+
+def parse_with(factory):
+    def parse(path):
+        RdbParser(factory()).parse(path)
+    return parse
+
+def null_callback(wants_elements):
+    def factory():
+        callback = NullCallback()
+        callback.wants_elements = wants_elements
+        return callback
+    return factory
+
+def main():
+    keys = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    tmpdir = tempfile.mkdtemp(prefix = 'rdbbench')
+    try:
+        for name, data_type, value in ENCODINGS:
+            path = os.path.join(tmpdir, '%d.rdb' % data_type)
+            write_dump(path, data_type, value, keys)
+            print(name)
+            baseline = report('  values', *measure(parse_with(null_callback(ELEMENTS_VALUES)), [path]))
+            report('  lengths', *measure(parse_with(null_callback(ELEMENTS_LENGTHS)), [path]), baseline = baseline)
+            report('  none', *measure(parse_with(null_callback(ELEMENTS_NONE)), [path]), baseline = baseline)
+            baseline = report('  memory, values', *measure(parse_with(lambda: ElementsMemoryCallback(StatsAggregator(), 64)), [path]))
+            report('  memory, lengths', *measure(parse_with(lambda: MemoryCallback(StatsAggregator(), 64)), [path]), baseline = baseline)
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main()
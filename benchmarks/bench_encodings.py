@@ -0,0 +1,91 @@
+"""Measures the decoders of the encodings of RDB versions 7 to 11, next to the ziplist and skiplist ones.
+
+    python -m benchmarks.bench_encodings [keys]
+
+Every dump holds `keys` collections (2000 by default) of 100 elements, half strings and half integers.
+The elements of a stream are its entries, of a single field.
+"""
+import os
+import sys
+import shutil
+import struct
+import tempfile
+
+from rdbtools import RdbParser
+from tests.create_modern_rdbs import dump, select_db, length, string, ziplist, listpack, flatten, stream_value
+from benchmarks.common import NullCallback, measure, report
+
+def elements(key_number):
+    return ['element:%d:%d' % (key_number, x) if x % 2 else key_number * 100 + x for x in range(0, 100)]
+
+def pairs(key_number):
+    return [('field:%d' % x, value) for x, value in enumerate(elements(key_number))]
+
+def scores(key_number):
+    return [('member:%d' % x, x * 1.5) for x in range(0, 100)]
+
+def packed_scores(key_number):
+    # Compact encodings store integral scores as integers, and the others as strings
+    return [(member, int(score) if score == int(score) else repr(score)) for member, score in scores(key_number)]
+
+def quicklist_value(key_number):
+    values = elements(key_number)
+    return length(2) + string(ziplist(values[:50])) + string(ziplist(values[50:]))
+
+def quicklist_2_value(key_number):
+    values = elements(key_number)
+    return length(2) + length(2) + string(listpack(values[:50])) + length(2) + string(listpack(values[50:]))
+
+def zset_2_value(key_number):
+    members = scores(key_number)
+    return length(len(members)) + ''.join(string(member) + struct.pack('<d', score) for member, score in members)
+
+def zset_value(key_number):
+    members = scores(key_number)
+    return length(len(members)) + ''.join(string(member) + string(repr(score)) for member, score in members)
+
+def stream_entries_value(key_number):
+    entries = [((1700000000000 + x, 0), [('value', value)]) for x, value in enumerate(elements(key_number))]
+    return stream_value(21, [(entries, [])], [])
+
+ENCODINGS = (
+    # name, type, value encoder
+    ('list as ziplist', 10, lambda n: string(ziplist(elements(n)))),
+    ('list as quicklist', 14, quicklist_value),
+    ('list as quicklist 2', 18, quicklist_2_value),
+    ('hash as ziplist', 13, lambda n: string(ziplist(flatten(pairs(n))))),
+    ('hash as listpack', 16, lambda n: string(listpack(flatten(pairs(n))))),
+    ('set as listpack', 20, lambda n: string(listpack(elements(n)))),
+    ('sorted set as ziplist', 12, lambda n: string(ziplist(flatten(packed_scores(n))))),
+    ('sorted set as listpack', 17, lambda n: string(listpack(flatten(packed_scores(n))))),
+    ('sorted set', 3, zset_value),
+    ('sorted set 2', 5, zset_2_value),
+    ('stream', 21, stream_entries_value),
+)
+
+def parse(path):
+    RdbParser(NullCallback()).parse(path)
+
+def write_dump(path, data_type, value, keys):
+    body = [select_db(0)]
+    for n in range(0, keys):
+        body.append(chr(data_type) + string('key:%d' % n) + value(n))
+    with open(path, 'wb') as f:
+        f.write(dump(11, ''.join(body)))
+
+def main():
+    keys = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    tmpdir = tempfile.mkdtemp(prefix = 'rdbbench')
+    try:
+        for name, data_type, value in ENCODINGS:
+            path = os.path.join(tmpdir, '%d.rdb' % data_type)
+            write_dump(path, data_type, value, keys)
+            total, elapsed = measure(parse, [path])
+            report(name, total, elapsed)
+            passes = total / os.path.getsize(path)
+            print('%-28s %10.0f elements/s' % ('', passes * keys * 100 / elapsed))
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main()
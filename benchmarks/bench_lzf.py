@@ -0,0 +1,71 @@
+"""Micro benchmark for LZF decompression.
+
+Collects every LZF compressed string in the dumps, then times the byte at a 
+time decompressor this parser used to have, the block copying pure python 
+decompressor, and the lzf extension module if it is installed.
+
+    python -m benchmarks.bench_lzf [dump.rdb ...]
+"""
+import sys
+import time
+
+from rdbtools import RdbParser
+from rdbtools import parser as rdbparser
+from benchmarks.common import NullCallback, dump_files, report
+
+class CollectingParser(RdbParser):
+    def __init__(self, blobs):
+        RdbParser.__init__(self, NullCallback())
+        self.blobs = blobs
+
+    def lzf_decompress(self, compressed, expected_length):
+        self.blobs.append((compressed, expected_length))
+        return RdbParser.lzf_decompress(self, compressed, expected_length)
+
+def bytewise_lzf_decompress(compressed, expected_length):
+    in_stream = bytearray(compressed)
+    out_stream = bytearray()
+    in_index = 0
+    while in_index < len(in_stream):
+        ctrl = in_stream[in_index]
+        in_index += 1
+        if ctrl < 32:
+            for x in xrange(ctrl + 1):
+                out_stream.append(in_stream[in_index])
+                in_index += 1
+        else:
+            length = ctrl >> 5
+            if length == 7:
+                length += in_stream[in_index]
+                in_index += 1
+            ref = len(out_stream) - ((ctrl & 0x1f) << 8) - in_stream[in_index] - 1
+            in_index += 1
+            for x in xrange(length + 2):
+                out_stream.append(out_stream[ref])
+                ref += 1
+    return str(out_stream)
+
+def time_decompressor(decompress, blobs, min_time = 1.0):
+    total = 0
+    start = time.time()
+    while True:
+        for compressed, expected_length in blobs:
+            decompress(compressed, expected_length)
+            total += expected_length
+        elapsed = time.time() - start
+        if elapsed >= min_time:
+            return total, elapsed
+
+def main():
+    blobs = []
+    parser = CollectingParser(blobs)
+    for path in dump_files(sys.argv[1:]):
+        parser.parse(path)
+    print('%d compressed strings, %d bytes decompressed' % (len(blobs), sum(length for _, length in blobs)))
+    baseline = report('byte at a time', *time_decompressor(bytewise_lzf_decompress, blobs))
+    report('block copies', *time_decompressor(rdbparser.lzf_decompress, blobs), baseline = baseline)
+    if rdbparser.HAS_PYTHON_LZF:
+        report('lzf extension', *time_decompressor(rdbparser.lzf.decompress, blobs), baseline = baseline)
+
+if __name__ == '__main__':
+    main()
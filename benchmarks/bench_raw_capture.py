@@ -0,0 +1,49 @@
+"""Measures the cost of capturing raw bytes ('orig_*' in `info`) for every object.
+
+Parses the dumps once with a callback that sets `wants_raw_bytes` and once with 
+a callback that does not, and reports the throughput and the number of `info` 
+dictionaries and raw byte strings the parser allocated for each.
+
+    python -m benchmarks.bench_raw_capture [dump.rdb ...]
+"""
+import sys
+
+from rdbtools import RdbParser
+from benchmarks.common import NullCallback, dump_files, measure, report
+
+class CountingCallback(NullCallback):
+    def __init__(self):
+        self.dicts = 0
+        self.raw_strings = 0
+        self.raw_bytes = 0
+
+    def _count(self, *args):
+        for arg in args:
+            if isinstance(arg, dict):
+                self.dicts += 1
+                for name, value in arg.iteritems():
+                    if name.startswith('orig_') and value is not None:
+                        self.raw_strings += 1
+                        self.raw_bytes += len(value)
+    start_rdb = start_database = end_database = end_rdb = set = _count
+    start_hash = hset = end_hash = start_set = sadd = end_set = _count
+    start_list = rpush = end_list = start_sorted_set = zadd = end_sorted_set = _count
+
+class RawCountingCallback(CountingCallback):
+    wants_raw_bytes = True
+
+class RawNullCallback(NullCallback):
+    wants_raw_bytes = True
+
+def main():
+    files = dump_files(sys.argv[1:])
+    for name, callback in (('without raw bytes', CountingCallback()), ('with raw bytes', RawCountingCallback())):
+        parser = RdbParser(callback)
+        for path in files:
+            parser.parse(path)
+        print('%-28s %8d info dicts %8d raw strings %10d raw bytes' % (name, callback.dicts, callback.raw_strings, callback.raw_bytes))
+    raw_mbps = report('with raw bytes', *measure(RdbParser(RawNullCallback()).parse, files))
+    report('without raw bytes', *measure(RdbParser(NullCallback()).parse, files), baseline = raw_mbps)
+
+if __name__ == '__main__':
+    main()
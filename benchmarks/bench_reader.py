@@ -0,0 +1,17 @@
+"""Compares the file object reader with the memory mapped reader.
+
+    python -m benchmarks.bench_reader [dump.rdb ...]
+"""
+import sys
+
+from rdbtools import RdbParser
+from benchmarks.common import NullCallback, dump_files, measure, report
+
+def main():
+    files = dump_files(sys.argv[1:])
+    parser = RdbParser(NullCallback())
+    file_mbps = report('file object reader', *measure(lambda path : parser.parse(path, use_mmap = False), files))
+    report('mmap reader', *measure(lambda path : parser.parse(path, use_mmap = True), files), baseline = file_mbps)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Compares the per key cost of `RdbParser.iter_records` with the callback path.
+
+Every pass parses all the dumps and reads every element, except for the last 
+one which only reads the keys, and leaves the elements of collections to be skipped.
+
+    python -m benchmarks.bench_records [dump.rdb ...]
+"""
+import os
+import sys
+
+from rdbtools import RdbParser
+from benchmarks.common import NullCallback, dump_files, measure, report
+
+def count_keys(files):
+    return sum(1 for path in files for record in RdbParser(None).iter_records(path))
+
+def callbacks(path):
+    RdbParser(NullCallback()).parse(path)
+
+def records(path):
+    for record in RdbParser(None).iter_records(path):
+        pass
+
+def lazy_records(path):
+    for record in RdbParser(None).iter_records(path, lazy = True):
+        if record.data_type != 'string':
+            for element in record.value:
+                pass
+
+def lazy_keys_only(path):
+    for record in RdbParser(None).iter_records(path, lazy = True):
+        pass
+
+def main():
+    files = dump_files(sys.argv[1:])
+    keys_per_pass = count_keys(files)
+    baseline = None
+    for name, func in (('callbacks', callbacks), ('iter_records', records), 
+                       ('iter_records lazy', lazy_records), ('iter_records lazy, unread', lazy_keys_only)):
+        total, elapsed = measure(func, files)
+        passes = total // sum(os.path.getsize(path) for path in files)
+        mbps = report(name, total, elapsed, baseline)
+        print('%-28s %10.2f us/key' % ('', elapsed * 1000000.0 / (passes * keys_per_pass)))
+        baseline = baseline or mbps
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""Measures how fast keys excluded by filters are skipped, compared to decoding them.
+
+    python -m benchmarks.bench_skip [dump.rdb ...]
+"""
+import sys
+
+from rdbtools import RdbParser
+from rdbtools.parser import open_reader
+from benchmarks.common import NullCallback, dump_files, measure, report
+
+def parse_with(filters):
+    def parse(path):
+        RdbParser(NullCallback(), filters).parse(path)
+    return parse
+
+def scan(path):
+    with open(path, 'rb') as fp:
+        f = open_reader(fp)
+        try:
+            for entry in RdbParser(None).scan_keys(f):
+                pass
+        finally:
+            f.close()
+
+def main():
+    files = dump_files(sys.argv[1:])
+    baseline = report('decode everything', *measure(parse_with(None), files))
+    report('skip by database', *measure(parse_with({'dbs' : [99]}), files), baseline = baseline)
+    report('skip by type', *measure(parse_with({'types' : ['string']}), files), baseline = baseline)
+    report('skip by key', *measure(parse_with({'keys' : 'no such key'}), files), baseline = baseline)
+    report('scan keys', *measure(scan, files), baseline = baseline)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Compares parsing gzip compressed dumps as a stream, with decompressing them to disk before parsing.
+
+    python -m benchmarks.bench_stream [dump.rdb ...]
+
+Throughputs are in bytes of uncompressed dump per second.
+"""
+import io
+import os
+import sys
+import gzip
+import shutil
+import tempfile
+
+from rdbtools import RdbParser
+from benchmarks.common import NullCallback, dump_files, measure, report
+
+def parse(path):
+    RdbParser(NullCallback()).parse(path)
+
+def parse_unseekable(path):
+    # An io file object is not a `file`, so it is read as a stream, as a pipe would be
+    with io.open(path, 'rb') as f:
+        RdbParser(NullCallback()).parse(f)
+
+def main():
+    files = dump_files(sys.argv[1:])
+    tmpdir = tempfile.mkdtemp(prefix = 'rdbbench')
+    try:
+        compressed = {}
+        for path in files:
+            compressed[path] = os.path.join(tmpdir, os.path.basename(path) + '.gz')
+            with open(path, 'rb') as f:
+                with gzip.open(compressed[path], 'wb') as out:
+                    shutil.copyfileobj(f, out)
+
+        def decompress_then_parse(path):
+            decompressed = os.path.join(tmpdir, 'decompressed.rdb')
+            with gzip.open(compressed[path], 'rb') as f:
+                with open(decompressed, 'wb') as out:
+                    shutil.copyfileobj(f, out, 1 << 20)
+            parse(decompressed)
+            os.remove(decompressed)
+
+        def parse_compressed(path):
+            parse(compressed[path])
+
+        baseline = report('uncompressed, mmap', *measure(parse, files))
+        report('uncompressed, stream', *measure(parse_unseekable, files), baseline = baseline)
+        report('gzip, decompress to disk', *measure(decompress_then_parse, files), baseline = baseline)
+        report('gzip, stream', *measure(parse_compressed, files), baseline = baseline)
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main()
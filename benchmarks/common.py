@@ -0,0 +1,48 @@
+"""Helpers shared by the benchmark scripts.
+
+The scripts are meant to be run from the root of the source tree, e.g.
+    python -m benchmarks.bench_reader [dump.rdb ...]
+When no dump file is given, the fixtures in tests/dumps are used.
+"""
+import os
+import glob
+import time
+
+from rdbtools import RdbCallback
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'dumps')
+
+def dump_files(args):
+    if args:
+        return args
+    return sorted(glob.glob(os.path.join(FIXTURES, '*.rdb')))
+
+class NullCallback(RdbCallback):
+    '''Accepts every event and does nothing, so that only the parser is measured'''
+    def _ignore(self, *args):
+        pass
+    start_rdb = start_database = end_database = end_rdb = set = _ignore
+    start_hash = hset = end_hash = start_set = sadd = end_set = _ignore
+    start_list = rpush = end_list = start_sorted_set = zadd = end_sorted_set = _ignore
+
+def measure(func, files, min_time = 1.0):
+    '''Calls `func(path)` for every file repeatedly for at least `min_time` seconds.
+    Returns (bytes processed, seconds elapsed)'''
+    size = sum(os.path.getsize(path) for path in files)
+    total = 0
+    start = time.time()
+    while True:
+        for path in files:
+            func(path)
+        total += size
+        elapsed = time.time() - start
+        if elapsed >= min_time:
+            return total, elapsed
+
+def report(name, total, elapsed, baseline = None):
+    mbps = total / elapsed / (1024.0 * 1024.0)
+    line = '%-28s %10.2f MB/s' % (name, mbps)
+    if baseline:
+        line += '   x%.2f' % (mbps / baseline)
+    print(line)
+    return mbps
@@ -0,0 +1,216 @@
+"""Generates dump files of any size offline, deterministically from a seed.
+
+    python -m benchmarks.synthetic [--size 2G | --keys N] [--seed S] [--mix MIX] [--databases N]
+                                   [--expires RATIO] [--checksum] out.rdb
+
+Keys are drawn from a mix of kinds, each a type with one of its encodings. A mix is a comma separated
+list of kind:weight, e.g. "string:50,hash_ziplist:30,set_intset:20". See KINDS for the kinds.
+
+Encoding values in pure python is slow, so the values of a kind are drawn from a pool of `pool_size`
+values encoded up front. Keys are all distinct. The checksum is disabled (0) unless --checksum is
+given, which computes it with rdbtools.crc64 (install crcmod to keep up with the generator).
+"""
+import re
+import sys
+import struct
+import random
+from optparse import OptionParser
+
+from rdbtools.crc64 import crc64
+from tests.create_modern_rdbs import select_db, length, string, flatten, ziplist, intset
+
+class Values(object):
+    """Draws the elements of values from a random generator"""
+    def __init__(self, rng):
+        self.rng = rng
+        self.words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for x in xrange(rng.randint(3, 10)))
+                      for n in xrange(0, 1000)]
+
+    def text(self, min_size, max_size):
+        """Random characters, which do not compress"""
+        rng = self.rng
+        return ''.join(chr(rng.randint(32, 126)) for x in xrange(rng.randint(min_size, max_size)))
+
+    def sentence(self, min_size, max_size):
+        """Words from a small vocabulary, which compress well"""
+        rng, words = self.rng, self.words
+        size = rng.randint(min_size, max_size)
+        parts = []
+        total = 0
+        while total < size:
+            word = rng.choice(words)
+            parts.append(word)
+            total += len(word) + 1
+        return ' '.join(parts)[:size]
+
+    def member(self):
+        return '%s:%d' % (self.rng.choice(self.words), self.rng.randint(0, 1 << 20))
+
+    def number(self, bits):
+        return self.rng.randint(-(1 << (bits - 1)), (1 << (bits - 1)) - 1)
+
+    def element(self):
+        """A string or an integer, as the elements of compact encodings are"""
+        if self.rng.random() < 0.5:
+            return self.number(self.rng.choice((8, 16, 24, 32, 64)))
+        return self.member()
+
+    def count(self, low, high):
+        return self.rng.randint(low, high)
+
+def score(value):
+    """A score of a sorted set of type 3, as a string of at most 255 characters"""
+    value = repr(value)
+    return chr(len(value)) + value
+
+def sequence(encoded):
+    return length(len(encoded)) + ''.join(encoded)
+
+# name : (type, encoder of a value)
+KINDS = {
+    'string' : (0, lambda v: string(v.text(10, 200))),
+    'string_int' : (0, lambda v: string(v.number(32))),
+    'string_lzf' : (0, lambda v: string(v.sentence(100, 2000), compress = True)),
+    'list_linkedlist' : (1, lambda v: sequence([string(v.member()) for x in xrange(v.count(200, 1000))])),
+    'list_ziplist' : (10, lambda v: string(ziplist([v.element() for x in xrange(v.count(10, 128))]))),
+    'list_quicklist' : (14, lambda v: sequence([string(ziplist([v.element() for x in xrange(128)]), compress = True)
+                                                for node in xrange(v.count(1, 8))])),
+    'set_hashtable' : (2, lambda v: sequence([string(v.member()) for x in xrange(v.count(200, 1000))])),
+    'set_intset' : (11, lambda v: string(intset([v.number(v.rng.choice((16, 32, 64))) for x in xrange(v.count(10, 512))]))),
+    'zset_skiplist' : (3, lambda v: sequence([string(v.member()) + score(v.rng.random() * 1000)
+                                              for x in xrange(v.count(200, 1000))])),
+    'zset_ziplist' : (12, lambda v: string(ziplist(flatten((v.member(), v.number(16)) for x in xrange(v.count(5, 64)))))),
+    'hash_hashtable' : (4, lambda v: sequence([string(v.member()) + string(v.sentence(5, 100))
+                                               for x in xrange(v.count(200, 1000))])),
+    'hash_ziplist' : (13, lambda v: string(ziplist(flatten((v.member(), v.element()) for x in xrange(v.count(5, 64)))))),
+}
+
+DEFAULT_MIX = 'string:30,string_int:5,string_lzf:5,list_linkedlist:2,list_ziplist:10,list_quicklist:3,set_hashtable:2,' \
+              'set_intset:8,zset_skiplist:2,zset_ziplist:8,hash_hashtable:3,hash_ziplist:22'
+
+def parse_mix(mix):
+    """Parses a mix such as "string:50,hash_ziplist:50" into (kind, weight) tuples"""
+    kinds = []
+    for part in mix.split(','):
+        kind, weight = part.split(':')
+        if kind not in KINDS:
+            raise Exception('parse_mix', 'Unknown kind %s. Expected one of %s' % (kind, ', '.join(sorted(KINDS))))
+        kinds.append((kind, float(weight)))
+    return kinds
+
+def parse_size(size):
+    """Parses a size such as 500M or 2G into bytes"""
+    match = re.match(r'^(\d+(?:\.\d+)?)([KMG]?)B?$', size.upper())
+    if not match:
+        raise Exception('parse_size', 'Invalid size %s' % size)
+    return int(float(match.group(1)) * {'' : 1, 'K' : 1 << 10, 'M' : 1 << 20, 'G' : 1 << 30}[match.group(2)])
+
+class SyntheticDump(object):
+    """
+    A dump of keys of the kinds in `mix`, spread evenly over `databases` databases.
+    The same seed and options always produce the same dump.
+
+    Typical usage :
+        with open('bench.rdb', 'wb') as out:
+            keys = SyntheticDump(seed = 1).write(out, size = 1 << 30)
+    """
+    def __init__(self, seed = 0, mix = DEFAULT_MIX, databases = 1, expires = 0.1, version = 7, pool_size = 64):
+        self.seed = seed
+        self.mix = parse_mix(mix)
+        self.databases = databases
+        self.expires = expires
+        self.version = version
+        self.pool_size = pool_size
+
+    def write(self, out, size = None, keys = None, checksum = False, buffer_size = 1 << 20):
+        """
+        Writes the dump to the file object `out` until it holds `keys` keys, or `size` bytes.
+        Returns the number of keys written.
+        """
+        if size is None and keys is None:
+            raise Exception('write', 'Give the size of the dump or its number of keys')
+        rng = random.Random(self.seed)
+        values = Values(rng)
+        pools = dict((kind, [KINDS[kind][1](values) for x in xrange(self.pool_size)]) for kind, weight in self.mix)
+        kinds = [kind for kind, weight in self.mix]
+        cumulative = []
+        total = 0.0
+        for kind, weight in self.mix:
+            total += weight
+            cumulative.append(total)
+        # A run of keys per database. With a size only, the keys of the first database are the whole dump
+        per_db = None
+        if keys is not None:
+            per_db = max(keys // self.databases, 1)
+
+        crc = 0
+        written = 0
+        buf = ['REDIS%04d' % self.version]
+        buffered = 9
+        n = 0
+        db_number = -1
+        while (keys is None or n < keys) and (size is None or written + buffered < size):
+            if db_number < 0 or (per_db is not None and n % per_db == 0 and db_number < self.databases - 1):
+                db_number += 1
+                buf.append(select_db(db_number))
+            point = rng.random() * total
+            index = 0
+            while cumulative[index] < point:
+                index += 1
+            kind = kinds[index]
+            data_type = KINDS[kind][0]
+            entry = []
+            if rng.random() < self.expires:
+                entry.append(chr(252) + struct.pack('<Q', 1900000000000 + n))
+            entry.append(chr(data_type) + string('%s:%s:%d' % (kind.split('_')[0], kind, n)))
+            entry.append(pools[kind][rng.randint(0, self.pool_size - 1)])
+            entry = ''.join(entry)
+            buf.append(entry)
+            buffered += len(entry)
+            n += 1
+            if buffered >= buffer_size:
+                data = ''.join(buf)
+                if checksum:
+                    crc = crc64(data, crc)
+                out.write(data)
+                written += len(data)
+                buf, buffered = [], 0
+        buf.append(chr(255))
+        data = ''.join(buf)
+        if checksum:
+            crc = crc64(data, crc)
+        out.write(data + struct.pack('<Q', crc))
+        return n
+
+def main():
+    usage = """usage: %prog [options] out.rdb
+
+Example : %prog --size 2G --seed 1 --mix string:50,hash_ziplist:50 /tmp/bench.rdb"""
+    parser = OptionParser(usage = usage)
+    parser.add_option("--size", dest="size", default=None,
+                      help="Size of the dump, such as 500M or 2G")
+    parser.add_option("--keys", dest="keys", default=None, type="int",
+                      help="Number of keys of the dump")
+    parser.add_option("--seed", dest="seed", default=0, type="int",
+                      help="Seed of the random generator. Defaults to 0")
+    parser.add_option("--mix", dest="mix", default=DEFAULT_MIX,
+                      help="Kinds of keys and their weights. Kinds are %s" % ', '.join(sorted(KINDS)))
+    parser.add_option("--databases", dest="databases", default=1, type="int",
+                      help="Number of databases the keys are spread over, when --keys is given. Defaults to 1")
+    parser.add_option("--expires", dest="expires", default=0.1, type="float",
+                      help="Ratio of the keys that have an expiry. Defaults to 0.1")
+    parser.add_option("--checksum", dest="checksum", action="store_true", default=False,
+                      help="Compute the checksum of the dump")
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.error("Output file not specified")
+    if options.size is None and options.keys is None:
+        parser.error("Give --size or --keys")
+    size = parse_size(options.size) if options.size else None
+    dump = SyntheticDump(options.seed, options.mix, options.databases, options.expires)
+    with open(args[0], 'wb') as out:
+        keys = dump.write(out, size, options.keys, options.checksum)
+    sys.stderr.write('Wrote %d keys to %s\n' % (keys, args[0]))
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,8 @@ import parser
 import time
 
 class WriteRdbCallback(parser.RdbCallback) :
+    wants_raw_bytes = True
+
     def __init__(self, f_name='./new_dump.rdb'):
         self.f_name = f_name
 
@@ -0,0 +1,72 @@
+"""
+Models of the memory allocators Redis is built with. An allocator rounds the size of every allocation
+up to one of its size classes : the size classes of allocations up to `table_size` bytes are precomputed
+in a lookup table, and larger ones are computed.
+"""
+
+class Allocator(object):
+    """
+    The base of allocators, which define `size_class(size)`, the size class of an allocation of `size` bytes.
+    Allocations of up to `table_size` bytes are looked up in a table of their size classes.
+    """
+    name = None
+
+    def __init__(self, table_size = 4096):
+        self._table = [self.size_class(size) for size in xrange(table_size + 1)]
+
+    def allocated(self, size):
+        """Returns the bytes used by an allocation of `size` bytes"""
+        if size < len(self._table):
+            return self._table[int(size)]
+        return self.size_class(size)
+
+class Jemalloc(Allocator):
+    """
+    jemalloc, which Redis is built with by default on Linux. Redis configures it with 8 bytes quanta 
+    (--with-lg-quantum=3 in deps/Makefile), so that its size classes are multiples of 8 bytes up to 64 bytes, 
+    and then 4 classes evenly spaced between powers of 2 : 80, 96, 112, 128, 160, 192 and so on.
+    See size_classes.sh in jemalloc, with 4 KB pages.
+    """
+    name = 'jemalloc'
+
+    def size_class(self, size):
+        size = int(size)
+        if size <= 8:
+            return 8
+        # size is in ]2 ** (n + 2), 2 ** (n + 3)], where classes are 2 ** n bytes apart, and 8 bytes at least
+        spacing = max(8, 1 << ((size - 1).bit_length() - 3))
+        return (size + spacing - 1) & ~(spacing - 1)
+
+class Libc(Allocator):
+    """
+    The malloc of glibc. A chunk is the allocation and a size_t header, aligned on 2 size_t and of 4 size_t
+    at least. Allocations from `mmap_threshold` bytes are mapped in pages of their own, with 2 size_t of header.
+    The size class of an allocation is the usable size of its chunk, which Redis counts as used memory 
+    (zmalloc_size is malloc_usable_size with glibc).
+    """
+    name = 'libc'
+
+    def __init__(self, pointer_size = 8, mmap_threshold = 128 * 1024, table_size = 4096):
+        self.size_t = pointer_size
+        self.mmap_threshold = mmap_threshold
+        Allocator.__init__(self, table_size)
+
+    def size_class(self, size):
+        size = int(size)
+        if size >= self.mmap_threshold:
+            return ((size + 2*self.size_t + 4095) & ~4095) - 2*self.size_t
+        align = 2*self.size_t
+        return max(4*self.size_t, (size + self.size_t + align - 1) & ~(align - 1)) - self.size_t
+
+ALLOCATORS = {
+    'jemalloc' : Jemalloc,
+    'libc' : Libc,
+}
+
+def get_allocator(name, pointer_size = 8):
+    """Returns the allocator called `name`, one of ALLOCATORS"""
+    if not name in ALLOCATORS:
+        raise Exception('get_allocator', 'Unknown allocator %s. Expected one of %s' % (name, ', '.join(sorted(ALLOCATORS))))
+    if name == 'libc':
+        return Libc(pointer_size)
+    return ALLOCATORS[name]()
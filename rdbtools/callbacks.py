@@ -95,6 +95,8 @@ def encode_value(s):
 
 
 class JSONCallback(RdbCallback):
+    wants_batches = True
+
     def __init__(self, out):
         self._out = out
         self._is_first_db = True
@@ -114,6 +116,11 @@ class JSONCallback(RdbCallback):
         self._has_databases = True
         self._is_first_key_in_db = True
 
+    def resume_database(self, db_number, first_key):
+        self._is_first_db = False
+        self._has_databases = True
+        self._is_first_key_in_db = first_key
+
     def end_database(self, db_number):
         pass
         
@@ -137,6 +144,14 @@ class JSONCallback(RdbCallback):
         if self._element_index > 0 and self._element_index < self._elements_in_key :
             self._out.write(',')
         self._element_index = self._element_index + 1
+
+    def _write_elements(self, elements):
+        if not elements:
+            return
+        if self._element_index > 0:
+            self._out.write(',')
+        self._out.write(','.join(elements))
+        self._element_index = self._element_index + len(elements)
         
     def set(self, key, value, expiry, info):
         self._start_key(key, 0)
@@ -149,6 +164,9 @@ class JSONCallback(RdbCallback):
     def hset(self, key, field, value):
         self._write_comma()
         self._out.write('%s:%s' % (encode_key(field), encode_value(value)))
+
+    def hset_many(self, key, pairs):
+        self._write_elements(['%s:%s' % (encode_key(field), encode_value(value)) for field, value in pairs])
     
     def end_hash(self, key):
         self._end_key(key)
@@ -161,6 +179,9 @@ class JSONCallback(RdbCallback):
     def sadd(self, key, member):
         self._write_comma()
         self._out.write('%s' % encode_value(member))
+
+    def sadd_many(self, key, members):
+        self._write_elements([encode_value(member) for member in members])
     
     def end_set(self, key):
         self._end_key(key)
@@ -173,6 +194,9 @@ class JSONCallback(RdbCallback):
     def rpush(self, key, value) :
         self._write_comma()
         self._out.write('%s' % encode_value(value))
+
+    def rpush_many(self, key, values):
+        self._write_elements([encode_value(value) for value in values])
     
     def end_list(self, key):
         self._end_key(key)
@@ -185,11 +209,28 @@ class JSONCallback(RdbCallback):
     def zadd(self, key, score, member):
         self._write_comma()
         self._out.write('%s:%s' % (encode_key(member), encode_value(score)))
+
+    def zadd_many(self, key, pairs):
+        self._write_elements(['%s:%s' % (encode_key(member), encode_value(score)) for score, member in pairs])
     
     def end_sorted_set(self, key):
         self._end_key(key)
         self._out.write('}')
 
+    def start_stream(self, key, listpacks_count, expiry, info):
+        self._start_key(key, 0)
+        self._out.write('%s:{' % encode_key(key))
+
+    def stream_entries(self, key, entries):
+        # Entries are objects keyed by their ID. Consumer groups are not written
+        self._write_elements(['%s:{%s}' % (encode_key(entry_id), 
+                                           ','.join('%s:%s' % (encode_key(field), encode_value(value)) for field, value in pairs))
+                              for entry_id, pairs in entries])
+
+    def end_stream(self, key, info):
+        self._end_key(key)
+        self._out.write('}')
+
 
 class DiffCallback(RdbCallback):
     '''Prints the contents of RDB in a format that is unix sort friendly, 
@@ -257,6 +298,27 @@ class DiffCallback(RdbCallback):
     def end_sorted_set(self, key):
         pass
 
+    def start_stream(self, key, listpacks_count, expiry, info):
+        pass
+
+    def stream_entries(self, key, entries):
+        for entry_id, pairs in entries:
+            for field, value in pairs:
+                self._out.write('db=%d %s[%s] . %s -> %s' % (self._dbnum, encode_key(key), entry_id, encode_key(field), encode_value(value)))
+                self.newline()
+
+    def stream_group(self, key, group):
+        self._out.write('db=%d %s group %s -> last_id=%s' % (self._dbnum, encode_key(key), encode_key(group.name), group.last_id))
+        self.newline()
+        for consumer in group.consumers:
+            self._out.write('db=%d %s group %s . %s -> pending=[%s]' % (self._dbnum, encode_key(key), encode_key(group.name), 
+                                                                       encode_key(consumer.name), ','.join(consumer.pending)))
+            self.newline()
+
+    def end_stream(self, key, info):
+        self._out.write('db=%d %s -> last_id=%s' % (self._dbnum, encode_key(key), info['last_id']))
+        self.newline()
+
     def newline(self):
         self._out.write('\r\n')
 
@@ -264,8 +326,15 @@ class DiffCallback(RdbCallback):
 def _unix_timestamp(dt):
      return calendar.timegm(dt.utctimetuple())
 
+def _unix_timestamp_ms(dt):
+     return _unix_timestamp(dt) * 1000 + dt.microsecond // 1000
+
 
 class ProtocolCallback(RdbCallback):
+    '''Emits the redis commands that recreate the dump. With batches, the elements of a 
+        collection are added with one variadic command (e.g. SADD key m1 m2 ...) per batch'''
+    wants_batches = True
+
     def __init__(self, out):
         self._out = out
         self.reset()
@@ -302,6 +371,10 @@ class ProtocolCallback(RdbCallback):
         self.reset()
         self.select(db_number)
 
+    def resume_database(self, db_number, first_key):
+        # SELECT has already been emitted for this database
+        self.reset()
+
     # String handling
 
     def set(self, key, value, expiry, info):
@@ -317,6 +390,13 @@ class ProtocolCallback(RdbCallback):
     def hset(self, key, field, value):
         self.emit('HSET', key, field, value)
 
+    def hset_many(self, key, pairs):
+        args = ['HMSET', key]
+        for field, value in pairs:
+            args.append(field)
+            args.append(value)
+        self.emit(*args)
+
     def end_hash(self, key):
         self.post_expiry(key)
 
@@ -328,6 +408,9 @@ class ProtocolCallback(RdbCallback):
     def sadd(self, key, member):
         self.emit('SADD', key, member)
 
+    def sadd_many(self, key, members):
+        self.emit('SADD', key, *members)
+
     def end_set(self, key):
         self.post_expiry(key)
 
@@ -339,6 +422,9 @@ class ProtocolCallback(RdbCallback):
     def rpush(self, key, value):
         self.emit('RPUSH', key, value)
 
+    def rpush_many(self, key, values):
+        self.emit('RPUSH', key, *values)
+
     def end_list(self, key):
         self.post_expiry(key)
 
@@ -350,9 +436,62 @@ class ProtocolCallback(RdbCallback):
     def zadd(self, key, score, member):
         self.emit('ZADD', key, score, member)
 
+    def zadd_many(self, key, pairs):
+        args = ['ZADD', key]
+        for score, member in pairs:
+            args.append(score)
+            args.append(member)
+        self.emit(*args)
+
     def end_sorted_set(self, key):
         self.post_expiry(key)
 
+    # Stream handling, with the commands of the AOF rewrite of streams (rewriteStreamObject in aof.c)
+
+    def start_stream(self, key, listpacks_count, expiry, info):
+        self.pre_expiry(key, expiry)
+        self._groups = []
+
+    def stream_entries(self, key, entries):
+        for entry_id, pairs in entries:
+            args = ['XADD', key, entry_id]
+            for field, value in pairs:
+                args.append(field)
+                args.append(value)
+            self.emit(*args)
+
+    def stream_group(self, key, group):
+        # Groups are created once the stream exists, with its last ID
+        self._groups.append(group)
+
+    def end_stream(self, key, info):
+        if info['length'] == 0:
+            # An empty stream is created by adding an entry, trimmed at once. IDs start at 0-1, 
+            # and XSETID then sets the last ID of the stream
+            self.emit('XADD', key, 'MAXLEN', 0, info['last_id'] if info['last_id'] != '0-0' else '0-1', 'x', 'y')
+        if info['entries_added'] is None:
+            self.emit('XSETID', key, info['last_id'])
+        else:
+            self.emit('XSETID', key, info['last_id'], 'ENTRIESADDED', info['entries_added'], 
+                      'MAXDELETEDID', info['max_deleted_entry_id'])
+        for group in self._groups:
+            if group.entries_read is None:
+                self.emit('XGROUP', 'CREATE', key, group.name, group.last_id)
+            else:
+                self.emit('XGROUP', 'CREATE', key, group.name, group.last_id, 'ENTRIESREAD', group.entries_read)
+            pending = dict((entry.id, entry) for entry in group.pending)
+            for consumer in group.consumers:
+                if not consumer.pending:
+                    self.emit('XGROUP', 'CREATECONSUMER', key, group.name, consumer.name)
+                # Pending entries are claimed without being delivered again
+                for entry_id in consumer.pending:
+                    entry = pending[entry_id]
+                    self.emit('XCLAIM', key, group.name, consumer.name, 0, entry_id, 
+                              'TIME', _unix_timestamp_ms(entry.delivery_time), 'RETRYCOUNT', entry.delivery_count, 
+                              'JUSTID', 'FORCE')
+        self._groups = []
+        self.post_expiry(key)
+
     # Other misc commands
 
     def select(self, db_number):
@@ -3,25 +3,138 @@ import os
 import sys
 from optparse import OptionParser
 from rdbtools import RdbParser, JSONCallback, DiffCallback, MemoryCallback, ProtocolCallback, PrintAllKeys
+from rdbtools import ParallelRdbParser, RdbIndex
+from rdbtools.parser import dump_reader, verify_dump, ENCODING_MAPPING
+from rdbtools.memprofiler import LargestKeys
+from rdbtools.allocators import ALLOCATORS
+from rdbtools.callbacks import encode_key
+from rdbtools.filters import read_key_file
+from rdbtools.progress import ParseStats, print_progress
+from rdbtools.profiling import ParseProfile
+
+VALID_TYPES = ("hash", "set", "string", "list", "sortedset", "stream")
+
+class MemoryCallbackFactory(object):
+    '''Callback factory of the memory command, with the options of its MemoryCallback'''
+    def __init__(self, header = True, **options):
+        self.header = header
+        self.options = options
+
+    def __call__(self, out):
+        # The csv header is written once, by the callback in the main process
+        return MemoryCallback(PrintAllKeys(out, header = self.header), 64, **self.options)
+
+class LargestKeysCallback(object):
+    '''Callback factory of the memory command with --largest, which keeps the largest keys instead of printing every key'''
+    def __init__(self, count, **options):
+        self.count = count
+        self.options = options
+
+    def __call__(self, out):
+        return MemoryCallback(LargestKeys(self.count), 64, **self.options)
+
+def print_keys(dump_file, filters, out, verify_checksum = False):
+    '''Lists the keys of the dump with their type, expiry and serialized size, without decoding any value'''
+    parser = RdbParser(None, filters, verify_checksum = verify_checksum)
+    out.write("database,type,encoding,key,expiry,size_in_bytes\n")
+    with dump_reader(dump_file, checksum = verify_checksum) as f:
+        for entry in parser.scan_keys(f, filtered = True):
+            expiry = ''
+            if entry.expiry is not None:
+                expiry = entry.expiry.isoformat()
+            out.write("%d,%s,%s,%s,%s,%d\n" % (entry.database, parser.get_logical_type(entry.data_type), 
+                                               ENCODING_MAPPING[entry.data_type], encode_key(entry.key), expiry, entry.length))
+
+def print_summary(dump_file, filters, out):
+    '''Prints the version, the AUX fields and the number of keys of every database, like the INFO command'''
+    parser = RdbParser(None, filters)
+    with dump_reader(dump_file) as f:
+        summary = parser.summarize(f)
+    out.write("# Dump\n")
+    out.write("rdb_version:%d\n" % summary.version)
+    for field, value in summary.aux:
+        out.write("%s:%s\n" % (field, value))
+    out.write("\n# Keyspace\n")
+    for db in summary.databases:
+        out.write("db%d:keys=%d,expires=%d\n" % (db.database, db.keys, db.expires))
+
+def print_verify(dump_file, out):
+    '''Verifies the checksum at the end of the dump, without parsing it'''
+    crc = verify_dump(dump_file)
+    if crc is None:
+        out.write("%s has no checksum\n" % dump_file)
+    else:
+        out.write("%s checksum %016x OK\n" % (dump_file, crc))
+
+# Maps a command to its callback factory, and the callback factory for parallel workers
+COMMANDS = {
+    'diff' : (DiffCallback, DiffCallback),
+    'json' : (JSONCallback, JSONCallback),
+    'memory' : (MemoryCallbackFactory(), MemoryCallbackFactory(header = False)),
+    'protocol' : (ProtocolCallback, ProtocolCallback),
+}
 
-VALID_TYPES = ("hash", "set", "string", "list", "sortedset")
 def main():
     usage = """usage: %prog [options] /path/to/dump.rdb
 
+The dump file can be compressed with gzip (.gz), zstandard (.zst) or lz4 (.lz4), 
+or be - to read it from standard input.
+
 Example : %prog --command json -k "user.*" /var/redis/6379/dump.rdb"""
 
     parser = OptionParser(usage=usage)
     parser.add_option("-c", "--command", dest="command",
-                  help="Command to execute. Valid commands are json, diff, and protocol", metavar="FILE")
+                  help="Command to execute. Valid commands are json, diff, memory, protocol, keys, summary, verify and index", metavar="FILE")
     parser.add_option("-f", "--file", dest="output",
                   help="Output file", metavar="FILE")
     parser.add_option("-n", "--db", dest="dbs", action="append",
                   help="Database Number. Multiple databases can be provided. If not specified, all databases will be included.")
     parser.add_option("-k", "--key", dest="keys", default=None,
                   help="Keys to export. This can be a regular expression")
+    parser.add_option("--prefix-file", dest="prefix_files", action="append",
+                  help="File with one key prefix per line. Only keys starting with one of these prefixes are exported", metavar="FILE")
+    parser.add_option("--exclude-prefix-file", dest="exclude_prefix_files", action="append",
+                  help="File with one key prefix per line. Keys starting with one of these prefixes are not exported", metavar="FILE")
+    parser.add_option("--key-file", dest="key_files", action="append",
+                  help="File with one key per line. Only these keys are exported", metavar="FILE")
+    parser.add_option("--exclude-key-file", dest="exclude_key_files", action="append",
+                  help="File with one key per line. These keys are not exported", metavar="FILE")
+    parser.add_option("--sample", dest="sample", default=None, type="float", metavar="RATE",
+                  help="""Only export a RATE of the keys, such as 0.01, chosen by a hash of their name. 
+                    The other keys are skipped without being decoded""")
     parser.add_option("-t", "--type", dest="types", action="append",
-                  help="""Data types to include. Possible values are string, hash, set, sortedset, list. Multiple typees can be provided. 
+                  help="""Data types to include. Possible values are string, hash, set, sortedset, list, stream. Multiple typees can be provided. 
                     If not specified, all data types will be returned""")
+    parser.add_option("-j", "--jobs", dest="jobs", default=1, type="int",
+                  help="Number of processes to parse the dump file with. Defaults to 1")
+    parser.add_option("-g", "--get", dest="get", action="append",
+                  help="""Key to read from the index of the dump, instead of parsing the whole dump. Multiple keys can be provided.
+                    Build the index first with --command index""")
+    parser.add_option("-i", "--index", dest="index", default=None,
+                  help="Index file. Defaults to the dump file with a .idx extension", metavar="FILE")
+    parser.add_option("--verify-checksum", dest="verify_checksum", action="store_true", default=False,
+                  help="Verify the checksum at the end of the dump while parsing it, and fail if it does not match")
+    parser.add_option("--progress", dest="progress", default=None, type="float", metavar="SECONDS",
+                  help="Print the progress, throughput and ETA of the parse to stderr every SECONDS seconds")
+    parser.add_option("--stats-file", dest="stats_file", default=None,
+                  help="""Write the bytes, keys and elements read and the time spent to FILE when the parse is done.
+                    In the Prometheus text format if FILE ends with .prom, and in json otherwise""", metavar="FILE")
+    parser.add_option("--profile", dest="profile", action="store_true", default=False,
+                  help="""Print to stderr the time spent decoding every encoding, in every callback method and writing 
+                    the output, and the keys that took the longest to decode""")
+    parser.add_option("--largest", dest="largest", default=None, type="int", metavar="N",
+                  help="""With the memory command, only report the N keys that use the most memory overall, 
+                    of every type and in every database, instead of every key""")
+    parser.add_option("--largest-format", dest="largest_format", default="csv", choices=("csv", "json"),
+                  help="Format of the --largest report, csv or json. Defaults to csv")
+    parser.add_option("--redis-version", dest="redis_version", default=None, metavar="VERSION",
+                  help="""With the memory command, estimate the memory of the objects of this version of Redis, such as 7.0, 
+                    rounding allocations up to the size classes of --allocator. Without it, the memory is estimated with 
+                    the heuristics of earlier releases of rdbtools""")
+    parser.add_option("--allocator", dest="allocator", default="jemalloc", choices=sorted(ALLOCATORS),
+                  help="Allocator Redis is built with, jemalloc or libc. Defaults to jemalloc")
+    parser.add_option("--profile-keys", dest="profile_keys", default=10, type="int", metavar="N",
+                  help="Number of the slowest keys to decode listed by --profile. Defaults to 10")
     
     (options, args) = parser.parse_args()
     
@@ -41,6 +154,16 @@ Example : %prog --command json -k "user.*" /var/redis/6379/dump.rdb"""
     if options.keys:
         filters['keys'] = options.keys
     
+    for name, files in (('prefixes', options.prefix_files), ('exclude_prefixes', options.exclude_prefix_files),
+                        ('exact_keys', options.key_files), ('exclude_keys', options.exclude_key_files)):
+        if files:
+            filters[name] = []
+            for filename in files:
+                filters[name].extend(read_key_file(filename))
+    
+    if options.sample is not None:
+        filters['sample'] = options.sample
+
     if options.types:
         filters['types'] = []
         for x in options.types:
@@ -49,37 +172,88 @@ Example : %prog --command json -k "user.*" /var/redis/6379/dump.rdb"""
             else:
                 filters['types'].append(x)
     
-    # TODO : Fix this ugly if-else code
+    if options.command == 'index':
+        index_file = RdbIndex.build(dump_file, options.index)
+        print "Indexed %s in %s" % (dump_file, index_file)
+        return
+
+    if options.command not in ('keys', 'summary', 'verify') and not options.command in COMMANDS:
+        raise Exception('Invalid Command %s' % options.command)
+
+    if options.jobs > 1 and (dump_file == '-' or dump_file.endswith(('.gz', '.zst', '.lz4'))):
+        raise Exception('Parallel parsing needs an uncompressed dump file, not %s' % dump_file)
+
+    if options.largest is not None and (options.command != 'memory' or options.largest < 1):
+        raise Exception('--largest needs the memory command and a number of keys of at least 1')
+    if options.redis_version is not None and options.command != 'memory':
+        raise Exception('--redis-version needs the memory command')
+
+    stats = None
+    profile = None
+    if options.progress or options.stats_file or options.profile:
+        if options.jobs > 1 or options.get or options.command in ('keys', 'summary', 'verify'):
+            raise Exception('--progress, --stats-file and --profile are only supported when parsing the whole dump with a single process')
+        if options.progress or options.stats_file:
+            stats = ParseStats(print_progress if options.progress else None, options.progress or 5.0)
+        if options.profile:
+            profile = ParseProfile(options.profile_keys)
+
     if options.output:
-        with open(options.output, "wb") as f:
-            if 'diff' == options.command:
-                callback = DiffCallback(f)
-            elif 'json' == options.command:
-                callback = JSONCallback(f)
-            elif 'memory' == options.command:
-                reporter = PrintAllKeys(f)
-                callback = MemoryCallback(reporter, 64)
-            elif 'protocol' == options.command:
-                callback = ProtocolCallback(f)
-            else:
-                raise Exception('Invalid Command %s' % options.command)
-            parser = RdbParser(callback)
-            parser.parse(dump_file)
+        out = open(options.output, "wb")
     else:
-        if 'diff' == options.command:
-            callback = DiffCallback(sys.stdout)
-        elif 'json' == options.command:
-            callback = JSONCallback(sys.stdout)
-        elif 'memory' == options.command:
-            reporter = PrintAllKeys(sys.stdout)
-            callback = MemoryCallback(reporter, 64)
-        elif 'protocol' == options.command:
-            callback = ProtocolCallback(sys.stdout)
+        out = sys.stdout
+    try:
+        if options.command == 'keys':
+            print_keys(dump_file, filters, out, options.verify_checksum)
+            return
+        if options.command == 'verify':
+            print_verify(dump_file, out)
+            return
+        if options.command == 'summary':
+            print_summary(dump_file, filters, out)
+            return
+        callback_factory, worker_callback_factory = COMMANDS[options.command]
+        memory_options = {'redis_version' : options.redis_version, 'allocator' : options.allocator}
+        if options.command == 'memory':
+            callback_factory = MemoryCallbackFactory(**memory_options)
+            worker_callback_factory = MemoryCallbackFactory(header = False, **memory_options)
+        largest = None
+        if options.largest:
+            largest = LargestKeys(options.largest)
+            callback_factory = lambda out: MemoryCallback(largest, 64, **memory_options)
+            # Workers send their largest keys back to be merged, rather than writing their output
+            worker_callback_factory = LargestKeysCallback(options.largest, **memory_options)
+        if profile is not None:
+            callback = callback_factory(profile.wrap_output(out))
         else:
-            raise Exception('Invalid Command %s' % options.command)
-
-        parser = RdbParser(callback, filters=filters)
-        parser.parse(dump_file)
+            callback = callback_factory(out)
+        if options.get:
+            index = RdbIndex(dump_file, options.index)
+            entries = []
+            for key in options.get:
+                entries.extend(index.lookup(key))
+            parser = RdbParser(callback, filters=filters)
+            parser.parse_entries(dump_file, entries)
+        elif options.jobs > 1:
+            parser = ParallelRdbParser(callback, worker_callback_factory, filters=filters, processes=options.jobs,
+                                       verify_checksum=options.verify_checksum)
+            parser.parse(dump_file, out if largest is None else None)
+        else:
+            parser = RdbParser(callback, filters=filters, verify_checksum=options.verify_checksum, stats=stats, 
+                               profile=profile)
+            parser.parse(dump_file)
+            if options.stats_file:
+                stats.write_file(options.stats_file)
+            if profile is not None:
+                profile.write_report(sys.stderr)
+        if largest is not None:
+            if options.largest_format == 'json':
+                largest.write_json(out)
+            else:
+                largest.write_csv(out)
+    finally:
+        if options.output:
+            out.close()
     
 if __name__ == '__main__':
     main()
@@ -1,16 +1,11 @@
 #!/usr/bin/env python
-import struct
 import os
 import sys
 
-try :
-    from StringIO import StringIO
-except ImportError:
-    from io import StringIO
-    
 from optparse import OptionParser
 from rdbtools import RdbParser, JSONCallback, MemoryCallback
 from rdbtools.callbacks import encode_key
+from rdbtools.parser import BufferReader
 
 from redis import StrictRedis
 from redis.exceptions import ConnectionError, ResponseError
@@ -52,8 +47,8 @@ def print_memory_for_key(key, host='localhost', port=6379, db=0, password=None):
         sys.stderr.write('Key %s does not exist\n' % key)
         sys.exit(-1)
     
-    stream = StringIO(raw_dump)
-    data_type = read_unsigned_char(stream)
+    stream = BufferReader(raw_dump)
+    data_type = stream.read_unsigned_char()
     parser.read_object(stream, data_type)
 
 def connect_to_redis(host, port, db, password):
@@ -80,9 +75,6 @@ def check_redis_version(redis):
     else:
         return False
 
-def read_unsigned_char(f) :
-    return struct.unpack('B', f.read(1))[0]
-
 class PrintMemoryUsage():
     def next_record(self, record) :
         print("%s\t\t\t\t%s" % ("Key", encode_key(record.key)))
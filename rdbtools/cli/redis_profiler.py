@@ -4,6 +4,17 @@ import sys
 from string import Template
 from optparse import OptionParser
 from rdbtools import RdbParser, MemoryCallback, PrintAllKeys, StatsAggregator
+from rdbtools import ParallelRdbParser
+from rdbtools.allocators import ALLOCATORS
+
+class StatsWorkerCallback(object):
+    '''Callback factory of the parallel workers, whose StatsAggregator are merged into the one of the report'''
+    def __init__(self, stats_options, memory_options):
+        self.stats_options = stats_options
+        self.memory_options = memory_options
+
+    def __call__(self, out):
+        return MemoryCallback(StatsAggregator(**self.stats_options), 64, **self.memory_options)
 
 def main(): 
     usage = """usage: %prog [options] /path/to/dump.rdb
@@ -17,6 +28,27 @@ Example 2 : %prog /var/redis/6379/dump.rdb"""
                   help="Output file", metavar="FILE")
     parser.add_option("-k", "--key", dest="keys", action="append",
                   help="Keys that should be grouped together. Multiple regexes can be provided")
+    parser.add_option("-j", "--jobs", dest="jobs", default=1, type="int",
+                  help="Number of processes to parse the dump file with. Defaults to 1")
+    parser.add_option("--largest", dest="largest", default=10, type="int", metavar="N",
+                  help="Number of the keys that use the most memory listed in the report. Defaults to 10")
+    parser.add_option("--prefix-depth", dest="prefix_depth", default=2, type="int", metavar="N",
+                  help="""Number of levels of key prefixes the memory is grouped by, 0 to not group keys by prefix. 
+                    Defaults to 2""")
+    parser.add_option("--prefix-delimiters", dest="prefix_delimiters", default=":./",
+                  help="Characters that end a key prefix. Defaults to :./")
+    parser.add_option("--max-prefixes", dest="max_prefixes", default=10000, type="int", metavar="N",
+                  help="""Number of key prefixes kept in memory. The prefixes using the least memory are dropped 
+                    beyond that. Defaults to 10000""")
+    parser.add_option("--sample", dest="sample", default=None, type="float", metavar="RATE",
+                  help="""Only parse a RATE of the keys, such as 0.01, chosen by a hash of their name. The totals of 
+                    the report are estimated for all the keys, within a 95% confidence interval""")
+    
+    parser.add_option("--redis-version", dest="redis_version", default=None, metavar="VERSION",
+                  help="""Estimate the memory of the objects of this version of Redis, such as 7.0, rounding allocations 
+                    up to the size classes of --allocator""")
+    parser.add_option("--allocator", dest="allocator", default="jemalloc", choices=sorted(ALLOCATORS),
+                  help="Allocator Redis is built with, jemalloc or libc. Defaults to jemalloc")
     
     (options, args) = parser.parse_args()
     
@@ -29,9 +61,20 @@ Example 2 : %prog /var/redis/6379/dump.rdb"""
     else:
         output = options.output
 
-    stats = StatsAggregator()
-    callback = MemoryCallback(stats, 64)
-    parser = RdbParser(callback)
+    stats_options = {'key_groupings' : options.keys, 'largest' : options.largest, 'prefix_depth' : options.prefix_depth,
+                     'prefix_delimiters' : options.prefix_delimiters, 'max_prefixes' : options.max_prefixes}
+    filters = None
+    if options.sample is not None:
+        stats_options['sample_rate'] = options.sample
+        filters = {'sample' : options.sample}
+    memory_options = {'redis_version' : options.redis_version, 'allocator' : options.allocator}
+    stats = StatsAggregator(**stats_options)
+    callback = MemoryCallback(stats, 64, **memory_options)
+    if options.jobs > 1:
+        parser = ParallelRdbParser(callback, StatsWorkerCallback(stats_options, memory_options), 
+                                   filters=filters, processes=options.jobs)
+    else:
+        parser = RdbParser(callback, filters)
     parser.parse(dump_file)
     stats_as_json = stats.get_json()
     
@@ -0,0 +1,61 @@
+"""
+The CRC64 that ends dump files of RDB version 5 and later, as redis computes it (see crc64.c in redis) :
+the Jones polynomial, reflected, with an initial value of 0 and no final xor.
+
+When crcmod (https://pypi.python.org/pypi/crcmod) is installed, its C extension computes the checksum.
+Otherwise it is computed in pure python, 8 bytes at a time with 8 tables ("slicing-by-8").
+"""
+import struct
+
+try :
+    import crcmod
+    HAS_CRCMOD = True
+except ImportError :
+    HAS_CRCMOD = False
+
+# The Jones polynomial, reflected. crcmod wants it with its implicit top bit, and not reflected
+POLYNOMIAL = 0x95AC9329AC4BC9B5
+CRCMOD_POLYNOMIAL = 0x1AD93D23594C935A9
+
+# Number of bytes unpacked at once, in words of 8 bytes
+_BLOCK_SIZE = 1 << 16
+
+def _make_tables():
+    """
+    Table k gives the CRC of a byte followed by k zero bytes, so that the 8 bytes of a word
+    are folded with one lookup each
+    """
+    table = []
+    for n in xrange(0, 256) :
+        crc = n
+        for k in xrange(0, 8) :
+            if crc & 1 :
+                crc = (crc >> 1) ^ POLYNOMIAL
+            else :
+                crc >>= 1
+        table.append(crc)
+    tables = [table]
+    for k in xrange(1, 8) :
+        tables.append([(crc >> 8) ^ table[crc & 0xFF] for crc in tables[-1]])
+    return tables
+
+_tables = _make_tables()
+
+def crc64_python(data, crc = 0):
+    """Returns the CRC64 of the string or buffer `data`, continuing from the CRC64 `crc` of the bytes before it"""
+    t0, t1, t2, t3, t4, t5, t6, t7 = _tables
+    words = len(data) // 8
+    for start in xrange(0, words * 8, _BLOCK_SIZE) :
+        count = min(_BLOCK_SIZE, words * 8 - start) // 8
+        for x in struct.unpack_from('<%dQ' % count, data, start) :
+            x ^= crc
+            crc = (t7[x & 0xFF] ^ t6[(x >> 8) & 0xFF] ^ t5[(x >> 16) & 0xFF] ^ t4[(x >> 24) & 0xFF] ^
+                   t3[(x >> 32) & 0xFF] ^ t2[(x >> 40) & 0xFF] ^ t1[(x >> 48) & 0xFF] ^ t0[x >> 56])
+    for c in data[words * 8:] :
+        crc = t0[(crc ^ ord(c)) & 0xFF] ^ (crc >> 8)
+    return crc
+
+if HAS_CRCMOD :
+    crc64 = crcmod.mkCrcFun(CRCMOD_POLYNOMIAL, initCrc = 0, rev = True, xorOut = 0)
+else :
+    crc64 = crc64_python
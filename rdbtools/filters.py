@@ -0,0 +1,80 @@
+import bisect
+import zlib
+
+class PrefixSet(object):
+    """
+    A set of key prefixes, matched in O(log n) comparisons of at most the key length.
+
+    Prefixes that start with a shorter prefix of the set are dropped, since every key they
+    match is matched by the shorter one. In the remaining sorted list, the only prefix that
+    can match a key is the greatest one that sorts before the key, which `bisect` finds.
+    """
+    def __init__(self, prefixes):
+        self._prefixes = []
+        for prefix in sorted(set(str(p) for p in prefixes)):
+            if not (self._prefixes and prefix.startswith(self._prefixes[-1])):
+                self._prefixes.append(prefix)
+
+    def __len__(self):
+        return len(self._prefixes)
+
+    def matches(self, key):
+        """Returns True if `key`, a string, starts with one of the prefixes"""
+        index = bisect.bisect_right(self._prefixes, key) - 1
+        return index >= 0 and key.startswith(self._prefixes[index])
+
+class KeySample(object):
+    """
+    Matches a `rate` of the keys, chosen by a hash of their name : the same keys are chosen in every 
+    dump, by every process, so that samples of successive dumps can be compared.
+    """
+    def __init__(self, rate):
+        if not 0 < rate <= 1:
+            raise Exception('KeySample', 'Invalid sample rate %s. Expected a number in ]0, 1]' % rate)
+        self.rate = rate
+        self._threshold = int(rate * (1 << 32))
+
+    def matches(self, key):
+        """Returns True if `key`, a string, is in the sample"""
+        # CRC32 is linear : keys that only differ by a counter would be chosen together without the
+        # finalizer of MurmurHash3, which mixes every bit of the hash into all the others
+        h = zlib.crc32(key) & 0xffffffff
+        h = ((h ^ (h >> 16)) * 0x85ebca6b) & 0xffffffff
+        h = ((h ^ (h >> 13)) * 0xc2b2ae35) & 0xffffffff
+        return h ^ (h >> 16) < self._threshold
+
+def compile_filters(filters):
+    """
+    Returns a copy of `filters` (see `RdbParser`) with the prefixes as `PrefixSet`s and the exact keys 
+    as frozensets, so that parsers created with the copy do not build them again
+    """
+    if not filters:
+        return filters
+    compiled = dict(filters)
+    for name in ('prefixes', 'exclude_prefixes'):
+        if compiled.get(name) is not None:
+            compiled[name] = as_prefix_set(compiled[name])
+    for name in ('exact_keys', 'exclude_keys'):
+        if compiled.get(name) is not None:
+            compiled[name] = as_key_set(compiled[name])
+    return compiled
+
+def as_prefix_set(prefixes):
+    if isinstance(prefixes, PrefixSet):
+        return prefixes
+    return PrefixSet(prefixes)
+
+def as_key_set(keys):
+    if isinstance(keys, frozenset):
+        return keys
+    return frozenset(str(key) for key in keys)
+
+def read_key_file(filename):
+    """Returns the lines of `filename` as a list of keys (or prefixes), without line terminators. Empty lines are ignored"""
+    keys = []
+    with open(filename, 'rb') as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if line:
+                keys.append(line)
+    return keys
@@ -0,0 +1,210 @@
+import os
+import math
+import heapq
+import struct
+import bisect
+import hashlib
+import calendar
+import tempfile
+
+from rdbtools.parser import RdbParser, KeyEntry, open_reader, to_datetime
+
+# Header : magic, dump size, dump mtime, number of records,
+#          bloom filter offset, bits and hash functions, sparse index offset and number of entries
+_header = struct.Struct('<8sQQQQQIQQ')
+_record = struct.Struct('<IIQBQq')
+_sparse_entry = struct.Struct('<IQ')
+INDEX_MAGIC = 'RDBIDX01'
+
+class RdbIndex(object):
+    """
+    A sidecar index of a dump file, mapping keys to where they are stored in the dump.
+
+    Build it once with `RdbIndex.build('/var/redis/6379/dump.rdb')`, which writes
+    `/var/redis/6379/dump.rdb.idx`. Then :
+        index = RdbIndex('/var/redis/6379/dump.rdb')
+        entries = index.lookup('user:13423')
+        parser.parse_entries('/var/redis/6379/dump.rdb', entries)
+
+    The index file holds the records sorted by key, a bloom filter of the keys to
+    answer quickly for keys that are not in the dump, and a sparse index of every
+    `SPARSE_INTERVAL`th record, so that a lookup reads a single block of records.
+    """
+    SPARSE_INTERVAL = 128
+
+    def __init__(self, dump_file, index_file = None):
+        self._dump_file = dump_file
+        self._index_file = index_file or index_file_for(dump_file)
+        with open(self._index_file, 'rb') as f:
+            (magic, dump_size, dump_mtime, self.num_records, bloom_offset, bloom_bits,
+             self._num_hashes, sparse_offset, sparse_count) = _header.unpack(f.read(_header.size))
+            if magic != INDEX_MAGIC:
+                raise Exception('RdbIndex', 'Invalid index file %s' % self._index_file)
+            stat = os.stat(dump_file)
+            if stat.st_size != dump_size or int(stat.st_mtime) != dump_mtime:
+                raise Exception('RdbIndex', 'Index file %s is out of date for %s' % (self._index_file, dump_file))
+            f.seek(bloom_offset)
+            self._bloom = BloomFilter(bloom_bits, self._num_hashes, bytearray(f.read((bloom_bits + 7) // 8)))
+            f.seek(sparse_offset)
+            self._sparse_keys = []
+            self._sparse_offsets = []
+            for x in xrange(0, sparse_count):
+                key_length, offset = _sparse_entry.unpack(f.read(_sparse_entry.size))
+                self._sparse_keys.append(f.read(key_length))
+                self._sparse_offsets.append(offset)
+        self._records_end = bloom_offset
+
+    def lookup(self, key):
+        """Returns the `KeyEntry` of `key` in every database it exists in, or an empty list"""
+        key = str(key)
+        if not self._bloom.might_contain(key):
+            return []
+        block = max(bisect.bisect_left(self._sparse_keys, key) - 1, 0)
+        entries = []
+        with open(self._index_file, 'rb') as f:
+            f.seek(self._sparse_offsets[block])
+            for record in read_records(f, self._records_end):
+                if record[0] > key:
+                    break
+                if record[0] == key:
+                    entries.append(record_to_entry(record))
+        return entries
+
+    @staticmethod
+    def build(dump_file, index_file = None, run_size = 500000, error_rate = 0.01):
+        """
+        Builds the index of `dump_file` in a single pass over the dump, with bounded memory.
+
+        Records are sorted in runs of `run_size` keys which are spilled to temporary files,
+        and then merged into the index. `error_rate` is the false positive rate of the bloom filter
+        """
+        index_file = index_file or index_file_for(dump_file)
+        tmpdir = tempfile.mkdtemp(prefix = 'rdbindex', dir = os.path.dirname(os.path.abspath(index_file)))
+        runs = []
+        try:
+            num_records = 0
+            parser = RdbParser(None)
+            stat = os.stat(dump_file)
+            with open(dump_file, 'rb') as fp:
+                f = open_reader(fp)
+                try:
+                    records = []
+                    for entry in parser.scan_keys(f):
+                        records.append(entry_to_record(entry))
+                        if len(records) >= run_size:
+                            runs.append(write_run(records, tmpdir))
+                            num_records += len(records)
+                            records = []
+                    if records:
+                        runs.append(write_run(records, tmpdir))
+                        num_records += len(records)
+                finally:
+                    f.close()
+
+            bloom = BloomFilter.for_capacity(num_records, error_rate)
+            run_files = [open(run, 'rb') for run in runs]
+            try:
+                with open(index_file, 'wb') as out:
+                    out.write('\0' * _header.size)
+                    sparse = []
+                    count = 0
+                    for record in heapq.merge(*[read_records(run) for run in run_files]):
+                        if count % RdbIndex.SPARSE_INTERVAL == 0:
+                            sparse.append((record[0], out.tell()))
+                        write_record(out, record)
+                        bloom.add(record[0])
+                        count += 1
+                    bloom_offset = out.tell()
+                    out.write(bloom.bits)
+                    sparse_offset = out.tell()
+                    for key, offset in sparse:
+                        out.write(_sparse_entry.pack(len(key), offset))
+                        out.write(key)
+                    out.seek(0)
+                    out.write(_header.pack(INDEX_MAGIC, stat.st_size, int(stat.st_mtime), num_records,
+                                           bloom_offset, bloom.num_bits, bloom.num_hashes, sparse_offset, len(sparse)))
+            finally:
+                for run in run_files:
+                    run.close()
+        finally:
+            for run in runs:
+                os.remove(run)
+            os.rmdir(tmpdir)
+        return index_file
+
+class BloomFilter(object):
+    """
+    A bloom filter over strings. The bit positions are derived from the md5 of the
+    string by double hashing, see Kirsch and Mitzenmacher, "Less Hashing, Same Performance"
+    """
+    def __init__(self, num_bits, num_hashes, bits = None):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        if bits is None:
+            bits = bytearray((num_bits + 7) // 8)
+        self.bits = bits
+
+    @staticmethod
+    def for_capacity(capacity, error_rate):
+        capacity = max(capacity, 1)
+        num_bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        num_hashes = max(int(round(float(num_bits) / capacity * math.log(2))), 1)
+        return BloomFilter(num_bits, num_hashes)
+
+    def positions(self, key):
+        h1, h2 = _two_longs.unpack(hashlib.md5(key).digest())
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in xrange(0, self.num_hashes)]
+
+    def add(self, key):
+        bits = self.bits
+        for position in self.positions(key):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def might_contain(self, key):
+        bits = self.bits
+        for position in self.positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+_two_longs = struct.Struct('<QQ')
+
+def index_file_for(dump_file):
+    return dump_file + '.idx'
+
+# A record is a tuple (key, db, offset, data_type, length, expiry_ms), so that records sort by key
+def entry_to_record(entry):
+    expiry = -1
+    if entry.expiry is not None:
+        expiry = calendar.timegm(entry.expiry.utctimetuple()) * 1000 + entry.expiry.microsecond // 1000
+    return (str(entry.key), entry.database, entry.offset, entry.data_type, entry.length, expiry)
+
+def record_to_entry(record):
+    key, db, offset, data_type, length, expiry = record
+    if expiry < 0:
+        expiry = None
+    else:
+        expiry = to_datetime(expiry * 1000)
+    return KeyEntry(db, offset, data_type, key, expiry, length)
+
+def write_record(out, record):
+    key, db, offset, data_type, length, expiry = record
+    out.write(_record.pack(len(key), db, offset, data_type, length, expiry))
+    out.write(key)
+
+def read_records(f, end = None):
+    while end is None or f.tell() < end:
+        header = f.read(_record.size)
+        if len(header) < _record.size:
+            return
+        key_length, db, offset, data_type, length, expiry = _record.unpack(header)
+        yield (f.read(key_length), db, offset, data_type, length, expiry)
+
+def write_run(records, tmpdir):
+    records.sort()
+    fd, name = tempfile.mkstemp(dir = tmpdir)
+    with os.fdopen(fd, 'wb') as out:
+        for record in records:
+            write_record(out, record)
+    return name
@@ -1,45 +1,436 @@
 from collections import namedtuple
+import heapq
+import math
 import random
 import json
+import re
 
-from rdbtools.parser import RdbCallback
+from rdbtools.parser import RdbCallback, ELEMENTS_LENGTHS, element_length
 from rdbtools.callbacks import encode_key
+from rdbtools.allocators import Allocator, get_allocator
 
 ZSKIPLIST_MAXLEVEL=32
 ZSKIPLIST_P=0.25
 REDIS_SHARED_INTEGERS = 10000
+# The strings Redis encodes as integers, see string2l in util.c
+INTEGER_PATTERN = re.compile(r'(?:0|-?[1-9][0-9]*)\Z')
+# Lengths of strings whose memory is precomputed when a Redis version is given
+SDS_TABLE_SIZE = 4096
 
 MemoryRecord = namedtuple('MemoryRecord', ['database', 'type', 'key', 'bytes', 'encoding','size', 'len_largest_element'])
 
+def parse_redis_version(version):
+    """Parses a Redis version such as 6.2.14 into (6, 2)"""
+    match = re.match(r'^(\d+)(?:\.(\d+))?(?:\.\d+)*$', str(version))
+    if not match:
+        raise Exception('parse_redis_version', 'Invalid Redis version %s' % version)
+    return (int(match.group(1)), int(match.group(2) or 0))
+
+def integer_value(value):
+    """Returns the integer Redis encodes the string `value` as, or None if it is stored as a string"""
+    if isinstance(value, (int, long)):
+        return value
+    if len(value) > 20 or not INTEGER_PATTERN.match(value):
+        return None
+    number = int(value)
+    if -(1 << 63) <= number < (1 << 63):
+        return number
+    return None
+
+class LogHistogram(object):
+    """
+    A histogram of non negative integers in log-linear buckets, as HDR histograms do : values below
+    2 ** `significant_bits` have a bucket each, and larger values are rounded down to their
+    `significant_bits` most significant bits. Its size is bounded by the number of bits of the largest
+    value times 2 ** (`significant_bits` - 1), and quantiles are within 2 ** (1 - `significant_bits`)
+    of the exact ones (3% by default).
+    """
+    def __init__(self, significant_bits = 6):
+        self.significant_bits = significant_bits
+        # lower bound of a bucket : number of values in it
+        self.buckets = {}
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value, count = 1):
+        # Memory usages may be estimated as floats
+        value = int(value)
+        # The bucket of a value keeps its `significant_bits` highest bits, small values have their own bucket
+        shift = value.bit_length() - self.significant_bits
+        bucket = (value >> shift) << shift if shift > 0 else value
+        buckets = self.buckets
+        buckets[bucket] = buckets.get(bucket, 0) + count
+        self.count += count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for bucket, count in other.buckets.iteritems():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def quantile(self, q):
+        """The value below which a fraction `q` of the values are, or None when the histogram is empty"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                # The values of the last bucket are known to reach the maximum
+                return self.max if seen == self.count else max(bucket, self.min)
+        return self.max
+
+class Reservoir(object):
+    """
+    A uniform random sample of at most `size` of the items added to it, whatever their number.
+    Once the sample is full, the number of items to skip before the next one kept is drawn at once
+    (algorithm L), so that most items cost a comparison. The sample is drawn from its own seeded
+    generator, so the same items always give the same sample.
+    """
+    def __init__(self, size = 1000, seed = 0):
+        self.size = size
+        self.seen = 0
+        self.sample = []
+        self._random = random.Random(seed)
+        self._weight = None
+        # The number of items seen when the next item is kept
+        self._next = size
+
+    def add(self, item):
+        self.seen += 1
+        if self.seen <= self.size:
+            self.sample.append(item)
+            if self.seen == self.size:
+                self._weight = math.exp(math.log(1.0 - self._random.random()) / self.size)
+                self.skip()
+        elif self.seen == self._next:
+            self.sample[self._random.randint(0, self.size - 1)] = item
+            self._weight *= math.exp(math.log(1.0 - self._random.random()) / self.size)
+            self.skip()
+
+    def skip(self):
+        if self._weight >= 1.0:
+            # Keeps no other item, which only happens with a degenerate draw
+            self._next = None
+        else:
+            self._next = self.seen + int(math.log(1.0 - self._random.random()) / math.log(1.0 - self._weight)) + 1
+
+    def merge(self, other):
+        """Merges the sample of `other`, keeping items of each sample in proportion to the items each one saw"""
+        seen = self.seen + other.seen
+        if len(self.sample) + len(other.sample) <= self.size:
+            self.sample.extend(other.sample)
+        else:
+            mine = int(round(float(self.size) * self.seen / seen))
+            mine = max(min(mine, len(self.sample)), self.size - len(other.sample))
+            self.sample = (self._random.sample(self.sample, mine) 
+                           + self._random.sample(other.sample, self.size - mine))
+        self.seen = seen
+        # The threshold of algorithm L after `seen` items is the size-th smallest of `seen` uniform draws
+        if self.seen >= self.size:
+            self._weight = self._random.betavariate(self.size, self.seen - self.size + 1)
+            self.skip()
+
+    def __iter__(self):
+        return iter(self.sample)
+
+    def __len__(self):
+        return len(self.sample)
+
+# The headings of the histograms of lengths and memory, and of the scatter plot, by type
+HEADINGS = dict((data_type, (data_type + '_length', data_type + '_memory', data_type + '_memory_by_length'))
+                for data_type in ('list', 'hash', 'set', 'sortedset', 'string', 'stream'))
+
+# Quantiles reported for every histogram
+QUANTILES = (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0))
+
+class LargestKeys(object):
+    """
+    Keeps the `count` records that use the most memory, overall, by type and by database. Every group is a
+    heap of at most `count` records, so that it takes O(count) memory and O(log count) time per key.
+    """
+    def __init__(self, count = 10):
+        self.count = count
+        # Heaps of (bytes, record), the smallest first
+        self.overall = []
+        self.by_type = {}
+        self.by_database = {}
+
+    def next_record(self, record):
+        self.push(self.overall, record)
+        self.push(self.by_type.setdefault(record.type, []), record)
+        self.push(self.by_database.setdefault(record.database, []), record)
+
+    def push(self, heap, record):
+        if len(heap) < self.count:
+            heapq.heappush(heap, (record.bytes, record))
+        elif record.bytes >= heap[0][0]:
+            # Ties are broken on the records, so that the same keys are kept whatever order they come in
+            item = (record.bytes, record)
+            if item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+    def merge(self, other):
+        """Adds the records kept by another LargestKeys, e.g. one from a parallel worker"""
+        # Each group is merged on its own : a key can be among the largest of its type, and not of all keys
+        for size_in_bytes, record in other.overall:
+            self.push(self.overall, record)
+        for data_type, heap in other.by_type.iteritems():
+            for size_in_bytes, record in heap:
+                self.push(self.by_type.setdefault(data_type, []), record)
+        for database, heap in other.by_database.iteritems():
+            for size_in_bytes, record in heap:
+                self.push(self.by_database.setdefault(database, []), record)
+
+    def groups(self):
+        """Returns (group, records) tuples, the largest records first : 'all', then 'type:<type>' and 'db:<number>'"""
+        groups = [('all', self.overall)]
+        groups.extend(('type:%s' % data_type, heap) for data_type, heap in sorted(self.by_type.iteritems()))
+        groups.extend(('db:%d' % database, heap) for database, heap in sorted(self.by_database.iteritems()))
+        return [(group, [record for size_in_bytes, record in sorted(heap, reverse = True)]) for group, heap in groups]
+
+    def write_csv(self, out):
+        out.write("group,database,type,key,size_in_bytes,encoding,num_elements,len_largest_element\n")
+        for group, records in self.groups():
+            for record in records:
+                out.write("%s,%d,%s,%s,%d,%s,%d,%d\n" % (group, record.database, record.type, encode_key(record.key), 
+                                                          record.bytes, record.encoding, record.size, record.len_largest_element))
+
+    def as_dict(self):
+        """The records of every group, as dictionaries that can be serialized to json"""
+        return dict((group, [{'database' : record.database, 'type' : record.type, 
+                              # Keys are escaped as they are in the json of the other reports
+                              'key' : json.loads(encode_key(record.key)), 
+                              'size_in_bytes' : int(record.bytes), 'encoding' : record.encoding, 'num_elements' : record.size, 
+                              'len_largest_element' : record.len_largest_element} for record in records])
+                    for group, records in self.groups())
+
+    def write_json(self, out):
+        json.dump(self.as_dict(), out, indent = 2, sort_keys = True)
+        out.write('\n')
+
+class PrefixNode(object):
+    __slots__ = ('keys', 'bytes', 'elements', 'squares', 'missed_bytes', 'children', 'truncated')
+
+    def __init__(self):
+        self.keys = 0
+        self.bytes = 0
+        self.elements = 0
+        # Sum of the squares of the memory of the keys, for the error of sampled estimates
+        self.squares = 0
+        # Upper bound of the bytes of keys with this prefix that were counted in the parent only, before the node was added
+        self.missed_bytes = 0
+        self.children = {}
+        # Children were pruned : the keys of prefixes without a child are only counted in this node
+        self.truncated = False
+
+class PrefixTree(object):
+    """
+    Keys, memory and elements aggregated by key prefix. Keys are split on any of `delimiters`, and each of their
+    first `depth` prefixes is a node of the tree : user:1234:name counts in user: and user:1234: with a depth of 2.
+
+    The tree holds at most `max_nodes` nodes. Beyond that, the leaves that use the least memory are pruned, and
+    the keys of their prefixes were counted in their closest ancestor only. New prefixes are still added, as in
+    the space saving algorithm : their `missed_bytes` is the most memory of a pruned leaf, an upper bound of the
+    memory of their keys seen before, so that a prefix that uses a lot of memory is kept however late it appears.
+    """
+    def __init__(self, delimiters = ':./', depth = 2, max_nodes = 10000):
+        # Matches the first `depth` segments of a key, each with the delimiter that ends it
+        segment = '([^%s]*[%s])?' % (re.escape(delimiters), re.escape(delimiters))
+        self.segments = re.compile(segment * depth, re.S)
+        self.depth = depth
+        self.max_nodes = max_nodes
+        self.root = PrefixNode()
+        self.nodes = 0
+        # The most memory of a pruned leaf, with its missed bytes
+        self.pruned_bytes = 0
+
+    def add(self, key, size_in_bytes, elements):
+        if not isinstance(key, str):
+            key = str(key)
+        square = size_in_bytes * size_in_bytes
+        node = self.root
+        node.keys += 1
+        node.bytes += size_in_bytes
+        node.elements += elements
+        node.squares += square
+        # Children are keyed by their segment, and their prefix is the one of their parent followed by it
+        for segment in self.segments.match(key).groups():
+            if segment is None:
+                break
+            child = node.children.get(segment)
+            if child is None:
+                child = node.children[segment] = PrefixNode()
+                child.missed_bytes = self.pruned_bytes
+                self.nodes += 1
+            child.keys += 1
+            child.bytes += size_in_bytes
+            child.elements += elements
+            child.squares += square
+            node = child
+        if self.nodes > self.max_nodes:
+            self.prune()
+
+    def prune(self):
+        """Removes the leaves that use the least memory, until the tree holds half of `max_nodes` nodes"""
+        target = self.max_nodes // 2
+        while self.nodes > target:
+            leaves = []
+            stack = [self.root]
+            while stack:
+                node = stack.pop()
+                for segment, child in node.children.iteritems():
+                    if child.children:
+                        stack.append(child)
+                    else:
+                        leaves.append((child.bytes + child.missed_bytes, segment, node))
+            leaves.sort()
+            for size_in_bytes, segment, parent in leaves[:self.nodes - target]:
+                del parent.children[segment]
+                parent.truncated = True
+                self.pruned_bytes = max(self.pruned_bytes, size_in_bytes)
+                self.nodes -= 1
+
+    def merge(self, other):
+        """Adds the counts of another PrefixTree, e.g. one from a parallel worker"""
+        stack = [(self.root, other.root)]
+        while stack:
+            node, other_node = stack.pop()
+            node.keys += other_node.keys
+            node.bytes += other_node.bytes
+            node.elements += other_node.elements
+            node.squares += other_node.squares
+            node.missed_bytes += other_node.missed_bytes
+            node.truncated = node.truncated or other_node.truncated
+            for segment, other_child in other_node.children.iteritems():
+                child = node.children.get(segment)
+                if child is None:
+                    child = node.children[segment] = PrefixNode()
+                    child.missed_bytes = self.pruned_bytes
+                    self.nodes += 1
+                stack.append((child, other_child))
+        # A prefix may have been pruned from both trees
+        self.pruned_bytes += other.pruned_bytes
+        if self.nodes > self.max_nodes:
+            self.prune()
+
+    def as_dict(self, node = None, prefix = '', sample_rate = 1.0):
+        """
+        The tree as nested dictionaries that can be serialized to json, the children using the most memory first.
+        With a `sample_rate` below 1, the counts are estimates for all the keys, with their `estimate_errors`.
+        """
+        if node is None:
+            node = self.root
+        children = sorted(node.children.iteritems(), key = lambda item: item[1].bytes, reverse = True)
+        counts = {'prefix' : json.loads(encode_key(prefix)), 'keys' : node.keys, 'bytes' : int(node.bytes), 
+                  'elements' : node.elements, 'truncated' : node.truncated, 
+                  'missed_bytes' : int(round(node.missed_bytes / sample_rate)),
+                  'children' : [self.as_dict(child, prefix + segment, sample_rate) for segment, child in children]}
+        if sample_rate < 1:
+            add_estimates(counts, node.keys, node.bytes, node.elements, node.squares, sample_rate)
+        return counts
+
+# Quantile of the standard normal distribution for the 95% confidence intervals of sampled estimates
+CONFIDENCE_Z = 1.96
+
+def estimate_error(squares, sample_rate):
+    """
+    The half width of the 95% confidence interval of the total of a metric over all keys, estimated as
+    its total over a sample of the keys divided by `sample_rate`. `squares` is the sum of the squares of 
+    the metric over the sample : the number of keys in the sample, for a count of keys.
+    """
+    return CONFIDENCE_Z * math.sqrt((1 - sample_rate) * squares) / sample_rate
+
+def add_estimates(counts, keys, size_in_bytes, elements, squares, sample_rate):
+    """Sets the keys, bytes and elements of `counts` to their estimates over all keys, and the errors of keys and bytes"""
+    counts['keys'] = int(round(keys / sample_rate))
+    counts['bytes'] = int(round(size_in_bytes / sample_rate))
+    counts['elements'] = int(round(elements / sample_rate))
+    counts['keys_error'] = int(round(estimate_error(keys, sample_rate)))
+    counts['bytes_error'] = int(round(estimate_error(squares, sample_rate)))
+
+
 class StatsAggregator():
-    def __init__(self, key_groupings = None):
+    """
+    Aggregates the records of a MemoryCallback for the memory report, in a memory bounded by the number
+    of types and encodings rather than the number of keys : lengths and memory usages are counted in
+    `LogHistogram`s, and the points of the memory by length scatter plots are sampled in `Reservoir`s
+    of `scatter_size` points. With `largest`, the `largest` keys that use the most memory are kept
+    in a `LargestKeys`.
+
+    Keys, memory and elements are also counted by group of keys : in the first of the `key_groupings` 
+    regular expressions that matches the key, and with a `prefix_depth`, in a `PrefixTree` of the key prefixes.
+
+    When the records are those of a `sample_rate` of the keys, as with the "sample" filter of RdbParser, the 
+    totals of the report are estimates for all the keys, with the half width of their 95% confidence interval
+    in "errors". Quantiles, scatter plots and the largest keys are the ones of the sample.
+    """
+    def __init__(self, key_groupings = None, scatter_size = 1000, significant_bits = 6, largest = 0,
+                 prefix_depth = 0, prefix_delimiters = ':./', max_prefixes = 10000, sample_rate = 1.0):
+        if not 0 < sample_rate <= 1:
+            raise Exception('StatsAggregator', 'Invalid sample rate %s. Expected a number in ]0, 1]' % sample_rate)
         self.aggregates = {}
+        # Sums of the squares of the memory aggregates, for the errors of their estimates when sampling
+        self.squares = {}
+        self.sample_rate = sample_rate
         self.scatters = {}
         self.histograms = {}
+        self.scatter_size = scatter_size
+        self.significant_bits = significant_bits
+        self.largest = LargestKeys(largest) if largest else None
+        self.key_groupings = [(pattern, re.compile(pattern)) for pattern in key_groupings or ()]
+        # pattern : [keys, bytes, elements, sum of the squares of the bytes]
+        self.groups = dict((pattern, [0, 0, 0, 0]) for pattern in key_groupings or ())
+        self.prefixes = PrefixTree(prefix_delimiters, prefix_depth, max_prefixes) if prefix_depth else None
 
     def next_record(self, record):
-        self.add_aggregate('database_memory', record.database, record.bytes)
-        self.add_aggregate('type_memory', record.type, record.bytes)
-        self.add_aggregate('encoding_memory', record.encoding, record.bytes)
+        database, data_type, key, size_in_bytes, encoding, length, len_largest_element = record
+        add_aggregate = self.add_aggregate
+        add_aggregate('database_memory', database, size_in_bytes)
+        add_aggregate('type_memory', data_type, size_in_bytes)
+        add_aggregate('encoding_memory', encoding, size_in_bytes)
         
-        self.add_aggregate('type_count', record.type, 1)
-        self.add_aggregate('encoding_count', record.encoding, 1)
+        add_aggregate('type_count', data_type, 1)
+        add_aggregate('encoding_count', encoding, 1)
+        if self.sample_rate < 1:
+            square = size_in_bytes * size_in_bytes
+            add_square = self.add_square
+            add_square('database_memory', database, square)
+            add_square('type_memory', data_type, square)
+            add_square('encoding_memory', encoding, square)
     
-        self.add_histogram(record.type + "_length", record.size)
-        self.add_histogram(record.type + "_memory", (record.bytes/10) * 10)
-        
-        if record.type == 'list':
-            self.add_scatter('list_memory_by_length', record.bytes, record.size)
-        elif record.type == 'hash':
-            self.add_scatter('hash_memory_by_length', record.bytes, record.size)
-        elif record.type == 'set':
-            self.add_scatter('set_memory_by_length', record.bytes, record.size)
-        elif record.type == 'sortedset':
-            self.add_scatter('sortedset_memory_by_length', record.bytes, record.size)
-        elif record.type == 'string':
-            self.add_scatter('string_memory_by_length', record.bytes, record.size)
-        else:
-            raise Exception('Invalid data type %s' % record.type)
+        if not data_type in HEADINGS:
+            raise Exception('Invalid data type %s' % data_type)
+        length_heading, memory_heading, scatter_heading = HEADINGS[data_type]
+        self.add_histogram(length_heading, length)
+        self.add_histogram(memory_heading, size_in_bytes)
+        self.add_scatter(scatter_heading, size_in_bytes, length)
+        if self.largest is not None:
+            self.largest.next_record(record)
+        if self.key_groupings or self.prefixes is not None:
+            self.add_key_groups(key, size_in_bytes, 1 if data_type == 'string' else length)
+
+    def add_key_groups(self, key, size_in_bytes, elements):
+        if not isinstance(key, str):
+            key = str(key)
+        for pattern, regex in self.key_groupings:
+            if regex.match(key):
+                counts = self.groups[pattern]
+                counts[0] += 1
+                counts[1] += size_in_bytes
+                counts[2] += elements
+                counts[3] += size_in_bytes * size_in_bytes
+                break
+        if self.prefixes is not None:
+            self.prefixes.add(key, size_in_bytes, elements)
 
     def add_aggregate(self, heading, subheading, metric):
         if not heading in self.aggregates :
@@ -49,29 +440,98 @@ class StatsAggregator():
             self.aggregates[heading][subheading] = 0
             
         self.aggregates[heading][subheading] += metric
+
+    def add_square(self, heading, subheading, square):
+        squares = self.squares.setdefault(heading, {})
+        squares[subheading] = squares.get(subheading, 0) + square
     
     def add_histogram(self, heading, metric):
         if not heading in self.histograms:
-            self.histograms[heading] = {}
-
-        if not metric in self.histograms[heading]:
-            self.histograms[heading][metric] = 1
-        else :
-            self.histograms[heading][metric] += 1
+            self.histograms[heading] = LogHistogram(self.significant_bits)
+        self.histograms[heading].add(metric)
     
     def add_scatter(self, heading, x, y):
         if not heading in self.scatters:
-            self.scatters[heading] = []
-        self.scatters[heading].append([x, y])
+            self.scatters[heading] = Reservoir(self.scatter_size)
+        self.scatters[heading].add([x, y])
   
+    def merge(self, other):
+        """Adds the records aggregated by another StatsAggregator, e.g. one from a parallel worker"""
+        for heading, subheadings in other.aggregates.iteritems():
+            for subheading, metric in subheadings.iteritems():
+                self.add_aggregate(heading, subheading, metric)
+        for heading, subheadings in other.squares.iteritems():
+            for subheading, square in subheadings.iteritems():
+                self.add_square(heading, subheading, square)
+        for heading, histogram in other.histograms.iteritems():
+            if not heading in self.histograms:
+                self.histograms[heading] = LogHistogram(self.significant_bits)
+            self.histograms[heading].merge(histogram)
+        for heading, points in other.scatters.iteritems():
+            if not heading in self.scatters:
+                self.scatters[heading] = Reservoir(self.scatter_size)
+            self.scatters[heading].merge(points)
+        if self.largest is not None and other.largest is not None:
+            self.largest.merge(other.largest)
+        for pattern, counts in other.groups.iteritems():
+            if pattern in self.groups:
+                self.groups[pattern] = [mine + theirs for mine, theirs in zip(self.groups[pattern], counts)]
+        if self.prefixes is not None and other.prefixes is not None:
+            self.prefixes.merge(other.prefixes)
+
+    def quantiles(self):
+        """Returns the QUANTILES of every histogram, by heading"""
+        return dict((heading, dict((name, histogram.quantile(q)) for name, q in QUANTILES)) 
+                    for heading, histogram in self.histograms.iteritems())
+
+    def estimates(self):
+        """
+        Returns the aggregates and the histograms scaled up from the sample to all the keys, and the errors 
+        of the aggregates, by heading. Without sampling, they are the aggregates and the histograms themselves.
+        """
+        rate = self.sample_rate
+        if rate >= 1:
+            return self.aggregates, dict((heading, histogram.buckets) for heading, histogram in self.histograms.iteritems()), {}
+        aggregates = dict((heading, dict((subheading, int(round(metric / rate))) for subheading, metric in subheadings.iteritems()))
+                          for heading, subheadings in self.aggregates.iteritems())
+        histograms = dict((heading, dict((bucket, int(round(count / rate))) for bucket, count in histogram.buckets.iteritems()))
+                          for heading, histogram in self.histograms.iteritems())
+        errors = {}
+        for heading, subheadings in self.aggregates.iteritems():
+            # A count of keys is the sum of 1 for every key, and so its own sum of squares
+            squares = self.squares.get(heading, subheadings)
+            errors[heading] = dict((subheading, int(round(estimate_error(squares[subheading], rate)))) 
+                                   for subheading in subheadings)
+        return aggregates, histograms, errors
+
+    def groups_as_list(self):
+        groups = []
+        for pattern, regex in self.key_groupings:
+            keys, size_in_bytes, elements, squares = self.groups[pattern]
+            counts = {'pattern' : pattern, 'keys' : keys, 'bytes' : int(size_in_bytes), 'elements' : elements}
+            if self.sample_rate < 1:
+                add_estimates(counts, keys, size_in_bytes, elements, squares, self.sample_rate)
+            groups.append(counts)
+        return groups
+
     def get_json(self):
-        return json.dumps({"aggregates":self.aggregates, "scatters":self.scatters, "histograms":self.histograms})
+        aggregates, histograms, errors = self.estimates()
+        return json.dumps({"aggregates":aggregates, 
+                           "sample_rate":self.sample_rate,
+                           "errors":errors,
+                           "scatters":dict((heading, points.sample) for heading, points in self.scatters.iteritems()), 
+                           "histograms":histograms,
+                           "quantiles":self.quantiles(),
+                           "largest":self.largest.as_dict() if self.largest is not None else None,
+                           "groups":self.groups_as_list(),
+                           "prefixes":self.prefixes.as_dict(sample_rate = self.sample_rate) if self.prefixes is not None else None})
         
 class PrintAllKeys():
-    def __init__(self, out):
+    def __init__(self, out, header = True):
         self._out = out
-        self._out.write("%s,%s,%s,%s,%s,%s,%s\n" % ("database", "type", "key", 
-                                                 "size_in_bytes", "encoding", "num_elements", "len_largest_element"))
+        if header:
+            self._out.write("%s,%s,%s,%s,%s,%s,%s\n" % ("database", "type", "key", 
+                                                     "size_in_bytes", "encoding", "num_elements", "len_largest_element"))
     
     def next_record(self, record) :
         self._out.write("%d,%s,%s,%d,%s,%d,%d\n" % (record.database, record.type, encode_key(record.key), 
@@ -80,8 +540,16 @@ class PrintAllKeys():
 class MemoryCallback(RdbCallback):
     '''Calculates the memory used if this rdb file were loaded into RAM
         The memory usage is approximate, and based on heuristics.
+
+        Without a `redis_version`, the heuristics are the ones rdbtools always used. With one, objects have 
+        the layout of that version of Redis, such as the headers of its sds strings, and every allocation is 
+        rounded up to a size class of the `allocator`, one of rdbtools.allocators.ALLOCATORS or an Allocator.
     '''
-    def __init__(self, stream, architecture):
+    wants_batches = True
+    # Compact encodings are sized from their bytes and their largest element, without their elements
+    wants_elements = ELEMENTS_LENGTHS
+
+    def __init__(self, stream, architecture, redis_version = None, allocator = 'jemalloc'):
         self._stream = stream
         self._dbnum = 0
         self._current_size = 0
@@ -93,6 +561,24 @@ class MemoryCallback(RdbCallback):
             self._pointer_size = 8
         elif architecture == 32 or architecture == '32':
             self._pointer_size = 4
+        self._redis_version = None
+        self._allocator = None
+        if redis_version is not None:
+            self._redis_version = parse_redis_version(redis_version)
+            if not isinstance(allocator, Allocator):
+                allocator = get_allocator(allocator, self._pointer_size)
+            self._allocator = allocator
+            self._sds_sizes = [self.sizeof_sds(length) for length in xrange(SDS_TABLE_SIZE)]
+        # The overheads of strings and of the elements of every encoding are the same for every element, 
+        # so that they are computed once, and collections are sized from the lengths of their elements
+        self._string_overhead = 8 + 1 + self.malloc_overhead()
+        self._hash_entry_overhead = self.hashtable_entry_overhead() + 2*self.element_overhead()
+        self._set_entry_overhead = self.hashtable_entry_overhead() + self.element_overhead()
+        self._list_entry_overhead = self.linkedlist_entry_overhead() + self.robj_overhead()
+        # The score of a sorted set member is a double of 8 bytes, in the skiplist node with a Redis version
+        self._zset_entry_overhead = self.skiplist_entry_overhead() + 2*self.element_overhead()
+        if self._redis_version is None:
+            self._zset_entry_overhead += 8
         
     def start_rdb(self):
         pass
@@ -100,6 +586,10 @@ class MemoryCallback(RdbCallback):
     def start_database(self, db_number):
         self._dbnum = db_number
 
+    def merge(self, other):
+        """Reduces the records of a MemoryCallback from a parallel worker into this one's stream"""
+        self._stream.merge(other._stream)
+
     def end_database(self, db_number):
         pass
         
@@ -108,9 +598,7 @@ class MemoryCallback(RdbCallback):
        
     def set(self, key, value, expiry, info):
         self._current_encoding = info['encoding']
-        size = self.sizeof_string(key) + self.sizeof_string(value) + self.top_level_object_overhead()
-        size += 2*self.robj_overhead()
-        size += self.key_expiry_overhead(expiry)
+        size = self.sizeof_top_level(key, expiry) + self.sizeof_string_object(value)
         
         length = element_length(value)
         record = MemoryRecord(self._dbnum, "string", key, size, self._current_encoding, length, length)
@@ -120,13 +608,11 @@ class MemoryCallback(RdbCallback):
     def start_hash(self, key, length, expiry, info):
         self._current_encoding = info['encoding']
         self._current_length = length        
-        size = self.sizeof_string(key)
-        size += 2*self.robj_overhead()
-        size += self.top_level_object_overhead()
-        size += self.key_expiry_overhead(expiry)
+        size = self.sizeof_top_level(key, expiry) + self.robj_overhead()
         
         if 'sizeof_value' in info:
-            size += info['sizeof_value']
+            size += self.sizeof_compact(info['sizeof_value'])
+            self.largest_element(info.get('len_largest_element', 0))
         elif 'encoding' in info and info['encoding'] == 'hashtable':
             size += self.hashtable_overhead(length)
         else:
@@ -134,16 +620,19 @@ class MemoryCallback(RdbCallback):
         self._current_size = size
     
     def hset(self, key, field, value):
-        if(element_length(field) > self._len_largest_element) :
-            self._len_largest_element = element_length(field)
-        if(element_length(value) > self._len_largest_element) :
-            self._len_largest_element = element_length(value)
-        
+        self.largest_element(max(element_length(field), element_length(value)))
+        if self._current_encoding == 'hashtable':
+            self._current_size += self.sizeof_string(field) + self.sizeof_string(value) + self._hash_entry_overhead
+    
+    def hset_many(self, key, pairs):
         if self._current_encoding == 'hashtable':
-            self._current_size += self.sizeof_string(field)
-            self._current_size += self.sizeof_string(value)
-            self._current_size += self.hashtable_entry_overhead()
-            self._current_size += 2*self.robj_overhead()
+            fields, values = zip(*pairs)
+            fields_size, largest_field = self.sizeof_strings(fields)
+            values_size, largest_value = self.sizeof_strings(values)
+            self._current_size += fields_size + values_size + len(pairs) * self._hash_entry_overhead
+            self.largest_element(max(largest_field, largest_value))
+        else:
+            self.largest_element(max(max(element_length(field), element_length(value)) for field, value in pairs))
     
     def end_hash(self, key):
         record = MemoryRecord(self._dbnum, "hash", key, self._current_size, self._current_encoding, self._current_length, self._len_largest_element)
@@ -155,13 +644,17 @@ class MemoryCallback(RdbCallback):
         self.start_hash(key, cardinality, expiry, info)
 
     def sadd(self, key, member):
-        if(element_length(member) > self._len_largest_element) :
-            self._len_largest_element = element_length(member)
-            
+        self.largest_element(element_length(member))
+        if self._current_encoding == 'hashtable':
+            self._current_size += self.sizeof_string(member) + self._set_entry_overhead
+    
+    def sadd_many(self, key, members):
         if self._current_encoding == 'hashtable':
-            self._current_size += self.sizeof_string(member)
-            self._current_size += self.hashtable_entry_overhead()
-            self._current_size += self.robj_overhead()
+            size, largest = self.sizeof_strings(members)
+            self._current_size += size + len(members) * self._set_entry_overhead
+            self.largest_element(largest)
+        else:
+            self.largest_element(max(element_length(member) for member in members))
     
     def end_set(self, key):
         record = MemoryRecord(self._dbnum, "set", key, self._current_size, self._current_encoding, self._current_length, self._len_largest_element)
@@ -171,13 +664,14 @@ class MemoryCallback(RdbCallback):
     def start_list(self, key, length, expiry, info):
         self._current_length = length
         self._current_encoding = info['encoding']
-        size = self.sizeof_string(key)
-        size += 2*self.robj_overhead()
-        size += self.top_level_object_overhead()
-        size += self.key_expiry_overhead(expiry)
+        size = self.sizeof_top_level(key, expiry) + self.robj_overhead()
         
         if 'sizeof_value' in info:
-            size += info['sizeof_value']
+            self.largest_element(info.get('len_largest_element', 0))
+            if info['encoding'] == 'quicklist':
+                size += self.sizeof_nodes(info) + self.quicklist_overhead(info['nodes'])
+            else:
+                size += self.sizeof_compact(info['sizeof_value'])
         elif 'encoding' in info and info['encoding'] == 'linkedlist':
             size += self.linkedlist_overhead()
         else:
@@ -185,13 +679,17 @@ class MemoryCallback(RdbCallback):
         self._current_size = size
             
     def rpush(self, key, value) :
-        if(element_length(value) > self._len_largest_element) :
-            self._len_largest_element = element_length(value)
-        
+        self.largest_element(element_length(value))
         if self._current_encoding == 'linkedlist':
-            self._current_size += self.sizeof_string(value)
-            self._current_size += self.linkedlist_entry_overhead()
-            self._current_size += self.robj_overhead()
+            self._current_size += self.sizeof_string(value) + self._list_entry_overhead
+    
+    def rpush_many(self, key, values):
+        if self._current_encoding == 'linkedlist':
+            size, largest = self.sizeof_strings(values)
+            self._current_size += size + len(values) * self._list_entry_overhead
+            self.largest_element(largest)
+        else:
+            self.largest_element(max(element_length(value) for value in values))
     
     def end_list(self, key):
         record = MemoryRecord(self._dbnum, "list", key, self._current_size, self._current_encoding, self._current_length, self._len_largest_element)
@@ -201,13 +699,11 @@ class MemoryCallback(RdbCallback):
     def start_sorted_set(self, key, length, expiry, info):
         self._current_length = length
         self._current_encoding = info['encoding']
-        size = self.sizeof_string(key)
-        size += 2*self.robj_overhead()
-        size += self.top_level_object_overhead()
-        size += self.key_expiry_overhead(expiry)
+        size = self.sizeof_top_level(key, expiry) + self.robj_overhead()
         
         if 'sizeof_value' in info:
-            size += info['sizeof_value']
+            size += self.sizeof_compact(info['sizeof_value'])
+            self.largest_element(info.get('len_largest_element', 0))
         elif 'encoding' in info and info['encoding'] == 'skiplist':
             size += self.skiplist_overhead(length)
         else:
@@ -215,20 +711,52 @@ class MemoryCallback(RdbCallback):
         self._current_size = size
     
     def zadd(self, key, score, member):
-        if(element_length(member) > self._len_largest_element):
-            self._len_largest_element = element_length(member)
-        
+        self.largest_element(element_length(member))
+        if self._current_encoding == 'skiplist':
+            self._current_size += self.sizeof_string(member) + self._zset_entry_overhead
+    
+    def zadd_many(self, key, pairs):
         if self._current_encoding == 'skiplist':
-            self._current_size += 8 # self.sizeof_string(score)
-            self._current_size += self.sizeof_string(member)
-            self._current_size += 2*self.robj_overhead()
-            self._current_size += self.skiplist_entry_overhead()
+            scores, members = zip(*pairs)
+            size, largest = self.sizeof_strings(members)
+            self._current_size += size + len(pairs) * self._zset_entry_overhead
+            self.largest_element(largest)
+        else:
+            self.largest_element(max(element_length(member) for score, member in pairs))
     
     def end_sorted_set(self, key):
         record = MemoryRecord(self._dbnum, "sortedset", key, self._current_size, self._current_encoding, self._current_length, self._len_largest_element)
         self._stream.next_record(record)
         self.end_key()
         
+    def start_stream(self, key, listpacks_count, expiry, info):
+        self._current_encoding = info['encoding']
+        size = self.sizeof_top_level(key, expiry) + self.robj_overhead()
+        size += self.stream_overhead()
+        self._current_size = size
+    
+    def stream_entries(self, key, entries):
+        lengths = [element_length(x) for entry_id, pairs in entries for pair in pairs for x in pair]
+        if lengths:
+            self.largest_element(max(lengths))
+    
+    def stream_group(self, key, group):
+        self._current_size += self.stream_group_overhead(group)
+    
+    def end_stream(self, key, info):
+        # Every listpack is allocated on its own, and is an element of the radix tree of the stream
+        self._current_size += self.sizeof_nodes(info) + info['nodes']*self.malloc_overhead()
+        self._current_size += self.radix_tree_overhead(info['nodes'])
+        if info['groups']:
+            self._current_size += self.radix_tree_overhead(info['groups'])
+        record = MemoryRecord(self._dbnum, "stream", key, self._current_size, self._current_encoding, info['length'], self._len_largest_element)
+        self._stream.next_record(record)
+        self.end_key()
+    
+    def largest_element(self, length):
+        if length > self._len_largest_element:
+            self._len_largest_element = length
+
     def end_key(self):
         self._current_encoding = None
         self._current_size = 0
@@ -242,15 +770,118 @@ class MemoryCallback(RdbCallback):
         # 1 extra byte is used to store the null character at the end of the string
         # Redis internally stores integers as a long
         #  Integers less than REDIS_SHARED_INTEGERS are stored in a shared memory pool
-        try:
-            num = int(string)
+        # With a Redis version, strings are the sds strings of that version, as the elements of collections are
+        if self._allocator is not None:
+            length = len(string) if type(string) is str else len(str(string))
+            return self._sds_sizes[length] if length < SDS_TABLE_SIZE else self.sizeof_sds(length)
+        num = integer_value(string)
+        if num is not None:
             if num < REDIS_SHARED_INTEGERS :
                 return 0
             else :
                 return 8
-        except ValueError:
-            pass
-        return len(string) + 8 + 1 + self.malloc_overhead()
+        return len(string) + self._string_overhead
+
+    def sizeof_strings(self, strings):
+        '''
+        Returns the total of sizeof_string over `strings`, and the length of the largest one, in a single pass.
+        Only the strings that end with a digit may be integers, and are checked with integer_value
+        '''
+        size = 0
+        largest = 0
+        if self._allocator is not None:
+            sds_sizes = self._sds_sizes
+            for string in strings:
+                if type(string) is str:
+                    length = len(string)
+                    sds_length = length
+                else:
+                    length = element_length(string)
+                    sds_length = len(str(string))
+                size += sds_sizes[sds_length] if sds_length < SDS_TABLE_SIZE else self.sizeof_sds(sds_length)
+                if length > largest:
+                    largest = length
+            return size, largest
+        string_overhead = self._string_overhead
+        for string in strings:
+            if type(string) is str and (not string[-1:].isdigit() or integer_value(string) is None):
+                length = len(string)
+                size += length + string_overhead
+            else:
+                size += self.sizeof_string(string)
+                length = element_length(string)
+            if length > largest:
+                largest = length
+        return size, largest
+
+    def sizeof_sds(self, length):
+        # See sdsReqType in https://github.com/antirez/redis/blob/unstable/src/sds.c
+        # Since Redis 3.2, the header of a string is a byte of type, then its length and its allocated size 
+        # in 1, 2, 4 or 8 bytes each. Strings shorter than 32 bytes have their length in their type byte, 
+        # unless they are empty. Before Redis 3.2, the header was 2 ints
+        if self._redis_version < (3, 2):
+            header = 8
+        elif length < 32:
+            header = 1 if length else 3
+        elif length < 1 << 8:
+            header = 3
+        elif length < 1 << 16:
+            header = 5
+        elif length < 1 << 32:
+            header = 9
+        else:
+            header = 17
+        return self.object_size(header + length + 1)
+
+    def sizeof_key(self, key):
+        # A key is an object and its string, and only its sds string with a Redis version
+        if self._allocator is None:
+            return self.sizeof_string(key) + self.robj_overhead()
+        return self.sizeof_string(key)
+
+    def sizeof_string_object(self, value):
+        # The object of a string value, and its string
+        if self._allocator is None:
+            return self.sizeof_string(value) + self.robj_overhead()
+        # See tryObjectEncoding and createStringObject in https://github.com/antirez/redis/blob/unstable/src/object.c
+        # Integers are shared objects below REDIS_SHARED_INTEGERS, and are stored in the pointer of their object otherwise.
+        # Short strings are embedded in one allocation with their object, since Redis 3.0
+        number = integer_value(value)
+        if number is not None:
+            return 0 if 0 <= number < REDIS_SHARED_INTEGERS else self.robj_overhead()
+        if self._redis_version >= (3, 2) and len(value) <= 44:
+            return self.object_size(self.sizeof_pointer() + 8 + 3 + len(value) + 1)
+        if self._redis_version >= (3, 0) and len(value) <= 39:
+            return self.object_size(self.sizeof_pointer() + 8 + 8 + len(value) + 1)
+        return self.robj_overhead() + self.sizeof_string(value)
+
+    def sizeof_top_level(self, key, expiry):
+        # The key, its entry in the dictionary of the database, and its expiry
+        return self.sizeof_key(key) + self.top_level_object_overhead() + self.key_expiry_overhead(expiry)
+
+    def sizeof_compact(self, size, allocations = 1):
+        # The memory of `allocations` ziplists, listpacks or intsets of `size` bytes in all
+        if self._allocator is None or not allocations:
+            return size
+        return allocations * self.object_size((size + allocations - 1) // allocations)
+
+    def sizeof_nodes(self, info):
+        # The ziplists or listpacks of the nodes of a quicklist or a stream, each allocated on its own
+        if self._allocator is not None and 'sizeof_nodes' in info:
+            return sum(self.object_size(size) for size in info['sizeof_nodes'])
+        return self.sizeof_compact(info['sizeof_value'], info['nodes'])
+
+    def element_overhead(self):
+        # The elements of hashes, sets and sorted sets are objects, and plain sds strings since Redis 4.0
+        if self._redis_version is not None and self._redis_version >= (4, 0):
+            return 0
+        return self.robj_overhead()
+
+    def object_size(self, size):
+        # A structure of `size` bytes, which the allocator rounds up with a Redis version
+        if self._allocator is None:
+            return size
+        return self._allocator.allocated(size)
 
     def top_level_object_overhead(self):
         # Each top level object is an entry in a dictionary, and so we have to include 
@@ -262,7 +893,9 @@ class MemoryCallback(RdbCallback):
         if not expiry:
             return 0
         # Key expiry is stored in a hashtable, so we have to pay for the cost of a hashtable entry
-        # The timestamp itself is stored as an int64, which is a 8 bytes
+        # The timestamp itself is stored as an int64, which is a 8 bytes, in the value of the entry with a Redis version
+        if self._allocator is not None:
+            return self.hashtable_entry_overhead()
         return self.hashtable_entry_overhead() + 8
         
     def hashtable_overhead(self, size):
@@ -276,33 +909,101 @@ class MemoryCallback(RdbCallback):
         # When the hashtable is rehashing, another instance of **table is created
         # We are assuming 0.5 percent probability of rehashing, and so multiply 
         # the size of **table by 1.5
+        #
+        # With a Redis version, the table is the first power of 2 of 4 at least that holds every element.
+        # The dict struct holds 2 tables and their sizes since Redis 7.0, and 2 dictht structs before
+        if self._allocator is not None:
+            if self._redis_version >= (7, 0):
+                dict_size = 6*self.sizeof_pointer() + 8
+            else:
+                dict_size = 12*self.sizeof_pointer()
+            table = 4
+            while table < size:
+                table <<= 1
+            return self.object_size(dict_size) + self.object_size(table*self.sizeof_pointer())
         return 56 + 4*self.sizeof_pointer() + self.next_power(size)*self.sizeof_pointer()*1.5
         
     def hashtable_entry_overhead(self):
         # See  https://github.com/antirez/redis/blob/unstable/src/dict.h
         # Each dictEntry has 3 pointers 
-        return 3*self.sizeof_pointer()
+        return self.object_size(3*self.sizeof_pointer())
     
     def linkedlist_overhead(self):
         # See https://github.com/antirez/redis/blob/unstable/src/adlist.h
         # A list has 5 pointers + an unsigned long
-        return 8 + 5*self.sizeof_pointer()
+        return self.object_size(8 + 5*self.sizeof_pointer())
     
     def linkedlist_entry_overhead(self):
         # See https://github.com/antirez/redis/blob/unstable/src/adlist.h
         # A node has 3 pointers
-        return 3*self.sizeof_pointer()
+        return self.object_size(3*self.sizeof_pointer())
+    
+    def quicklist_overhead(self, nodes):
+        # See https://github.com/antirez/redis/blob/unstable/src/quicklist.h
+        # A quicklist has 2 pointers, 2 unsigned longs and 2 ints.
+        # A node has 3 pointers and 2 ints, and is allocated on its own like its ziplist or listpack
+        if self._allocator is not None:
+            return self.object_size(2*self.sizeof_pointer() + 2*self.size_t() + 8) + nodes*self.object_size(3*self.sizeof_pointer() + 8)
+        return 2*self.sizeof_pointer() + 2*self.size_t() + 8 + nodes*(3*self.sizeof_pointer() + 8 + 2*self.malloc_overhead())
+    
+    def stream_overhead(self):
+        # See struct stream in https://github.com/antirez/redis/blob/unstable/src/stream.h
+        # A stream has 2 pointers (the radix trees of the listpacks and of the consumer groups), 
+        # 2 unsigned longs (length and entries added) and 3 stream IDs of 16 bytes
+        return self.object_size(2*self.sizeof_pointer() + 16 + 3*16)
+    
+    def stream_group_overhead(self, group):
+        # See streamCG, streamNACK and streamConsumer in https://github.com/antirez/redis/blob/unstable/src/stream.h
+        # A group has a stream ID, a long long and 2 pointers (its pending entries and its consumers).
+        # A pending entry is a NACK of 2 long longs and a pointer, in the radix tree of the group. 
+        # The radix tree of a consumer points to the NACKs of the group, which are not counted twice.
+        # A consumer has 2 long longs, and 2 pointers (its name and its pending entries)
+        size = 16 + 8 + 2*self.sizeof_pointer() + self.sizeof_string(group.name)
+        size += self.radix_tree_overhead(len(group.pending))
+        size += len(group.pending)*self.object_size(16 + self.sizeof_pointer() + self.malloc_overhead())
+        for consumer in group.consumers:
+            size += 16 + 2*self.sizeof_pointer() + self.sizeof_string(consumer.name)
+            size += self.radix_tree_overhead(len(consumer.pending))
+        return size
+    
+    def radix_tree_overhead(self, elements):
+        # See streamRadixTreeMemoryUsage in https://github.com/antirez/redis/blob/unstable/src/object.c
+        # A rax has a pointer and 2 unsigned longs. Redis counts 16 bytes per element (stream IDs are the keys), 
+        # and a 4 bytes header and 30 longs of children pointers and padding per node.
+        # The number of nodes is not in the dump : it is assumed to be 2.5 times the number of elements
+        nodes = int(elements * 2.5)
+        return self.sizeof_pointer() + 2*self.size_t() + 16*elements + nodes*(4 + 30*self.sizeof_pointer())
     
     def skiplist_overhead(self, size):
+        if self._allocator is not None:
+            # See t_zset.c : a zset points to a dict and a zskiplist, which has a header node of ZSKIPLIST_MAXLEVEL levels
+            return (self.object_size(2*self.sizeof_pointer()) + self.object_size(4*self.sizeof_pointer()) + 
+                    self.skiplist_node_overhead(ZSKIPLIST_MAXLEVEL) + self.hashtable_overhead(size))
         return 2*self.sizeof_pointer() + self.hashtable_overhead(size) + (2*self.sizeof_pointer() + 16)
     
     def skiplist_entry_overhead(self):
-        return self.hashtable_entry_overhead() + 2*self.sizeof_pointer() + 8 + (self.sizeof_pointer() + 8) * self.zset_random_level()
+        if self._allocator is not None:
+            # The size of a node of each level, weighted by the probability of that level
+            expected = 0.0
+            for level in xrange(1, ZSKIPLIST_MAXLEVEL + 1):
+                probability = ZSKIPLIST_P ** (level - 1)
+                if level < ZSKIPLIST_MAXLEVEL:
+                    probability *= 1 - ZSKIPLIST_P
+                expected += probability * self.skiplist_node_overhead(level)
+            return self.hashtable_entry_overhead() + expected
+        return self.hashtable_entry_overhead() + 2*self.sizeof_pointer() + 8 + (self.sizeof_pointer() + 8) * self.zset_expected_level()
+
+    def skiplist_node_overhead(self, levels):
+        # A node has its element, its score, a backward pointer, and a forward pointer and a span for every level
+        return self.object_size(2*self.sizeof_pointer() + 8 + levels*2*self.sizeof_pointer())
     
     def robj_overhead(self):
-        return self.sizeof_pointer() + 8
+        return self.object_size(self.sizeof_pointer() + 8)
         
     def malloc_overhead(self):
+        # With a Redis version, the allocator rounds allocations up instead
+        if self._allocator is not None:
+            return 0
         return self.size_t()
 
     def size_t(self):
@@ -317,23 +1018,13 @@ class MemoryCallback(RdbCallback):
             power = power << 1
         return power
  
-    def zset_random_level(self):
-        level = 1
-        rint = random.randint(0, 0xFFFF)
-        while (rint < ZSKIPLIST_P * 0xFFFF):
-            level += 1
-            rint = random.randint(0, 0xFFFF)        
-        if level < ZSKIPLIST_MAXLEVEL :
-            return level
-        else:
-            return ZSKIPLIST_MAXLEVEL
+    def zset_expected_level(self):
+        # See zslRandomLevel in https://github.com/antirez/redis/blob/unstable/src/t_zset.c
+        # A node has one level, and one more with a probability ZSKIPLIST_P for each level up to ZSKIPLIST_MAXLEVEL. 
+        # Its expected level is the sum of the probabilities of having more than k levels, for k below ZSKIPLIST_MAXLEVEL.
+        # Sizing every node with it, rather than with a random level, gives the same sizes on every run
+        return (1 - ZSKIPLIST_P ** ZSKIPLIST_MAXLEVEL) / (1 - ZSKIPLIST_P)
         
 
-def element_length(element):
-    if isinstance(element, int):
-        return 8
-    if isinstance(element, long):
-        return 16
-    else:
-        return len(element)
+
     
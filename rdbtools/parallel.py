@@ -0,0 +1,140 @@
+import os
+import shutil
+import tempfile
+import multiprocessing
+
+from rdbtools.parser import RdbParser, open_reader
+from rdbtools.filters import compile_filters
+
+class ParallelRdbParser(object):
+    """
+    Parses a single dump file with a pool of processes.
+
+    The dump is parsed in two phases. First, a scan walks the keys without decoding
+    any value, and splits the file into chunks of consecutive keys. Then a pool of
+    worker processes parses the chunks, each with its own callback.
+
+    `callback` receives `start_rdb` in this process, and the results of the workers.
+    `callback_factory(out)` creates the callback of a worker. It is called in the
+    worker processes, so it must be picklable (e.g. a class or a module level function)
+
+    The results of the workers are merged in one of two ways :
+     1. When `parse` is given an output file, every worker writes its chunk to a
+        temporary file, and these files are appended to the output in order.
+        This is how JSONCallback, DiffCallback and ProtocolCallback are parallelized.
+     2. Otherwise, the worker callbacks are pickled back to this process, and
+        reduced into `callback` by calling `callback.merge(worker_callback)`, in order.
+        This is how MemoryCallback with a StatsAggregator is parallelized.
+
+    Typical usage :
+        parser = ParallelRdbParser(JSONCallback(out), JSONCallback, processes = 8)
+        parser.parse('/var/redis/6379/dump.rdb', out)
+
+    `filters` and `verify_checksum` are the same as for `RdbParser`. The checksum is verified by 
+    the scan, before any chunk is parsed. Callbacks that want raw bytes are not supported.
+    """
+    def __init__(self, callback, callback_factory, filters = None, processes = None, chunk_size = None, 
+                 verify_checksum = False) :
+        """
+            `processes` defaults to the number of cpus
+            `chunk_size` is the approximate number of bytes parsed by a worker at a time.
+                         It defaults to a quarter of the file size per process
+        """
+        if getattr(callback, 'wants_raw_bytes', False):
+            raise Exception('ParallelRdbParser', 'Callbacks that want raw bytes cannot be parsed in parallel')
+        self._callback = callback
+        self._callback_factory = callback_factory
+        self._filters = compile_filters(filters)
+        self._processes = processes or multiprocessing.cpu_count()
+        self._chunk_size = chunk_size
+        self._verify_checksum = verify_checksum
+
+    def parse(self, filename, out = None):
+        chunk_size = self._chunk_size
+        if not chunk_size:
+            chunk_size = max(os.path.getsize(filename) // (4 * self._processes), 1)
+        chunks = self.split(filename, chunk_size)
+
+        self._callback.start_rdb()
+        tmpdir = None
+        if out is not None:
+            tmpdir = tempfile.mkdtemp(prefix = 'rdbtools')
+        tasks = [(filename, chunk, self._callback_factory, tmpdir) for chunk in chunks]
+        # Filters can hold millions of keys, so they are sent once to each worker rather than with every task
+        pool = multiprocessing.Pool(self._processes, init_worker, (self._filters, ))
+        try:
+            for result in pool.imap(parse_chunk, tasks):
+                if out is not None:
+                    with open(result, 'rb') as chunk_out:
+                        shutil.copyfileobj(chunk_out, out)
+                    os.remove(result)
+                else:
+                    self._callback.merge(result)
+            pool.close()
+        finally:
+            pool.terminate()
+            if tmpdir is not None:
+                shutil.rmtree(tmpdir, ignore_errors = True)
+        if out is None:
+            self._callback.end_rdb()
+
+    def split(self, filename, chunk_size):
+        """
+        Scans the dump and returns the chunks to parse as tuples (start, end, db_number, first_key).
+        `end` is None for the last chunk. See `RdbCallback.resume_database` for `first_key`.
+        """
+        parser = RdbParser(None, self._filters, verify_checksum = self._verify_checksum)
+        chunks = []
+        chunk_start, chunk_db, chunk_first_key = None, None, True
+        current_db, first_key = None, True
+        with open(filename, "rb") as fp:
+            f = open_reader(fp)
+            try:
+                for entry in parser.scan_keys(f):
+                    if chunk_start is None:
+                        # The first chunk starts right after the header
+                        chunk_start = 9
+                    if entry.database != current_db:
+                        current_db, first_key = entry.database, True
+                    if entry.offset - chunk_start >= chunk_size:
+                        chunks.append((chunk_start, entry.offset, chunk_db, chunk_first_key))
+                        chunk_start, chunk_db, chunk_first_key = entry.offset, current_db, first_key
+                    if first_key and parser.matches_filter(entry.database, entry.key, entry.data_type):
+                        first_key = False
+            finally:
+                f.close()
+        chunks.append((chunk_start or 9, None, chunk_db, chunk_first_key))
+        return chunks
+
+_worker_filters = None
+
+def init_worker(filters):
+    global _worker_filters
+    _worker_filters = filters
+
+def parse_chunk(task):
+    """Parses one chunk in a worker process. Returns the name of its output file, or its callback"""
+    filename, (start, end, db_number, first_key), callback_factory, tmpdir = task
+    filters = _worker_filters
+    out = None
+    if tmpdir is not None:
+        fd, out_name = tempfile.mkstemp(dir = tmpdir)
+        out = os.fdopen(fd, 'wb')
+    try:
+        callback = callback_factory(out)
+        parser = RdbParser(callback, filters)
+        with open(filename, "rb") as fp:
+            f = open_reader(fp)
+            try:
+                f.seek(start)
+                if db_number is not None:
+                    callback.resume_database(db_number, first_key)
+                parser.read_entries(f, end, db_number)
+            finally:
+                f.close()
+    finally:
+        if out is not None:
+            out.close()
+    if out is not None:
+        return out_name
+    return callback
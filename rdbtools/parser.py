@@ -1,19 +1,50 @@
 import struct
-import io
+import mmap
 import sys
 import datetime
 import re
+import os
+import stat
+import gzip
+from collections import namedtuple
+from contextlib import contextmanager
+
+from rdbtools.filters import as_prefix_set, as_key_set, KeySample
+from rdbtools.crc64 import crc64
+from rdbtools.progress import StatsCallback
 
 try :
-    from StringIO import StringIO
-except ImportError:
-    from io import StringIO
-    
+    import lzf
+    HAS_PYTHON_LZF = True
+except ImportError :
+    HAS_PYTHON_LZF = False
+
+try :
+    import zstandard
+    HAS_ZSTANDARD = True
+except ImportError :
+    HAS_ZSTANDARD = False
+
+try :
+    import lz4.frame
+    HAS_LZ4 = True
+except ImportError :
+    HAS_LZ4 = False
+
 REDIS_RDB_6BITLEN = 0
 REDIS_RDB_14BITLEN = 1
 REDIS_RDB_32BITLEN = 2
 REDIS_RDB_ENCVAL = 3
+# Lengths above 32 bits (RDB version 9) : the whole first byte is 0x81, and is followed by a 64 bit length
+REDIS_RDB_64BITLEN = 0x81
 
+REDIS_RDB_OPCODE_FUNCTION2 = 245
+REDIS_RDB_OPCODE_FUNCTION_PRE_GA = 246
+REDIS_RDB_OPCODE_MODULE_AUX = 247
+REDIS_RDB_OPCODE_IDLE = 248
+REDIS_RDB_OPCODE_FREQ = 249
+REDIS_RDB_OPCODE_AUX = 250
+REDIS_RDB_OPCODE_RESIZEDB = 251
 REDIS_RDB_OPCODE_EXPIRETIME_MS = 252
 REDIS_RDB_OPCODE_EXPIRETIME = 253
 REDIS_RDB_OPCODE_SELECTDB = 254
@@ -24,27 +55,164 @@ REDIS_RDB_TYPE_LIST = 1
 REDIS_RDB_TYPE_SET = 2
 REDIS_RDB_TYPE_ZSET = 3
 REDIS_RDB_TYPE_HASH = 4
+REDIS_RDB_TYPE_ZSET_2 = 5
+REDIS_RDB_TYPE_MODULE = 6
+REDIS_RDB_TYPE_MODULE_2 = 7
 REDIS_RDB_TYPE_HASH_ZIPMAP = 9
 REDIS_RDB_TYPE_LIST_ZIPLIST = 10
 REDIS_RDB_TYPE_SET_INTSET = 11
 REDIS_RDB_TYPE_ZSET_ZIPLIST = 12
 REDIS_RDB_TYPE_HASH_ZIPLIST = 13
+REDIS_RDB_TYPE_LIST_QUICKLIST = 14
+REDIS_RDB_TYPE_STREAM_LISTPACKS = 15
+REDIS_RDB_TYPE_HASH_LISTPACK = 16
+REDIS_RDB_TYPE_ZSET_LISTPACK = 17
+REDIS_RDB_TYPE_LIST_QUICKLIST_2 = 18
+REDIS_RDB_TYPE_STREAM_LISTPACKS_2 = 19
+REDIS_RDB_TYPE_SET_LISTPACK = 20
+REDIS_RDB_TYPE_STREAM_LISTPACKS_3 = 21
+
+# Containers of the nodes of a REDIS_RDB_TYPE_LIST_QUICKLIST_2 : a single element, or a listpack
+QUICKLIST_NODE_CONTAINER_PLAIN = 1
+QUICKLIST_NODE_CONTAINER_PACKED = 2
+
+# Flags of the entries in the listpacks of a stream
+STREAM_ITEM_FLAG_DELETED = 1
+STREAM_ITEM_FLAG_SAMEFIELDS = 2
+
+# Opcodes of the values written by modules
+REDIS_RDB_MODULE_OPCODE_EOF = 0
+REDIS_RDB_MODULE_OPCODE_SINT = 1
+REDIS_RDB_MODULE_OPCODE_UINT = 2
+REDIS_RDB_MODULE_OPCODE_FLOAT = 3
+REDIS_RDB_MODULE_OPCODE_DOUBLE = 4
+REDIS_RDB_MODULE_OPCODE_STRING = 5
+
+REDIS_RDB_MIN_VERSION = 1
+REDIS_RDB_MAX_VERSION = 11
+# Dumps end with a CRC64 of everything before it since this version
+REDIS_RDB_CHECKSUM_VERSION = 5
+
+# Number of bytes folded into a checksum at once
+CHECKSUM_BLOCK_SIZE = 1 << 20
 
 REDIS_RDB_ENC_INT8 = 0
 REDIS_RDB_ENC_INT16 = 1
 REDIS_RDB_ENC_INT32 = 2
 REDIS_RDB_ENC_LZF = 3
 
+# A key found by RdbParser.scan_keys. `offset` is where the entry starts (including the expiry), 
+# and `length` is the number of bytes it takes in the dump
+KeyEntry = namedtuple('KeyEntry', ['database', 'offset', 'data_type', 'key', 'expiry', 'length'])
+
+# A key yielded by RdbParser.iter_records. `data_type` is the logical type ("string", "hash" ...), 
+# and `length` the number of elements (1 for a string). `value` is the value of a string, and otherwise 
+# the elements : values of a list or a set, (member, score) of a sorted set, (field, value) of a hash, 
+# (entry_id, [(field, value), ...]) of a stream
+KeyRecord = namedtuple('KeyRecord', ['database', 'key', 'data_type', 'encoding', 'expiry', 'length', 'value'])
+
+# The metadata of a dump, returned by RdbParser.summarize. `aux` are the (field, value) AUX fields, 
+# in order, and `databases` the `DatabaseSummary` of every database
+DumpSummary = namedtuple('DumpSummary', ['version', 'aux', 'databases'])
+
+# The number of keys of a database, and of keys with an expiry
+DatabaseSummary = namedtuple('DatabaseSummary', ['database', 'keys', 'expires'])
+
+# A consumer group of a stream, passed to RdbCallback.stream_group. IDs are strings such as "1526919030474-55". 
+# `entries_read` is None before RDB version 10. `pending` are the `StreamPendingEntry` of the group, 
+# and `consumers` its `StreamConsumer`
+StreamGroup = namedtuple('StreamGroup', ['name', 'last_id', 'entries_read', 'pending', 'consumers'])
+
+# An entry delivered to a consumer of a group, but not acknowledged yet. `delivery_time` is a `datetime`
+StreamPendingEntry = namedtuple('StreamPendingEntry', ['id', 'delivery_time', 'delivery_count'])
+
+# A consumer of a group. `pending` are the IDs of its pending entries. `active_time` is None before RDB version 11, 
+# or when the consumer never read an entry
+StreamConsumer = namedtuple('StreamConsumer', ['name', 'seen_time', 'active_time', 'pending'])
+
+# A stream ID, as it is stored in the keys of the radix tree of a stream and in the pending entries
+_stream_id = struct.Struct('>QQ')
+
+# The header of an intset : the size of an entry, and the number of entries
+_intset_header = struct.Struct('<II')
+
+# struct formats of the entries of an intset, by size of an entry. Entries are signed
+INTSET_FORMATS = {2 : 'h', 4 : 'i', 8 : 'q'}
+
 DATA_TYPE_MAPPING = {
-    0 : "string", 1 : "list", 2 : "set", 3 : "sortedset", 4 : "hash", 
-    9 : "hash", 10 : "list", 11 : "set", 12 : "sortedset", 13 : "hash"}
+    0 : "string", 1 : "list", 2 : "set", 3 : "sortedset", 4 : "hash", 5 : "sortedset", 
+    9 : "hash", 10 : "list", 11 : "set", 12 : "sortedset", 13 : "hash", 14 : "list", 15 : "stream", 
+    16 : "hash", 17 : "sortedset", 18 : "list", 19 : "stream", 20 : "set", 21 : "stream"}
+
+ENCODING_MAPPING = {
+    0 : "string", 1 : "linkedlist", 2 : "hashtable", 3 : "skiplist", 4 : "hashtable", 5 : "skiplist", 
+    9 : "zipmap", 10 : "ziplist", 11 : "intset", 12 : "ziplist", 13 : "ziplist", 14 : "quicklist", 15 : "stream", 
+    16 : "listpack", 17 : "listpack", 18 : "quicklist", 19 : "stream", 20 : "listpack", 21 : "stream"}
+
+# Encodings of the types whose elements iter_records can decode lazily
+LAZY_ENCODINGS = dict((data_type, ENCODING_MAPPING[data_type]) for data_type in (1, 2, 3, 4, 5))
+
+# Types of streams, by RDB version (9, 10 and 11)
+STREAM_TYPES = frozenset([REDIS_RDB_TYPE_STREAM_LISTPACKS, REDIS_RDB_TYPE_STREAM_LISTPACKS_2, REDIS_RDB_TYPE_STREAM_LISTPACKS_3])
+
+# Sizes of the integers of listpacks, after the header of their entry
+LISTPACK_INT_SIZES = {0xF1 : 2, 0xF2 : 3, 0xF3 : 4, 0xF4 : 8}
+
+# The length of an integer element, see element_length
+INTEGER_LENGTH = 8
+
+# Element events a callback consumes, see RdbCallback.wants_elements
+ELEMENTS_VALUES = 'values'
+ELEMENTS_LENGTHS = 'lengths'
+ELEMENTS_NONE = 'none'
+
+# Callback methods around the elements of a collection, by type
+COLLECTION_CALLBACKS = {
+    'list' : ('start_list', 'end_list'), 'set' : ('start_set', 'end_set'), 
+    'sortedset' : ('start_sorted_set', 'end_sorted_set'), 'hash' : ('start_hash', 'end_hash')}
+
+# Opcodes that hold metadata about the dump or a database, between keys
+METADATA_OPCODES = frozenset([REDIS_RDB_OPCODE_AUX, REDIS_RDB_OPCODE_RESIZEDB, REDIS_RDB_OPCODE_MODULE_AUX, 
+                              REDIS_RDB_OPCODE_FUNCTION2, REDIS_RDB_OPCODE_FUNCTION_PRE_GA])
 
 class RdbCallback:
     """
     A Callback to handle events as the Redis dump file is parsed.
     This callback provides a serial and fast access to the dump file.
     
+    Callbacks that need the raw serialized bytes of each object (for instance, to 
+    write them back to a new dump file) set `wants_raw_bytes` to True. The parser then
+    adds 'orig_*' entries to `info`, and passes an extra `info` argument to 
+    `start_database`, `end_database`, `hset`, `sadd`, `rpush` and `zadd`. 
+    See `WriteRdbCallback`. Capturing the raw bytes has a cost, so it is off by default.
+    
+    Callbacks that set `wants_batches` to True receive the elements of a collection in 
+    batches, through `hset_many`, `sadd_many`, `rpush_many` and `zadd_many`, instead of one 
+    call to `hset`, `sadd`, `rpush` or `zadd` per element. Compactly encoded collections 
+    (ziplists, intsets and zipmaps) are delivered in a single batch, and the others in batches
+    of at most `batch_size` elements. A batch is never empty. Batches are not used when 
+    `wants_raw_bytes` is set.
+    
+    When the server evicts keys with an LRU or LFU policy (RDB version 9), `info` also has the 
+    'idle' time in seconds or the 'freq' counter of the key.
+    
+    Callbacks that do not consume every element set `wants_elements`, and the parser skips 
+    the decoding of what they do not consume :
+    - `ELEMENTS_VALUES` (the default) : every element is decoded and passed to the callback.
+    - `ELEMENTS_LENGTHS` : the elements of compactly encoded collections (ziplists, listpacks, 
+      intsets, zipmaps and quicklists) are not passed. Instead, `info` has the length of their 
+      largest element in 'len_largest_element', read from the headers of the entries (8 for 
+      an integer). Other collections and streams still pass every element.
+    - `ELEMENTS_NONE` : no element is passed, nor the entries of streams. Only the start_* and 
+      end_* methods of collections are called, with the number of elements.
+    `wants_elements` is ignored when `wants_raw_bytes` is set.
+    
     """
+    wants_raw_bytes = False
+    wants_batches = False
+    batch_size = 1024
+    wants_elements = ELEMENTS_VALUES
+    
     def start_rdb(self):
         """
         Called once we know we are dealing with a valid redis dump file
@@ -64,6 +232,23 @@ class RdbCallback:
         """     
         pass
     
+    def aux_field(self, key, value):
+        """
+        Called for every auxiliary field of the dump (RDB version 7), such as 'redis-ver', 
+        'redis-bits', 'ctime', 'used-mem' or 'aof-base'. They are before the first database.
+        
+        """
+        pass
+    
+    def db_size(self, db_size, expires_size):
+        """
+        Called after `start_database` when the dump has the sizes of the database (RDB version 7)
+        
+        `db_size` is the number of keys in the database, and `expires_size` the number of keys with an expiry
+        
+        """
+        pass
+    
     def set(self, key, value, expiry, info):
         """
         Callback to handle a key with a string value and an optional expiry
@@ -159,6 +344,8 @@ class RdbCallback:
         After that, the `end_list` method will be called to indicate the end of the list
         
         Note : This callback handles both Zip Lists and Linked Lists.
+        The `info` of a quicklist has its number of 'nodes', the number of bytes of all of them in 
+        'sizeof_value', and the number of bytes of each one in 'sizeof_nodes'.
         
         """
         pass
@@ -220,6 +407,107 @@ class RdbCallback:
         """
         pass
     
+    def start_stream(self, key, listpacks_count, expiry, info):
+        """
+        Callback to handle the start of a stream
+        
+        `key` is the redis key for this stream
+        `listpacks_count` is the number of listpacks that hold the entries of this stream
+        `expiry` is a `datetime` object. None means the object does not expire
+        `info` is a dictionary containing additional information about this object.
+        
+        After `start_stream`, the method `stream_entries` will be called once for every listpack 
+        that holds entries, and `stream_group` once for every consumer group. 
+        After that, the `end_stream` method will be called to indicate the end of this stream
+        
+        """
+        pass
+    
+    def stream_entries(self, key, entries):
+        """
+        Callback to insert the entries of a listpack into this stream
+        
+        `entries` is a list of (entry_id, pairs) tuples, in order. `entry_id` is a string such as 
+        "1526919030474-55", and `pairs` is the list of (field, value) tuples of the entry. 
+        Deleted entries are not included.
+        
+        """
+        pass
+    
+    def stream_group(self, key, group):
+        """
+        Callback to add a consumer group to this stream
+        
+        `group` is a `StreamGroup`, with its pending entries and its consumers
+        
+        """
+        pass
+    
+    def end_stream(self, key, info):
+        """
+        Called when there are no more entries and groups in this stream
+        
+        `info` is a dictionary with the metadata of the stream : 'length' (the number of entries), 
+        'last_id', 'first_id', 'max_deleted_entry_id', 'entries_added' (None before RDB version 10), 
+        'groups' (the number of consumer groups), 'nodes' (the number of listpacks), 'sizeof_value' 
+        (the number of bytes of the listpacks) and 'sizeof_nodes' (the number of bytes of each listpack)
+        
+        """
+        pass
+    
+    def hset_many(self, key, pairs):
+        """
+        Callback to insert a batch of fields in an existing hash, when `wants_batches` is set
+        
+        `pairs` is a list of (field, value) tuples. The default implementation calls `hset` for each.
+        
+        """
+        for field, value in pairs :
+            self.hset(key, field, value)
+    
+    def sadd_many(self, key, members):
+        """
+        Callback to insert a list of `members` in an existing set, when `wants_batches` is set
+        
+        The default implementation calls `sadd` for each member.
+        
+        """
+        for member in members :
+            self.sadd(key, member)
+    
+    def rpush_many(self, key, values):
+        """
+        Callback to append a list of `values` to an existing list, when `wants_batches` is set
+        
+        The default implementation calls `rpush` for each value.
+        
+        """
+        for value in values :
+            self.rpush(key, value)
+    
+    def zadd_many(self, key, pairs):
+        """
+        Callback to insert a batch of members in an existing sorted set, when `wants_batches` is set
+        
+        `pairs` is a list of (score, member) tuples, in order. The default implementation calls `zadd` for each.
+        
+        """
+        for score, member in pairs :
+            self.zadd(key, score, member)
+    
+    def resume_database(self, db_number, first_key):
+        """
+        Called instead of `start_database` when parsing resumes in the middle of 
+        database `db_number`, i.e. in the workers of a `ParallelRdbParser`
+        
+        `first_key` is False if keys of this database have already been reported
+        to another callback, before the point where parsing resumes.
+        
+        The default implementation calls `start_database`.
+        
+        """
+        self.start_database(db_number)
+    
     def end_database(self, db_number):
         """
         Called when the current database ends
@@ -236,6 +524,7 @@ class RdbCallback:
         """Called to indicate we have completed parsing of the dump file"""
         pass
 
+
 class RdbParser :
     """
     A Parser for Redis RDB Files
@@ -254,221 +543,590 @@ class RdbParser :
         
         If filter is None, results will not be filtered
         If dbs, keys or types is None or Empty, no filtering will be done on that axis
+        
+        Large sets of keys are filtered with these keys, which take any iterable of strings :
+            "prefixes" : only keys that start with one of these prefixes
+            "exclude_prefixes" : no key that starts with one of these prefixes
+            "exact_keys" : only these keys
+            "exclude_keys" : none of these keys
+        See `rdbtools.filters.read_key_file` to load them from a file with one key per line.
+
+        "sample" : a rate in ]0, 1] of the keys, chosen by a hash of their name (see `rdbtools.filters.KeySample`). 
+        The other keys are skipped without being decoded.
 
     ## mi add ##
     ignore is a list with the following items
         ["real_value", "real_field"]
     ############
+
+    With `verify_checksum = True`, the CRC64 at the end of dumps of RDB version 5 and later is verified 
+    when the end of the dump is reached, and an Exception is raised if it does not match. 
+    Install crcmod to compute it at the speed of the disk (see `rdbtools.crc64`).
     """
-    def __init__(self, callback, filters = None, ignore = None) :
+    def __init__(self, callback, filters = None, ignore = None, verify_checksum = False, stats = None, profile = None) :
         """
             `callback` is the object that will receive parse events
+            `stats` is a `rdbtools.progress.ParseStats`, that counts what `parse` reads 
+                    and reports its progress
+            `profile` is a `rdbtools.profiling.ParseProfile`, that times the decoders and the callback
         """
+        self._stats = stats
+        if stats is not None :
+            callback = StatsCallback(callback, stats)
+        self._profile = profile
+        if profile is not None :
+            callback = profile.wrap_callback(callback)
+            profile.wrap_parser(self, dict((data_type, '%s %s' % (DATA_TYPE_MAPPING[data_type], encoding)) 
+                                           for data_type, encoding in ENCODING_MAPPING.iteritems()))
         self._callback = callback
+        self._verify_checksum = verify_checksum
+        self._rdb_version = None
         self._key = None
         self._expiry = None
+        self._orig_key = None
+        self._orig_expiry = None
+        self._orig_data_type = None
+        self._eviction_info = None
+        self._raw_bytes = getattr(callback, 'wants_raw_bytes', False)
+        self._batches = getattr(callback, 'wants_batches', False) and not self._raw_bytes
+        self._batch_size = getattr(callback, 'batch_size', RdbCallback.batch_size)
+        self._elements = ELEMENTS_VALUES if self._raw_bytes else getattr(callback, 'wants_elements', ELEMENTS_VALUES)
         self.init_filter(filters)
         self.init_ignore(ignore)
 
-    def parse(self, filename):
+    def parse(self, filename, use_mmap = True):
         """
         Parse a redis rdb dump file, and call methods in the 
         callback object during the parsing operation.
+        
+        `filename` can also be '-' for standard input, or a file object. Files ending 
+        with .gz, .zst or .lz4 are decompressed as they are parsed (see `open_dump`).
+        
+        By default a dump file is memory mapped and decoded in place (see `MmapReader`).
+        Pass `use_mmap = False` to read it through the file object instead. Streams are 
+        read through a large buffer, and never seeked (see `StreamReader`).
+        """
+        with dump_reader(filename, use_mmap, self._raw_bytes, self._verify_checksum) as f:
+            self.read_rdb(f)
+
+    def parse_entries(self, filename, entries, use_mmap = True):
         """
-        with open(filename, "rb") as f:
+        Parse only the keys at `entries` in a redis rdb dump file, without reading the rest of the dump.
+        `entries` are `KeyEntry` tuples, as returned by `scan_keys` or by a `RdbIndex` lookup.
+
+        The callback receives the same events as for `parse`, restricted to these keys.
+        `filename` is as for `parse`; on a stream, the keys in between are read and discarded.
+        Callbacks that want raw bytes are not supported.
+        """
+        if self._raw_bytes :
+            raise Exception('parse_entries', 'Callbacks that want raw bytes cannot parse single entries')
+        with dump_reader(filename, use_mmap) as f:
             self.verify_magic_string(f.read(5))
             self.verify_version(f.read(4))
             self._callback.start_rdb()
+            db_number = None
+            # Entries are read in the order of the file, so a stream only seeks forward
+            for entry in sorted(entries, key = lambda e: e.offset) :
+                if entry.database != db_number :
+                    if db_number is not None :
+                        self._callback.end_database(db_number)
+                    db_number = entry.database
+                    self._callback.start_database(db_number)
+                f.seek(entry.offset)
+                self.read_entries(f, entry.offset + entry.length, db_number)
+            if db_number is not None :
+                self._callback.end_database(db_number)
+            self._callback.end_rdb()
+
+    def read_rdb(self, f):
+        """
+        Parse a complete dump from the reader `f`, which is positioned at the magic string.
+        `f` is a `FileReader`, `BufferReader` or anything else with the same interface.
+        """
+        if self._stats is not None :
+            self._stats.start(f)
+        if self._profile is not None :
+            self._profile.start()
+        self.verify_magic_string(f.read(5))
+        self.verify_version(f.read(4))
+        self._callback.start_rdb()
+        self.read_entries(f)
+        if self._stats is not None :
+            if self._rdb_version >= REDIS_RDB_CHECKSUM_VERSION and not self._verify_checksum :
+                # The checksum is the last part of the dump
+                f.skip(8)
+            self._stats.finish()
+        if self._profile is not None :
+            self._profile.finish()
+
+    def read_entries(self, f, end = None, db_number = None):
+        """
+        Reads keys and opcodes from `f` until the end of the dump, or until 
+        the offset `end` when it is given. `end` must be the offset of an entry.
+        
+        `db_number` is the database in effect at the current position, 
+        or None if no database has been selected yet.
+        """
+        raw = self._raw_bytes
+        is_first_database = db_number is None
+        if is_first_database :
+            db_number = 0
+        while end is None or f.tell() < end :
+            self._expiry = None
+            start = f.tell()
+            data_type = f.read_unsigned_char()
             
-            is_first_database = True
+            if data_type == REDIS_RDB_OPCODE_EXPIRETIME_MS :
+                self._expiry = to_datetime(f.read_unsigned_long() * 1000)
+            elif data_type == REDIS_RDB_OPCODE_EXPIRETIME :
+                self._expiry = to_datetime(f.read_unsigned_int() * 1000000)
+            if self._expiry is not None :
+                if raw :
+                    self._orig_expiry = f.raw(start)
+                start = f.tell()
+                data_type = f.read_unsigned_char()
+            elif raw :
+                self._orig_expiry = None
+            if data_type == REDIS_RDB_OPCODE_IDLE or data_type == REDIS_RDB_OPCODE_FREQ :
+                data_type = self.read_eviction_info(f, data_type)
+                start = f.tell() - 1
+            else :
+                self._eviction_info = None
+            if raw :
+                self._orig_data_type = f.raw(start)
+            
+            if data_type == REDIS_RDB_OPCODE_SELECTDB :
+                if not is_first_database :
+                    self.end_database(db_number, '')
+                is_first_database = False
+                start = f.tell()
+                db_number = self.read_length(f)
+                if raw :
+                    self._callback.start_database(db_number, {'orig_db_number': f.raw(start)})
+                else :
+                    self._callback.start_database(db_number)
+                continue
+            
+            if data_type == REDIS_RDB_OPCODE_EOF :
+                if self._verify_checksum :
+                    self.verify_checksum(f)
+                self.end_database(db_number, self._orig_data_type)
+                self._callback.end_rdb()
+                break
+
+            if data_type == REDIS_RDB_OPCODE_AUX :
+                aux_key = self.read_string(f, is_key = True)
+                self._callback.aux_field(aux_key, self.read_string(f, is_key = True))
+                continue
+            if data_type == REDIS_RDB_OPCODE_RESIZEDB :
+                db_size = self.read_length(f)
+                self._callback.db_size(db_size, self.read_length(f))
+                continue
+            if data_type in METADATA_OPCODES :
+                self.skip_metadata(f, data_type)
+                continue
+
+            # The database and the type are known before the key is read, 
+            # so keys that they exclude are skipped without decoding the key
+            if self.matches_filter(db_number, data_type = data_type) :
+                start = f.tell()
+                self._key = self.read_string(f, is_key = True)
+                if raw :
+                    self._orig_key = f.raw(start)
+                if self.matches_filter(db_number, self._key, data_type):
+                    self.read_object(f, data_type)
+                else:
+                    self.skip_object(f, data_type)
+            else :
+                self.skip_key_and_object(f, data_type)
+
+    def scan_keys(self, f, filtered = False):
+        """
+        Walks the dump in `f` without decoding any value, and yields a `KeyEntry` for every key.
+        Values are skipped by their lengths. Filters are not applied, unless `filtered` is set : the keys 
+        outside of the "dbs" and "types" filters are then skipped by their lengths too, without being decoded.
+        """
+        self.verify_magic_string(f.read(5))
+        self.verify_version(f.read(4))
+        db_number = 0
+        while True :
+            offset = f.tell()
+            expiry = None
+            data_type = f.read_unsigned_char()
+            if data_type == REDIS_RDB_OPCODE_EXPIRETIME_MS :
+                expiry = to_datetime(f.read_unsigned_long() * 1000)
+                data_type = f.read_unsigned_char()
+            elif data_type == REDIS_RDB_OPCODE_EXPIRETIME :
+                expiry = to_datetime(f.read_unsigned_int() * 1000000)
+                data_type = f.read_unsigned_char()
+            if data_type == REDIS_RDB_OPCODE_IDLE or data_type == REDIS_RDB_OPCODE_FREQ :
+                data_type = self.read_eviction_info(f, data_type)
+
+            if data_type == REDIS_RDB_OPCODE_SELECTDB :
+                db_number = self.read_length(f)
+                continue
+            if data_type == REDIS_RDB_OPCODE_EOF :
+                if self._verify_checksum :
+                    self.verify_checksum(f)
+                break
+            if data_type in METADATA_OPCODES :
+                self.skip_metadata(f, data_type)
+                continue
+
+            if filtered and not self.matches_filter(db_number, data_type = data_type) :
+                self.skip_key_and_object(f, data_type)
+                continue
+            self._key = self.read_string(f, is_key = True)
+            self.skip_object(f, data_type)
+            if filtered and not self.matches_filter(db_number, self._key, data_type) :
+                continue
+            yield KeyEntry(db_number, offset, data_type, self._key, expiry, f.tell() - offset)
+
+    def summarize(self, f):
+        """
+        Reads the version, the AUX fields and the number of keys and expiries of every database 
+        of the dump in `f`, and returns them as a `DumpSummary`. Only the databases of the "dbs" filter 
+        are summarized.
+        
+        The sizes of a database are in the RESIZEDB opcode at its head (RDB version 7). There are no 
+        offsets of databases in a dump though, so the keys in between are skipped by their lengths, without 
+        decoding them. Databases are in ascending order, so the dump is not read further than the head 
+        of the last database in the filter. The keys of dumps without RESIZEDB are counted.
+        """
+        self.verify_magic_string(f.read(5))
+        version = f.read(4)
+        self.verify_version(version)
+        dbs = self._filters['dbs']
+        last_db = max(dbs) if dbs else None
+        aux = []
+        databases = []
+        db_number, keys, expires, sized = None, 0, 0, False
+        while True :
+            data_type = f.read_unsigned_char()
+            if data_type == REDIS_RDB_OPCODE_EXPIRETIME_MS :
+                f.skip(8)
+                expires += 1
+                data_type = f.read_unsigned_char()
+            elif data_type == REDIS_RDB_OPCODE_EXPIRETIME :
+                f.skip(4)
+                expires += 1
+                data_type = f.read_unsigned_char()
+            if data_type == REDIS_RDB_OPCODE_IDLE or data_type == REDIS_RDB_OPCODE_FREQ :
+                data_type = self.read_eviction_info(f, data_type)
+
+            if data_type == REDIS_RDB_OPCODE_SELECTDB or data_type == REDIS_RDB_OPCODE_EOF :
+                if db_number is not None and not sized and (not dbs or db_number in dbs) :
+                    databases.append(DatabaseSummary(db_number, keys, expires))
+                if data_type == REDIS_RDB_OPCODE_EOF :
+                    break
+                db_number, keys, expires, sized = self.read_length(f), 0, 0, False
+                if last_db is not None and db_number > last_db :
+                    break
+            elif data_type == REDIS_RDB_OPCODE_AUX :
+                aux_key = self.read_string(f, is_key = True)
+                aux.append((aux_key, self.read_string(f, is_key = True)))
+            elif data_type == REDIS_RDB_OPCODE_RESIZEDB :
+                db_size = self.read_length(f)
+                expires_size = self.read_length(f)
+                sized = True
+                if not dbs or db_number in dbs :
+                    databases.append(DatabaseSummary(db_number, db_size, expires_size))
+                if db_number == last_db :
+                    break
+            elif data_type in METADATA_OPCODES :
+                self.skip_metadata(f, data_type)
+            else :
+                keys += 1
+                self.skip_key_and_object(f, data_type)
+        return DumpSummary(int(version), aux, databases)
+
+    def iter_records(self, filename, lazy = False, use_mmap = True):
+        """
+        Parse a redis rdb dump file, and yield a `KeyRecord` for every key that matches the filters.
+        This is a pull style alternative to the callback : the callback of the parser is not used.
+        
+        Typical usage :
+            parser = RdbParser(None)
+            for record in parser.iter_records('/var/redis/6379/dump.rdb') :
+                print record.key, record.data_type, record.length
+        
+        By default the elements of a collection are read into a list. With `lazy = True`, the 
+        elements of lists, sets, sorted sets and hashes stored as hashtables or linked lists are a 
+        `LazyElements` iterator instead, which decodes them one at a time. Memory is then constant,
+        however big a collection is. The iterator must be used before the next record is read, 
+        and the elements that are not read are skipped. Compactly encoded collections (ziplists, 
+        intsets and zipmaps) are small, and are decoded at once. `filename` is as for `parse`.
+        
+        Stopping the iteration early leaves the rest of the file unread, and the checksum unverified.
+        """
+        with dump_reader(filename, use_mmap, checksum = self._verify_checksum) as f:
+            for record in self.read_records(f, lazy) :
+                yield record
+
+    def read_records(self, f, lazy = False):
+        """Yields the records of the dump in the reader `f`, see `iter_records`"""
+        if self._raw_bytes :
+            raise Exception('read_records', 'Records do not hold raw bytes')
+        self.verify_magic_string(f.read(5))
+        self.verify_version(f.read(4))
+        callback, batches, elements = self._callback, self._batches, self._elements
+        collector = ElementCollector()
+        self._callback, self._batches, self._elements = collector, True, ELEMENTS_VALUES
+        try:
             db_number = 0
             while True :
                 self._expiry = None
-                data_type, orig_data_type = read_unsigned_char(f)
-                
+                data_type = f.read_unsigned_char()
                 if data_type == REDIS_RDB_OPCODE_EXPIRETIME_MS :
-                    expiry, orig_expiry = read_unsigned_long(f)
-                    self._expiry = to_datetime(expiry * 1000)
-                    self._orig_expiry = orig_data_type + orig_expiry
-                    data_type, orig_data_type = read_unsigned_char(f)
-                    self._orig_data_type = orig_data_type
+                    self._expiry = to_datetime(f.read_unsigned_long() * 1000)
+                    data_type = f.read_unsigned_char()
                 elif data_type == REDIS_RDB_OPCODE_EXPIRETIME :
-                    expiry, orig_expiry = read_unsigned_int(f)
-                    self._expiry = to_datetime(expiry * 1000000)
-                    self._orig_expiry = orig_data_type + orig_expiry
-                    data_type, orig_data_type = read_unsigned_char(f)
-                    self._orig_data_type = orig_data_type
-                else:
-                    self._orig_expiry = None
-                    self._orig_data_type = orig_data_type
-                
+                    self._expiry = to_datetime(f.read_unsigned_int() * 1000000)
+                    data_type = f.read_unsigned_char()
+                if data_type == REDIS_RDB_OPCODE_IDLE or data_type == REDIS_RDB_OPCODE_FREQ :
+                    data_type = self.read_eviction_info(f, data_type)
+
                 if data_type == REDIS_RDB_OPCODE_SELECTDB :
-                    if not is_first_database :
-                        self._callback.end_database(db_number)
-                    is_first_database = False
-                    db_number, orig_db_number = self.read_length(f)
-                    _info = {'orig_db_number': orig_db_number}
-                    self._callback.start_database(db_number, _info)
+                    db_number = self.read_length(f)
                     continue
-                
                 if data_type == REDIS_RDB_OPCODE_EOF :
-                    _info = {'orig_end_db': orig_data_type}
-                    self._callback.end_database(db_number, _info)
-                    self._callback.end_rdb()
+                    if self._verify_checksum :
+                        self.verify_checksum(f)
                     break
+                if data_type in METADATA_OPCODES :
+                    self.skip_metadata(f, data_type)
+                    continue
 
-                if self.matches_filter(db_number) :
-                    self._key, self._orig_key = self.read_string(f, is_key = True)
-                    if self.matches_filter(db_number, self._key, data_type):
-                        self.read_object(f, data_type)
-                    else:
-                        self.skip_object(f, data_type)
-                else :
+                if not self.matches_filter(db_number, data_type = data_type) :
                     self.skip_key_and_object(f, data_type)
+                    continue
+                self._key = self.read_string(f, is_key = True)
+                if not self.matches_filter(db_number, self._key, data_type) :
+                    self.skip_object(f, data_type)
+                    continue
 
-    def read_length_with_encoding(self, f) :
-        length = 0
-        is_encoded = False
-        bts = []
-        data, orig_data = read_unsigned_char(f)
-        bts.append(orig_data)
-        enc_type = (data & 0xC0) >> 6
-        if enc_type == REDIS_RDB_ENCVAL :
-            is_encoded = True
-            length = data & 0x3F
-        elif enc_type == REDIS_RDB_6BITLEN :
-            length = data & 0x3F
-        elif enc_type == REDIS_RDB_14BITLEN :
-            data1, orig_data1 = read_unsigned_char(f)
-            bts.append(orig_data1)
-            length = ((data&0x3F)<<8)|data1
+                if lazy and data_type in LAZY_ENCODINGS :
+                    length = self.read_length(f)
+                    elements = LazyElements(self.iter_elements(f, data_type, length), self._key, length)
+                    yield KeyRecord(db_number, self._key, self.get_logical_type(data_type), 
+                                    LAZY_ENCODINGS[data_type], self._expiry, length, elements)
+                    # Elements are decoded whole, so the ones left are skipped from where the iteration stopped
+                    self.skip_elements(f, data_type, elements.remaining)
+                    elements.invalidate()
+                else :
+                    collector.reset()
+                    self.read_object(f, data_type)
+                    value = collector.elements
+                    if lazy and data_type != REDIS_RDB_TYPE_STRING :
+                        value = iter(value)
+                    yield KeyRecord(db_number, self._key, self.get_logical_type(data_type), 
+                                    collector.encoding, self._expiry, collector.length, value)
+        finally:
+            self._callback, self._batches, self._elements = callback, batches, elements
+
+    def iter_elements(self, f, enc_type, length) :
+        """Decodes the `length` elements of a hashtable or linked list encoded object from `f`"""
+        read_string = self.read_string
+        if enc_type == REDIS_RDB_TYPE_LIST or enc_type == REDIS_RDB_TYPE_SET :
+            for count in xrange(0, length) :
+                yield read_string(f)
+        elif enc_type == REDIS_RDB_TYPE_ZSET :
+            for count in xrange(0, length) :
+                member = read_string(f)
+                dbl_length = f.read_unsigned_char()
+                yield (member, float(f.read(dbl_length)))
+        elif enc_type == REDIS_RDB_TYPE_ZSET_2 :
+            for count in xrange(0, length) :
+                member = read_string(f)
+                yield (member, f.read_double())
+        elif enc_type == REDIS_RDB_TYPE_HASH :
+            for count in xrange(0, length) :
+                field = read_string(f)
+                yield (field, read_string(f))
         else :
-            length, orig_length = ntohl(f)
-            bts.append(orig_length)
-        return (length, is_encoded, bts)
+            raise Exception('iter_elements', 'Invalid object type %d for key %s' % (enc_type, self._key))
+
+    def end_database(self, db_number, orig_end_db):
+        # A database followed by another one has no end marker of its own, 
+        # so its orig_end_db is empty
+        if self._raw_bytes :
+            self._callback.end_database(db_number, {'orig_end_db': orig_end_db})
+        else :
+            self._callback.end_database(db_number)
+
+    def key_info(self, info) :
+        """Adds the LRU idle time or LFU frequency of the current key, if it has one, to the `info` dictionary of a callback"""
+        if self._eviction_info :
+            info.update(self._eviction_info)
+        return info
+
+    def raw_info(self, info, **orig) :
+        """
+        Adds the raw bytes of the current key to the `info` dictionary of a callback. 
+        Only used when the callback sets `wants_raw_bytes`.
+        """
+        info['orig_data_type'] = self._orig_data_type
+        info['orig_expiry'] = self._orig_expiry
+        info['orig_key'] = self._orig_key
+        info.update(orig)
+        return info
+
+    def read_length_with_encoding(self, f) :
+        return f.read_length_with_encoding()
 
     def read_length(self, f) :
-        tup = self.read_length_with_encoding(f)
-        return tup[0], ''.join(tup[2])
+        return f.read_length_with_encoding()[0]
 
     def read_string(self, f, is_key = False) :
-        tup = self.read_length_with_encoding(f)
-        length = tup[0]
-        is_encoded = tup[1]
-        bts = tup[2]
+        length, is_encoded = f.read_length_with_encoding()
+        if not is_encoded :
+            return f.read(length)
         val = None
-        if is_encoded :
-            if length == REDIS_RDB_ENC_INT8 :
-                val, orig_val = read_signed_char(f)
-                bts.append(orig_val)
-            elif length == REDIS_RDB_ENC_INT16 :
-                val, orig_val = read_signed_short(f)
-                bts.append(orig_val)
-            elif length == REDIS_RDB_ENC_INT32 :
-                val, orig_val = read_signed_int(f)
-                bts.append(orig_val)
-            elif length == REDIS_RDB_ENC_LZF :
-                clen, orig_clen = self.read_length(f)
-                l, orig_l = self.read_length(f)
-                orig_val = f.read(clen)
-                if is_key:
-                    val = self.lzf_decompress(orig_val , l)
-                elif not is_key and not self._ignore_real_value:
-                    val = self.lzf_decompress(orig_val , l)
-                #
-                bts.append(orig_clen)
-                bts.append(orig_l)
-                bts.append(orig_val)
-        else :
-            val = f.read(length)
-            bts.append(val)
-        return val, ''.join(bts)
+        if length == REDIS_RDB_ENC_INT8 :
+            val = f.read_signed_char()
+        elif length == REDIS_RDB_ENC_INT16 :
+            val = f.read_signed_short()
+        elif length == REDIS_RDB_ENC_INT32 :
+            val = f.read_signed_int()
+        elif length == REDIS_RDB_ENC_LZF :
+            clen = self.read_length(f)
+            l = self.read_length(f)
+            if is_key or not self._ignore_real_value:
+                val = self.lzf_decompress(f.read(clen), l)
+            else:
+                f.skip(clen)
+        return val
+
+    def read_raw_string(self, f, is_key = False) :
+        """Reads a string, and returns it together with the raw bytes it was encoded as"""
+        start = f.tell()
+        val = self.read_string(f, is_key)
+        return val, f.raw(start)
 
     # Read an object for the stream
     # f is the redis file 
     # enc_type is the type of object
     def read_object(self, f, enc_type) :
-        if enc_type == REDIS_RDB_TYPE_STRING :
-            val, orig_val = self.read_string(f)
-            info = {'encoding': 'string',
-                    'orig_data_type': self._orig_data_type,
-                    'orig_expiry': self._orig_expiry,
-                    'orig_key': self._orig_key,
-                    'orig_val': orig_val}
+        raw = self._raw_bytes
+        if self._elements == ELEMENTS_NONE and enc_type in LAZY_ENCODINGS :
+            # Only the lengths of the strings are read
+            length = self.read_length(f)
+            self.skip_elements(f, enc_type, length)
+            info = self.key_info({'encoding': LAZY_ENCODINGS[enc_type]})
+            self.emit_without_elements(DATA_TYPE_MAPPING[enc_type], length, info)
+        elif enc_type == REDIS_RDB_TYPE_STRING :
+            if raw :
+                val, orig_val = self.read_raw_string(f)
+                info = self.raw_info({'encoding': 'string'}, orig_val = orig_val)
+            else :
+                val = self.read_string(f)
+                info = {'encoding': 'string'}
+            self.key_info(info)
             self._callback.set(self._key, val, self._expiry, info)
         elif enc_type == REDIS_RDB_TYPE_LIST :
             # A redis list is just a sequence of strings
             # We successively read strings from the stream and create a list from it
             # The lists are in order i.e. the first string is the head, 
             # and the last string is the tail of the list
-            length, orig_length = self.read_length(f)
-            info = {'encoding': 'linkedlist',
-                    'orig_data_type': self._orig_data_type,
-                    'orig_expiry': self._orig_expiry,
-                    'orig_key': self._orig_key,
-                    'orig_length': orig_length
-                    }
+            start = f.tell()
+            length = self.read_length(f)
+            info = self.key_info({'encoding': 'linkedlist'})
+            if raw :
+                self.raw_info(info, orig_length = f.raw(start))
             self._callback.start_list(self._key, length, self._expiry, info)
-            for count in xrange(0, length) :
-                val, orig_val = self.read_string(f)
-                _info = {'orig_val': orig_val}
-                self._callback.rpush(self._key, val, _info)
+            if raw :
+                for count in xrange(0, length) :
+                    val, orig_val = self.read_raw_string(f)
+                    self._callback.rpush(self._key, val, {'orig_val': orig_val})
+            elif self._batches :
+                read_string = self.read_string
+                for batch in self.batches(length) :
+                    self._callback.rpush_many(self._key, [read_string(f) for count in batch])
+            else :
+                for count in xrange(0, length) :
+                    self._callback.rpush(self._key, self.read_string(f))
             self._callback.end_list(self._key)
         elif enc_type == REDIS_RDB_TYPE_SET :
             # A redis list is just a sequence of strings
             # We successively read strings from the stream and create a set from it
             # Note that the order of strings is non-deterministic
-            length, orig_length = self.read_length(f)
-            info = {'encoding': 'hashtable',
-                    'orig_data_type': self._orig_data_type,
-                    'orig_expiry': self._orig_expiry,
-                    'orig_key': self._orig_key,
-                    'orig_length': orig_length
-                    }
+            start = f.tell()
+            length = self.read_length(f)
+            info = self.key_info({'encoding': 'hashtable'})
+            if raw :
+                self.raw_info(info, orig_length = f.raw(start))
             self._callback.start_set(self._key, length, self._expiry, info)
-            for count in xrange(0, length) :
-                val, orig_val = self.read_string(f)
-                _info = {'orig_val': orig_val}
-                self._callback.sadd(self._key, val, _info)
+            if raw :
+                for count in xrange(0, length) :
+                    val, orig_val = self.read_raw_string(f)
+                    self._callback.sadd(self._key, val, {'orig_val': orig_val})
+            elif self._batches :
+                read_string = self.read_string
+                for batch in self.batches(length) :
+                    self._callback.sadd_many(self._key, [read_string(f) for count in batch])
+            else :
+                for count in xrange(0, length) :
+                    self._callback.sadd(self._key, self.read_string(f))
             self._callback.end_set(self._key)
         elif enc_type == REDIS_RDB_TYPE_ZSET :
-            length, orig_length = self.read_length(f)
-            info = {'encoding':'skiplist',
-                    'orig_data_type': self._orig_data_type,
-                    'orig_expiry': self._orig_expiry,
-                    'orig_key': self._orig_key,
-                    'orig_length': orig_length
-                    }
+            start = f.tell()
+            length = self.read_length(f)
+            info = self.key_info({'encoding':'skiplist'})
+            if raw :
+                orig_length = f.raw(start)
+                self.raw_info(info, orig_length = orig_length)
             self._callback.start_sorted_set(self._key, length, self._expiry, info)
-            for count in xrange(0, length) :
-                val, orig_val = self.read_string(f)
-                dbl_length, orig_dbl_length = read_unsigned_char(f)
-                score = f.read(dbl_length)
-                _info = {'orig_length': orig_length,
-                         'orig_val': orig_val,
-                         'orig_dbl_length': orig_dbl_length,
-                         'orig_score': score
-                         }
-                if isinstance(score, str):
-                    score = float(score)
-                self._callback.zadd(self._key, score, val, _info)
+            if self._batches :
+                for batch in self.batches(length) :
+                    pairs = []
+                    for count in batch :
+                        val = self.read_string(f)
+                        dbl_length = f.read_unsigned_char()
+                        pairs.append((float(f.read(dbl_length)), val))
+                    self._callback.zadd_many(self._key, pairs)
+            else :
+                for count in xrange(0, length) :
+                    if raw :
+                        val, orig_val = self.read_raw_string(f)
+                        start = f.tell()
+                    else :
+                        val = self.read_string(f)
+                    dbl_length = f.read_unsigned_char()
+                    score = f.read(dbl_length)
+                    if raw :
+                        _info = {'orig_length': orig_length,
+                                 'orig_val': orig_val,
+                                 'orig_dbl_length': f.raw(start, start + 1),
+                                 'orig_score': score
+                                 }
+                        self._callback.zadd(self._key, float(score), val, _info)
+                    else :
+                        self._callback.zadd(self._key, float(score), val)
             self._callback.end_sorted_set(self._key)
         elif enc_type == REDIS_RDB_TYPE_HASH :
-            length, orig_length = self.read_length(f)
-            info = {'encoding': 'hashtable',
-                    'orig_data_type': self._orig_data_type,
-                    'orig_expiry': self._orig_expiry,
-                    'orig_length': orig_length,
-                    'orig_key': self._orig_key
-                    }
+            start = f.tell()
+            length = self.read_length(f)
+            info = self.key_info({'encoding': 'hashtable'})
+            if raw :
+                self.raw_info(info, orig_length = f.raw(start))
             self._callback.start_hash(self._key, length, self._expiry, info)
-            for count in xrange(0, length) :
-                field, orig_field = self.read_string(f)
-                value, orig_value = self.read_string(f)
-                _info = {'orig_field': orig_field,
-                         'orig_value': orig_value
-                         }
-                self._callback.hset(self._key, field, value, _info)
+            if raw :
+                for count in xrange(0, length) :
+                    field, orig_field = self.read_raw_string(f)
+                    value, orig_value = self.read_raw_string(f)
+                    _info = {'orig_field': orig_field,
+                             'orig_value': orig_value
+                             }
+                    self._callback.hset(self._key, field, value, _info)
+            elif self._batches :
+                read_string = self.read_string
+                for batch in self.batches(length) :
+                    self._callback.hset_many(self._key, [(read_string(f), read_string(f)) for count in batch])
+            else :
+                for count in xrange(0, length) :
+                    field = self.read_string(f)
+                    value = self.read_string(f)
+                    self._callback.hset(self._key, field, value)
             self._callback.end_hash(self._key)
         elif enc_type == REDIS_RDB_TYPE_HASH_ZIPMAP :
             self.read_zipmap(f)
@@ -480,212 +1138,734 @@ class RdbParser :
             self.read_zset_from_ziplist(f)
         elif enc_type == REDIS_RDB_TYPE_HASH_ZIPLIST :
             self.read_hash_from_ziplist(f)
+        elif enc_type == REDIS_RDB_TYPE_ZSET_2 :
+            self.read_zset_2(f)
+        elif enc_type == REDIS_RDB_TYPE_LIST_QUICKLIST :
+            self.read_quicklist(f)
+        elif enc_type == REDIS_RDB_TYPE_LIST_QUICKLIST_2 :
+            self.read_quicklist_2(f)
+        elif enc_type == REDIS_RDB_TYPE_HASH_LISTPACK :
+            self.read_hash_from_listpack(f)
+        elif enc_type == REDIS_RDB_TYPE_ZSET_LISTPACK :
+            self.read_zset_from_listpack(f)
+        elif enc_type == REDIS_RDB_TYPE_SET_LISTPACK :
+            self.read_set_from_listpack(f)
+        elif enc_type in STREAM_TYPES :
+            self.read_stream(f, enc_type)
         else :
             raise Exception('read_object', 'Invalid object type %d for key %s' % (enc_type, self._key))
 
+    def batches(self, length) :
+        """Splits `length` elements in batches of at most `batch_size`, as xrange objects to iterate on"""
+        batch_size = self._batch_size
+        for start in xrange(0, length, batch_size) :
+            yield xrange(0, min(batch_size, length - start))
+
     def skip_key_and_object(self, f, data_type):
         self.skip_string(f)
         self.skip_object(f, data_type)
 
     def skip_string(self, f):
-        tup = self.read_length_with_encoding(f)
-        length = tup[0]
-        is_encoded = tup[1]
-        bytes_to_skip = 0
-        if is_encoded :
-            if length == REDIS_RDB_ENC_INT8 :
-                bytes_to_skip = 1
-            elif length == REDIS_RDB_ENC_INT16 :
-                bytes_to_skip = 2
-            elif length == REDIS_RDB_ENC_INT32 :
-                bytes_to_skip = 4
-            elif length == REDIS_RDB_ENC_LZF :
-                clen = self.read_length(f)
-                l = self.read_length(f)
-                bytes_to_skip = clen
-        else :
-            bytes_to_skip = length
-        
-        skip(f, bytes_to_skip)
+        f.skip_strings(1)
 
     def skip_object(self, f, enc_type):
-        skip_strings = 0
-        if enc_type == REDIS_RDB_TYPE_STRING :
-            skip_strings = 1
-        elif enc_type == REDIS_RDB_TYPE_LIST :
-            skip_strings = self.read_length(f)
-        elif enc_type == REDIS_RDB_TYPE_SET :
-            skip_strings = self.read_length(f)
-        elif enc_type == REDIS_RDB_TYPE_ZSET :
-            skip_strings = self.read_length(f) * 2
+        """Skips the value of type `enc_type`. Payloads are never read, only their length headers"""
+        if enc_type in LAZY_ENCODINGS :
+            self.skip_elements(f, enc_type, self.read_length(f))
+        elif enc_type == REDIS_RDB_TYPE_LIST_QUICKLIST :
+            # A string per node
+            f.skip_strings(self.read_length(f))
+        elif enc_type == REDIS_RDB_TYPE_LIST_QUICKLIST_2 :
+            # A container and a string per node
+            for x in xrange(0, self.read_length(f)) :
+                self.read_length(f)
+                f.skip_strings(1)
+        elif enc_type in STREAM_TYPES :
+            self.skip_stream(f, enc_type)
+        elif enc_type in DATA_TYPE_MAPPING :
+            # Strings and compactly encoded objects are a single string
+            f.skip_strings(1)
+        else :
+            raise Exception('skip_object', 'Invalid object type %d for key %s' % (enc_type, self._key))
+
+    def skip_elements(self, f, enc_type, count):
+        """Skips `count` elements of a hashtable or linked list encoded object"""
+        if enc_type == REDIS_RDB_TYPE_ZSET :
+            f.skip_strings(count, scores = True)
+        elif enc_type == REDIS_RDB_TYPE_ZSET_2 :
+            for x in xrange(0, count) :
+                f.skip_strings(1)
+                f.skip(8)
         elif enc_type == REDIS_RDB_TYPE_HASH :
-            skip_strings = self.read_length(f) * 2
-        elif enc_type == REDIS_RDB_TYPE_HASH_ZIPMAP :
-            skip_strings = 1
-        elif enc_type == REDIS_RDB_TYPE_LIST_ZIPLIST :
-            skip_strings = 1
-        elif enc_type == REDIS_RDB_TYPE_SET_INTSET :
-            skip_strings = 1
-        elif enc_type == REDIS_RDB_TYPE_ZSET_ZIPLIST :
-            skip_strings = 1
-        elif enc_type == REDIS_RDB_TYPE_HASH_ZIPLIST :
-            skip_strings = 1
+            f.skip_strings(count * 2)
         else :
-            raise Exception('read_object', 'Invalid object type %d for key %s' % (enc_type, self._key))
-        for x in xrange(0, skip_strings):
-            self.skip_string(f)
+            f.skip_strings(count)
 
+    def skip_stream(self, f, enc_type):
+        """Skips a stream : its listpacks, its metadata, and its consumer groups with their pending entries"""
+        # The ID of the first entry and a listpack, per node
+        f.skip_strings(2 * self.read_length(f))
+        # Length and last ID, then the first ID, the maximal deleted ID and the number of entries added
+        metadata = 3 if enc_type == REDIS_RDB_TYPE_STREAM_LISTPACKS else 8
+        for x in xrange(0, metadata) :
+            self.read_length(f)
+        for group in xrange(0, self.read_length(f)) :
+            f.skip_strings(1)
+            self.read_length(f)
+            self.read_length(f)
+            if enc_type != REDIS_RDB_TYPE_STREAM_LISTPACKS :
+                self.read_length(f)
+            # A raw ID, a delivery time and a delivery count per pending entry
+            for x in xrange(0, self.read_length(f)) :
+                f.skip(24)
+                self.read_length(f)
+            for consumer in xrange(0, self.read_length(f)) :
+                f.skip_strings(1)
+                f.skip(16 if enc_type == REDIS_RDB_TYPE_STREAM_LISTPACKS_3 else 8)
+                f.skip(16 * self.read_length(f))
 
-    def read_intset(self, f) :
-        raw_string, orig_raw_string = self.read_string(f, is_key = True)
-        buff = StringIO(raw_string)
-        encoding = read_unsigned_int(buff)[0]
-        num_entries = read_unsigned_int(buff)[0]
-        info = {'encoding':'intset', 
-                'sizeof_value':len(raw_string),
-                'orig_data_type': self._orig_data_type,
-                'orig_expiry': self._orig_expiry,
-                'orig_key': self._orig_key,
-                'orig_raw_string': orig_raw_string
-                }
-        self._callback.start_set(self._key, num_entries, self._expiry, info)
-        for x in xrange(0, num_entries) :
-            if encoding == 8 :
-                entry = read_unsigned_long(buff)[0]
-            elif encoding == 4 :
-                entry = read_unsigned_int(buff)[0]
-            elif encoding == 2 :
-                entry = read_unsigned_short(buff)[0]
+    def read_eviction_info(self, f, data_type):
+        """
+        Reads the LRU idle time and LFU frequency that precede the type of a key 
+        when the server evicts keys (RDB version 9), for `key_info`. Returns the type of the key
+        """
+        self._eviction_info = {}
+        while True :
+            if data_type == REDIS_RDB_OPCODE_IDLE :
+                self._eviction_info['idle'] = self.read_length(f)
+            elif data_type == REDIS_RDB_OPCODE_FREQ :
+                self._eviction_info['freq'] = f.read_unsigned_char()
             else :
-                raise Exception('read_intset', 'Invalid encoding %d for key %s' % (encoding, self._key))
-            self._callback.sadd(self._key, entry, None)
-        self._callback.end_set(self._key)
+                return data_type
+            data_type = f.read_unsigned_char()
+
+    def skip_metadata(self, f, opcode):
+        """Skips the metadata opcode `opcode`, one of METADATA_OPCODES"""
+        if opcode == REDIS_RDB_OPCODE_AUX :
+            # A field and its value
+            f.skip_strings(2)
+        elif opcode == REDIS_RDB_OPCODE_RESIZEDB :
+            # Sizes of the hashtables of the keys and of the expiries
+            self.read_length(f)
+            self.read_length(f)
+        elif opcode == REDIS_RDB_OPCODE_MODULE_AUX :
+            # Module id, and when the data was written
+            self.read_length(f)
+            self.read_length(f)
+            self.read_length(f)
+            self.skip_module_value(f)
+        elif opcode == REDIS_RDB_OPCODE_FUNCTION2 :
+            # The code of a function library
+            f.skip_strings(1)
+        else :
+            raise Exception('skip_metadata', 'Unsupported opcode %d, written by a release candidate of redis 7.0' % opcode)
+
+    def skip_module_value(self, f):
+        """Skips a value serialized by a module, which is a sequence of typed fields"""
+        while True :
+            opcode = self.read_length(f)
+            if opcode == REDIS_RDB_MODULE_OPCODE_EOF :
+                return
+            elif opcode == REDIS_RDB_MODULE_OPCODE_SINT or opcode == REDIS_RDB_MODULE_OPCODE_UINT :
+                self.read_length(f)
+            elif opcode == REDIS_RDB_MODULE_OPCODE_FLOAT :
+                f.skip(4)
+            elif opcode == REDIS_RDB_MODULE_OPCODE_DOUBLE :
+                f.skip(8)
+            elif opcode == REDIS_RDB_MODULE_OPCODE_STRING :
+                f.skip_strings(1)
+            else :
+                raise Exception('skip_module_value', 'Invalid module opcode %d' % opcode)
+
+    def read_blob(self, f, encoding) :
+        """
+        Reads the string that holds a compactly encoded object (ziplist, intset or zipmap).
+        Returns the string and the `info` dictionary for the start_* callback
+        """
+        if self._raw_bytes :
+            raw_string, orig_raw_string = self.read_raw_string(f, is_key = True)
+            info = self.raw_info({'encoding': encoding, 'sizeof_value': len(raw_string)}, 
+                                 orig_raw_string = orig_raw_string)
+        else :
+            raw_string = self.read_string(f, is_key = True)
+            info = {'encoding': encoding, 'sizeof_value': len(raw_string)}
+        return raw_string, self.key_info(info)
+
+    def read_intset(self, f) :
+        raw_string, info = self.read_blob(f, 'intset')
+        encoding, num_entries = _intset_header.unpack_from(raw_string)
+        if self._elements != ELEMENTS_VALUES :
+            if self._elements == ELEMENTS_LENGTHS :
+                info['len_largest_element'] = INTEGER_LENGTH if num_entries else 0
+            self.emit_without_elements('set', num_entries, info)
+            return
+        self.emit_set(self.read_intset_entries(raw_string), info)
+
+    def read_intset_entries(self, intset) :
+        """Decodes all the entries of the string `intset` at once, and returns them as a list of integers"""
+        # Header : size of an entry, number of entries (32 bits each). The entries are sorted signed integers
+        encoding, num_entries = _intset_header.unpack_from(intset)
+        if encoding not in INTSET_FORMATS :
+            raise Exception('read_intset_entries', 'Invalid encoding %d for key %s' % (encoding, self._key))
+        return list(struct.unpack_from('<%d%s' % (num_entries, INTSET_FORMATS[encoding]), intset, 8))
 
     def read_ziplist(self, f) :
-        raw_string, orig_raw_string = self.read_string(f, is_key = True)
-        buff = StringIO(raw_string)
-        zlbytes = read_unsigned_int(buff)[0]
-        tail_offset = read_unsigned_int(buff)[0]
-        num_entries = read_unsigned_short(buff)[0]
-        info = {'encoding':'ziplist', 
-                'sizeof_value':len(raw_string),
-                'orig_data_type': self._orig_data_type,
-                'orig_expiry': self._orig_expiry,
-                'orig_key': self._orig_key,
-                'orig_raw_string': orig_raw_string
-                }
-        self._callback.start_list(self._key, num_entries, self._expiry, info)
-        for x in xrange(0, num_entries) :
-            val = self.read_ziplist_entry(buff)
-            self._callback.rpush(self._key, val)
-        zlist_end = read_unsigned_char(buff)[0]
-        if zlist_end != 255 : 
-            raise Exception('read_ziplist', "Invalid zip list end - %d for key %s" % (zlist_end, self._key))
+        raw_string, info = self.read_blob(f, 'ziplist')
+        if self._elements != ELEMENTS_VALUES :
+            self.emit_entry_lengths('list', self.read_ziplist_lengths(raw_string), info)
+            return
+        values = self.read_ziplist_entries(raw_string)
+        self._callback.start_list(self._key, len(values), self._expiry, info)
+        if self._batches :
+            if values :
+                self._callback.rpush_many(self._key, values)
+        elif self._raw_bytes :
+            for value in values :
+                self._callback.rpush(self._key, value, None)
+        else :
+            for value in values :
+                self._callback.rpush(self._key, value)
         self._callback.end_list(self._key)
 
     def read_zset_from_ziplist(self, f) :
-        raw_string, orig_raw_string = self.read_string(f, is_key = True)
-        buff = StringIO(raw_string)
-        zlbytes = read_unsigned_int(buff)[0]
-        tail_offset = read_unsigned_int(buff)[0]
-        num_entries = read_unsigned_short(buff)[0]
-        if (num_entries % 2) :
-            raise Exception('read_zset_from_ziplist', "Expected even number of elements, but found %d for key %s" % (num_entries, self._key))
-        num_entries = num_entries /2
-        info = {'encoding':'ziplist', 
-                'sizeof_value':len(raw_string),
-                'orig_data_type': self._orig_data_type,
-                'orig_expiry': self._orig_expiry,
-                'orig_key': self._orig_key,
-                'orig_raw_string': orig_raw_string
-                }
-        self._callback.start_sorted_set(self._key, num_entries, self._expiry, info)
-        for x in xrange(0, num_entries) :
-            member = self.read_ziplist_entry(buff)
-            score = self.read_ziplist_entry(buff)
-            if isinstance(score, str) :
-                score = float(score)
-            self._callback.zadd(self._key, score, member)
-        zlist_end = read_unsigned_char(buff)
-        if zlist_end != 255 : 
-            raise Exception('read_zset_from_ziplist', "Invalid zip list end - %d for key %s" % (zlist_end, self._key))
-        self._callback.end_sorted_set(self._key)
+        raw_string, info = self.read_blob(f, 'ziplist')
+        if self._elements != ELEMENTS_VALUES :
+            self.emit_entry_lengths('sortedset', self.read_ziplist_lengths(raw_string), info)
+            return
+        self.emit_sorted_set(self.read_ziplist_entries(raw_string), info)
 
     def read_hash_from_ziplist(self, f) :
-        raw_string, orig_raw_string = self.read_string(f, is_key = True)
-        buff = StringIO(raw_string)
-        zlbytes, _ = read_unsigned_int(buff)
-        tail_offset, _ = read_unsigned_int(buff)
-        num_entries, _ = read_unsigned_short(buff)
-        if (num_entries % 2) :
-            raise Exception('read_hash_from_ziplist', "Expected even number of elements, but found %d for key %s" % (num_entries, self._key))
-        num_entries = num_entries /2
-        info = {'encoding':'ziplist', 
-                'sizeof_value':len(raw_string),
-                'orig_data_type': self._orig_data_type,
-                'orig_expiry': self._orig_expiry,
-                'orig_key': self._orig_key,
-                'orig_raw_string': orig_raw_string
-                }
-        self._callback.start_hash(self._key, num_entries, self._expiry, info)
-        for x in xrange(0, num_entries) :
-            field, value = None, None
-            if not self._ignore_real_field:
-                field = self.read_ziplist_entry(buff)
-            if not self._ignore_real_value:
-                value = self.read_ziplist_entry(buff)
-            self._callback.hset(self._key, field, value, None)
-        if not self._ignore_real_field or not self._ignore_real_value:
-            zlist_end, _ = read_unsigned_char(buff)
-            if zlist_end != 255 : 
-                raise Exception('read_hash_from_ziplist', "Invalid zip list end - %d for key %s" % (zlist_end, self._key))
-        self._callback.end_hash(self._key)
-    
-    
+        raw_string, info = self.read_blob(f, 'ziplist')
+        if self._elements != ELEMENTS_VALUES :
+            self.emit_entry_lengths('hash', self.read_ziplist_lengths(raw_string), info)
+            return
+        if self._ignore_real_field and self._ignore_real_value :
+            # Neither fields nor values are passed, so the entries need not be decoded
+            self.emit_hash(self.read_ziplist_lengths(raw_string), info)
+        else :
+            self.emit_hash(self.read_ziplist_entries(raw_string), info)
+
     def read_ziplist_entry(self, f) :
         length = 0
         value = None
-        prev_length = read_unsigned_char(f)[0]
+        prev_length = f.read_unsigned_char()
         if prev_length == 254 :
-            prev_length = read_unsigned_int(f)[0]
-        entry_header = read_unsigned_char(f)[0]
+            prev_length = f.read_unsigned_int()
+        entry_header = f.read_unsigned_char()
         if (entry_header >> 6) == 0 :
             length = entry_header & 0x3F
             value = f.read(length)
         elif (entry_header >> 6) == 1 :
-            length = ((entry_header & 0x3F) << 8) | read_unsigned_char(f)[0]
+            length = ((entry_header & 0x3F) << 8) | f.read_unsigned_char()
             value = f.read(length)
         elif (entry_header >> 6) == 2 :
-            length = read_big_endian_unsigned_int(f)[0]
+            length = f.read_big_endian_unsigned_int()
             value = f.read(length)
         elif (entry_header >> 4) == 12 :
-            value = read_signed_short(f)[0]
+            value = f.read_signed_short()
         elif (entry_header >> 4) == 13 :
-            value = read_signed_int(f)[0]
+            value = f.read_signed_int()
         elif (entry_header >> 4) == 14 :
-            value = read_signed_long(f)[0]
+            value = f.read_signed_long()
         elif (entry_header == 240) :
-            value = read_24bit_signed_number(f)[0]
+            value = f.read_24bit_signed_number()
         elif (entry_header == 254) :
-            value = read_signed_char(f)[0]
+            value = f.read_signed_char()
         elif (entry_header >= 241 and entry_header <= 253) :
             value = entry_header - 241
         else :
             raise Exception('read_ziplist_entry', 'Invalid entry_header %d for key %s' % (entry_header, self._key))
         return value
         
+    def read_zset_2(self, f) :
+        """A sorted set stored as a skiplist, with binary scores (RDB version 8)"""
+        start = f.tell()
+        length = self.read_length(f)
+        info = self.key_info({'encoding': 'skiplist'})
+        if self._raw_bytes :
+            orig_length = f.raw(start)
+            self.raw_info(info, orig_length = orig_length)
+        self._callback.start_sorted_set(self._key, length, self._expiry, info)
+        read_string = self.read_string
+        read_double = f.read_double
+        if self._raw_bytes :
+            for count in xrange(0, length) :
+                member, orig_val = self.read_raw_string(f)
+                score = f.read(8)
+                self._callback.zadd(self._key, _double.unpack(score)[0], member, 
+                                    {'orig_length': orig_length, 'orig_val': orig_val, 'orig_score': score})
+        elif self._batches :
+            for batch in self.batches(length) :
+                pairs = []
+                for count in batch :
+                    member = read_string(f)
+                    pairs.append((read_double(), member))
+                self._callback.zadd_many(self._key, pairs)
+        else :
+            for count in xrange(0, length) :
+                member = read_string(f)
+                self._callback.zadd(self._key, read_double(), member)
+        self._callback.end_sorted_set(self._key)
+
+    def read_quicklist(self, f) :
+        """A list stored as a linked list of ziplists (RDB version 7)"""
+        nodes = self.read_length(f)
+        values = []
+        sizeof_nodes = []
+        # The lengths of the entries instead of their values, when the callback does not want them
+        read_entries = self.read_ziplist_entries if self._elements == ELEMENTS_VALUES else self.read_ziplist_lengths
+        for x in xrange(0, nodes) :
+            ziplist = self.read_string(f, is_key = True)
+            sizeof_nodes.append(len(ziplist))
+            values.extend(read_entries(ziplist))
+        self.emit_list(values, {'encoding': 'quicklist', 'sizeof_value': sum(sizeof_nodes), 'nodes': nodes, 
+                                'sizeof_nodes': sizeof_nodes})
+
+    def read_quicklist_2(self, f) :
+        """A list stored as a linked list of listpacks, or of single large elements (RDB version 10)"""
+        nodes = self.read_length(f)
+        values = []
+        sizeof_nodes = []
+        lengths = self._elements != ELEMENTS_VALUES
+        read_entries = self.read_listpack_lengths if lengths else self.read_listpack
+        for x in xrange(0, nodes) :
+            container = self.read_length(f)
+            data = self.read_string(f, is_key = True)
+            sizeof_nodes.append(len(data))
+            if container == QUICKLIST_NODE_CONTAINER_PACKED :
+                values.extend(read_entries(data))
+            elif container == QUICKLIST_NODE_CONTAINER_PLAIN :
+                values.append(len(data) if lengths else data)
+            else :
+                raise Exception('read_quicklist_2', 'Invalid quicklist node container %d for key %s' % (container, self._key))
+        self.emit_list(values, {'encoding': 'quicklist', 'sizeof_value': sum(sizeof_nodes), 'nodes': nodes, 
+                                'sizeof_nodes': sizeof_nodes})
+
+    def read_hash_from_listpack(self, f) :
+        raw_string, info = self.read_blob(f, 'listpack')
+        if self._elements != ELEMENTS_VALUES :
+            self.emit_entry_lengths('hash', self.read_listpack_lengths(raw_string), info)
+            return
+        if self._ignore_real_field and self._ignore_real_value :
+            self.emit_hash(self.read_listpack_lengths(raw_string), info)
+        else :
+            self.emit_hash(self.read_listpack(raw_string), info)
+
+    def read_zset_from_listpack(self, f) :
+        raw_string, info = self.read_blob(f, 'listpack')
+        if self._elements != ELEMENTS_VALUES :
+            self.emit_entry_lengths('sortedset', self.read_listpack_lengths(raw_string), info)
+            return
+        self.emit_sorted_set(self.read_listpack(raw_string), info)
+
+    def read_set_from_listpack(self, f) :
+        raw_string, info = self.read_blob(f, 'listpack')
+        if self._elements != ELEMENTS_VALUES :
+            self.emit_entry_lengths('set', self.read_listpack_lengths(raw_string), info)
+            return
+        self.emit_set(self.read_listpack(raw_string), info)
+
+    def emit_set(self, members, info) :
+        """Calls the callback for a compactly encoded set whose `members` are all decoded, in a single batch"""
+        self._callback.start_set(self._key, len(members), self._expiry, info)
+        if self._batches :
+            if members :
+                self._callback.sadd_many(self._key, members)
+        elif self._raw_bytes :
+            for member in members :
+                self._callback.sadd(self._key, member, None)
+        else :
+            for member in members :
+                self._callback.sadd(self._key, member)
+        self._callback.end_set(self._key)
+
+    def emit_sorted_set(self, values, info) :
+        """Calls the callback for a compactly encoded sorted set, from its decoded members and scores"""
+        if len(values) % 2 :
+            raise Exception('emit_sorted_set', "Expected even number of elements, but found %d for key %s" % (len(values), self._key))
+        # Scores are integers, or strings for the other numbers
+        pairs = [(float(score) if isinstance(score, str) else score, member) 
+                 for member, score in zip(values[0::2], values[1::2])]
+        self._callback.start_sorted_set(self._key, len(pairs), self._expiry, info)
+        if self._batches :
+            if pairs :
+                self._callback.zadd_many(self._key, pairs)
+        elif self._raw_bytes :
+            for score, member in pairs :
+                self._callback.zadd(self._key, score, member, None)
+        else :
+            for score, member in pairs :
+                self._callback.zadd(self._key, score, member)
+        self._callback.end_sorted_set(self._key)
+
+    def emit_hash(self, values, info) :
+        """Calls the callback for a compactly encoded hash, from its decoded fields and values"""
+        if len(values) % 2 :
+            raise Exception('emit_hash', "Expected even number of elements, but found %d for key %s" % (len(values), self._key))
+        fields = values[0::2]
+        if self._ignore_real_field :
+            fields = [None] * len(fields)
+        values = values[1::2]
+        if self._ignore_real_value :
+            values = [None] * len(values)
+        self._callback.start_hash(self._key, len(fields), self._expiry, info)
+        pairs = zip(fields, values)
+        if self._batches :
+            if pairs :
+                self._callback.hset_many(self._key, pairs)
+        elif self._raw_bytes :
+            for field, value in pairs :
+                self._callback.hset(self._key, field, value, None)
+        else :
+            for field, value in pairs :
+                self._callback.hset(self._key, field, value)
+        self._callback.end_hash(self._key)
+
+    def read_stream(self, f, enc_type) :
+        """
+        A stream (RDB version 9) : a radix tree of listpacks that hold the entries, then the metadata 
+        of the stream, and its consumer groups. Version 10 adds the first ID, the maximal deleted ID 
+        and the number of entries added to the metadata, and the number of entries read to the groups. 
+        Version 11 adds the time a consumer was last active.
+        """
+        listpacks_count = self.read_length(f)
+        info = self.key_info({'encoding': 'stream'})
+        if self._raw_bytes :
+            self.raw_info(info)
+        self._callback.start_stream(self._key, listpacks_count, self._expiry, info)
+        sizeof_nodes = []
+        for x in xrange(0, listpacks_count) :
+            # The key of a node in the radix tree is the ID of its first entry, the master ID
+            master_id = self.read_string(f, is_key = True)
+            listpack = self.read_string(f, is_key = True)
+            sizeof_nodes.append(len(listpack))
+            if self._elements == ELEMENTS_NONE :
+                continue
+            entries = self.read_stream_entries(master_id, listpack)
+            if entries :
+                self._callback.stream_entries(self._key, entries)
+
+        read_length = self.read_length
+        info = {'length': read_length(f), 'last_id': '%d-%d' % (read_length(f), read_length(f)),
+                'first_id': None, 'max_deleted_entry_id': None, 'entries_added': None, 
+                'nodes': listpacks_count, 'sizeof_value': sum(sizeof_nodes), 'sizeof_nodes': sizeof_nodes}
+        if enc_type != REDIS_RDB_TYPE_STREAM_LISTPACKS :
+            info['first_id'] = '%d-%d' % (read_length(f), read_length(f))
+            info['max_deleted_entry_id'] = '%d-%d' % (read_length(f), read_length(f))
+            info['entries_added'] = read_length(f)
+
+        info['groups'] = read_length(f)
+        for group in xrange(0, info['groups']) :
+            name = self.read_string(f, is_key = True)
+            last_id = '%d-%d' % (read_length(f), read_length(f))
+            entries_read = None
+            if enc_type != REDIS_RDB_TYPE_STREAM_LISTPACKS :
+                entries_read = read_length(f)
+            pending = []
+            for x in xrange(0, read_length(f)) :
+                entry_id = '%d-%d' % _stream_id.unpack(f.read(16))
+                delivery_time = to_datetime(f.read_unsigned_long() * 1000)
+                pending.append(StreamPendingEntry(entry_id, delivery_time, read_length(f)))
+            consumers = []
+            for x in xrange(0, read_length(f)) :
+                consumer = self.read_string(f, is_key = True)
+                seen_time = to_datetime(f.read_signed_long() * 1000)
+                active_time = None
+                if enc_type == REDIS_RDB_TYPE_STREAM_LISTPACKS_3 :
+                    # -1 when the consumer never read an entry
+                    active_time = f.read_signed_long()
+                    active_time = to_datetime(active_time * 1000) if active_time >= 0 else None
+                # The pending entries of a consumer are the IDs of entries in the pending entries of the group
+                consumer_pending = ['%d-%d' % _stream_id.unpack(f.read(16)) for y in xrange(0, read_length(f))]
+                consumers.append(StreamConsumer(consumer, seen_time, active_time, consumer_pending))
+            self._callback.stream_group(self._key, StreamGroup(name, last_id, entries_read, pending, consumers))
+        self._callback.end_stream(self._key, info)
+
+    def read_stream_entries(self, master_id, listpack) :
+        """
+        Decodes the entries of a listpack of a stream, whose first entry has the ID `master_id` (16 bytes), 
+        and returns them as a list of (entry_id, [(field, value), ...]) tuples. Deleted entries are left out.
+        
+        The listpack starts with the master entry : the number of live and of deleted entries, and the fields 
+        of the first entry, terminated by a 0. Every entry is then a flag, the difference of its ID with the 
+        master ID, either its values when it has the fields of the master entry, or its number of fields 
+        and its fields and values, and finally its number of listpack elements.
+        """
+        master_ms, master_seq = _stream_id.unpack(master_id)
+        values = self.read_listpack(listpack)
+        count = values[0] + values[1]
+        num_master_fields = values[2]
+        master_fields = values[3:3 + num_master_fields]
+        entries = []
+        pos = 4 + num_master_fields
+        for x in xrange(0, count) :
+            flags = values[pos]
+            entry_id = '%d-%d' % (master_ms + values[pos + 1], master_seq + values[pos + 2])
+            if flags & STREAM_ITEM_FLAG_SAMEFIELDS :
+                start = pos + 3
+                end = start + num_master_fields
+                pairs = zip(master_fields, values[start:end])
+            else :
+                start = pos + 4
+                end = start + 2 * values[pos + 3]
+                pairs = zip(values[start:end:2], values[start + 1:end:2])
+            # Skip the number of listpack elements of the entry
+            pos = end + 1
+            if not flags & STREAM_ITEM_FLAG_DELETED :
+                entries.append((entry_id, pairs))
+        return entries
+
+    def emit_list(self, values, info) :
+        """
+        Calls the callback for a list whose `values` are all decoded, or are the lengths 
+        of its elements when the callback does not want them
+        """
+        self.key_info(info)
+        if self._elements != ELEMENTS_VALUES :
+            self.emit_entry_lengths('list', values, info)
+            return
+        if self._raw_bytes :
+            self.raw_info(info)
+        self._callback.start_list(self._key, len(values), self._expiry, info)
+        if self._batches :
+            for start in xrange(0, len(values), self._batch_size) :
+                self._callback.rpush_many(self._key, values[start:start + self._batch_size])
+        elif self._raw_bytes :
+            for value in values :
+                self._callback.rpush(self._key, value, None)
+        else :
+            for value in values :
+                self._callback.rpush(self._key, value)
+        self._callback.end_list(self._key)
+
+    def emit_without_elements(self, data_type, length, info) :
+        """Calls the callback for a collection whose elements are not wanted, see `RdbCallback.wants_elements`"""
+        start, end = COLLECTION_CALLBACKS[data_type]
+        getattr(self._callback, start)(self._key, length, self._expiry, info)
+        getattr(self._callback, end)(self._key)
+
+    def emit_entry_lengths(self, data_type, lengths, info) :
+        """
+        Calls the callback for a compactly encoded collection whose elements are not wanted, 
+        from the `lengths` of its entries. The entries of hashes are fields and values, and 
+        those of sorted sets are members and scores, where scores are not elements.
+        """
+        length = len(lengths)
+        if data_type == 'hash' or data_type == 'sortedset' :
+            if length % 2 :
+                raise Exception('emit_entry_lengths', "Expected even number of elements, but found %d for key %s" % (length, self._key))
+            length /= 2
+            if data_type == 'sortedset' :
+                lengths = lengths[0::2]
+        if self._elements == ELEMENTS_LENGTHS :
+            info['len_largest_element'] = max(lengths) if lengths else 0
+        self.emit_without_elements(data_type, length, info)
+
+    def read_ziplist_lengths(self, ziplist) :
+        """
+        Returns the lengths of the entries of the string `ziplist`, as `element_length` measures their 
+        values, but without decoding them : only the headers of the entries are read.
+        """
+        num_entries = _unsigned_short.unpack_from(ziplist, 8)[0]
+        integers = ZIPLIST_INTEGERS
+        lengths = []
+        append = lengths.append
+        pos = 10
+        while True :
+            prev_length = ord(ziplist[pos])
+            if prev_length == 255 :
+                break
+            elif prev_length == 254 :
+                pos += 5
+            else :
+                pos += 1
+            header = ord(ziplist[pos])
+            if header < 0x40 :
+                append(header)
+                pos += 1 + header
+            elif header < 0x80 :
+                length = ((header & 0x3F) << 8) | ord(ziplist[pos + 1])
+                append(length)
+                pos += 2 + length
+            elif header < 0xC0 :
+                length = _big_endian_unsigned_int.unpack_from(ziplist, pos + 1)[0]
+                append(length)
+                pos += 5 + length
+            elif integers[header] is not None :
+                append(INTEGER_LENGTH)
+                pos += integers[header][0]
+            else :
+                raise Exception('read_ziplist_lengths', 'Invalid entry_header %d for key %s' % (header, self._key))
+        if num_entries != 65535 and num_entries != len(lengths) :
+            raise Exception('read_ziplist_lengths', 'Expected %d entries, but found %d for key %s' % (num_entries, len(lengths), self._key))
+        return lengths
+
+    def read_ziplist_entries(self, ziplist) :
+        """
+        Decodes all the entries of the string `ziplist`, and returns them as a list of strings and integers.
+        
+        The entries are decoded in a single pass, by offset, like `read_listpack`. Every entry starts 
+        with the length of the previous one (1 or 5 bytes), which is skipped, and then its encoding. 
+        Strings are sliced out, and integers are decoded through the `ZIPLIST_INTEGERS` table.
+        """
+        # Header : total bytes, offset of the last entry (32 bits), number of entries (16 bits, 65535 when there are more)
+        num_entries = _unsigned_short.unpack_from(ziplist, 8)[0]
+        integers = ZIPLIST_INTEGERS
+        values = []
+        append = values.append
+        pos = 10
+        while True :
+            prev_length = ord(ziplist[pos])
+            if prev_length == 255 :
+                break
+            elif prev_length == 254 :
+                pos += 5
+            else :
+                pos += 1
+            header = ord(ziplist[pos])
+            if header < 0x40 :
+                length = header
+                append(ziplist[pos + 1:pos + 1 + length])
+                pos += 1 + length
+            elif header < 0x80 :
+                length = ((header & 0x3F) << 8) | ord(ziplist[pos + 1])
+                append(ziplist[pos + 2:pos + 2 + length])
+                pos += 2 + length
+            elif header < 0xC0 :
+                length = _big_endian_unsigned_int.unpack_from(ziplist, pos + 1)[0]
+                append(ziplist[pos + 5:pos + 5 + length])
+                pos += 5 + length
+            else :
+                integer = integers[header]
+                if integer is None :
+                    raise Exception('read_ziplist_entries', 'Invalid entry_header %d for key %s' % (header, self._key))
+                size, unpack_from, value = integer
+                append(unpack_from(ziplist, pos + 1)[0] if unpack_from else value)
+                pos += size
+        if num_entries != 65535 and num_entries != len(values) :
+            raise Exception('read_ziplist_entries', 'Expected %d entries, but found %d for key %s' % (num_entries, len(values), self._key))
+        return values
+
+    def read_listpack(self, listpack) :
+        """
+        Decodes all the entries of the string `listpack`, and returns them as a list of strings and integers.
+        
+        The entries are decoded in a single pass, by offset : every entry starts with its encoding, 
+        and ends with its own length encoded in 1 to 5 bytes (the "backlen", to iterate backwards), 
+        which is skipped by computing its size.
+        """
+        # Header : total bytes (32 bits), number of entries (16 bits, 65535 when there are more)
+        num_entries = _unsigned_short.unpack_from(listpack, 4)[0]
+        values = []
+        append = values.append
+        pos = 6
+        while True :
+            header = ord(listpack[pos])
+            if header < 0x80 :
+                # 7 bit unsigned integer
+                append(header)
+                size = 1
+            elif header < 0xC0 :
+                # String of up to 63 bytes
+                length = header & 0x3F
+                append(listpack[pos + 1:pos + 1 + length])
+                size = 1 + length
+            elif header < 0xE0 :
+                # 13 bit signed integer
+                value = ((header & 0x1F) << 8) | ord(listpack[pos + 1])
+                if value >= 1 << 12 :
+                    value -= 1 << 13
+                append(value)
+                size = 2
+            elif header < 0xF0 :
+                # String of up to 4095 bytes
+                length = ((header & 0x0F) << 8) | ord(listpack[pos + 1])
+                append(listpack[pos + 2:pos + 2 + length])
+                size = 2 + length
+            elif header == 0xF0 :
+                length = _unsigned_int.unpack_from(listpack, pos + 1)[0]
+                append(listpack[pos + 5:pos + 5 + length])
+                size = 5 + length
+            elif header == 0xF1 :
+                append(_signed_short.unpack_from(listpack, pos + 1)[0])
+                size = 3
+            elif header == 0xF2 :
+                append(_signed_int.unpack('\x00' + listpack[pos + 1:pos + 4])[0] >> 8)
+                size = 4
+            elif header == 0xF3 :
+                append(_signed_int.unpack_from(listpack, pos + 1)[0])
+                size = 5
+            elif header == 0xF4 :
+                append(_signed_long.unpack_from(listpack, pos + 1)[0])
+                size = 9
+            elif header == 0xFF :
+                break
+            else :
+                raise Exception('read_listpack', 'Invalid listpack entry header %d for key %s' % (header, self._key))
+            if size < 128 :
+                pos += size + 1
+            else :
+                pos += size + listpack_backlen_size(size)
+        if num_entries != 65535 and num_entries != len(values) :
+            raise Exception('read_listpack', 'Expected %d entries, but found %d for key %s' % (num_entries, len(values), self._key))
+        return values
+
+    def read_listpack_lengths(self, listpack) :
+        """
+        Returns the lengths of the entries of the string `listpack`, as `element_length` measures their 
+        values, but without decoding them : only the headers of the entries are read.
+        """
+        num_entries = _unsigned_short.unpack_from(listpack, 4)[0]
+        lengths = []
+        append = lengths.append
+        pos = 6
+        while True :
+            header = ord(listpack[pos])
+            if header < 0x80 :
+                append(INTEGER_LENGTH)
+                size = 1
+            elif header < 0xC0 :
+                append(header & 0x3F)
+                size = 1 + (header & 0x3F)
+            elif header < 0xE0 :
+                append(INTEGER_LENGTH)
+                size = 2
+            elif header < 0xF0 :
+                length = ((header & 0x0F) << 8) | ord(listpack[pos + 1])
+                append(length)
+                size = 2 + length
+            elif header == 0xF0 :
+                length = _unsigned_int.unpack_from(listpack, pos + 1)[0]
+                append(length)
+                size = 5 + length
+            elif header in LISTPACK_INT_SIZES :
+                append(INTEGER_LENGTH)
+                size = 1 + LISTPACK_INT_SIZES[header]
+            elif header == 0xFF :
+                break
+            else :
+                raise Exception('read_listpack_lengths', 'Invalid listpack entry header %d for key %s' % (header, self._key))
+            if size < 128 :
+                pos += size + 1
+            else :
+                pos += size + listpack_backlen_size(size)
+        if num_entries != 65535 and num_entries != len(lengths) :
+            raise Exception('read_listpack_lengths', 'Expected %d entries, but found %d for key %s' % (num_entries, len(lengths), self._key))
+        return lengths
+
     def read_zipmap(self, f) :
-        raw_string, orig_raw_string = self.read_string(f)
-        buff = io.BytesIO(bytearray(raw_string))
-        num_entries = read_unsigned_char(buff)[0]
-        info = {'encoding':'zipmap', 
-                'sizeof_value':len(raw_string),
-                'orig_data_type': self._orig_data_type,
-                'orig_expiry': self._orig_expiry,
-                'orig_key': self._orig_key,
-                'orig_raw_string': orig_raw_string
-                }
+        raw = self._raw_bytes
+        raw_string, info = self.read_blob(f, 'zipmap')
+        buff = BufferReader(raw_string)
+        num_entries = buff.read_unsigned_char()
+        if self._elements != ELEMENTS_VALUES :
+            if self._elements == ELEMENTS_LENGTHS :
+                lengths = self.read_zipmap_lengths(raw_string)
+                info['len_largest_element'] = max(lengths) if lengths else 0
+            self.emit_without_elements('hash', num_entries, info)
+            return
         self._callback.start_hash(self._key, num_entries, self._expiry, info)
+        pairs = []
         while True :
             next_length = self.read_zipmap_next_length(buff)
             if next_length is None :
@@ -694,23 +1874,71 @@ class RdbParser :
             next_length = self.read_zipmap_next_length(buff)
             if next_length is None :
                 raise Exception('read_zip_map', 'Unexepcted end of zip map for key %s' % self._key)        
-            free = read_unsigned_char(buff)[0]
+            free = buff.read_unsigned_char()
             value = buff.read(next_length)
             try:
                 value = int(value)
             except ValueError:
                 pass
             
-            skip(buff, free)
-            self._callback.hset(self._key, key, value)
+            buff.skip(free)
+            if self._batches :
+                pairs.append((key, value))
+            elif raw :
+                self._callback.hset(self._key, key, value, None)
+            else :
+                self._callback.hset(self._key, key, value)
+        if pairs :
+            self._callback.hset_many(self._key, pairs)
         self._callback.end_hash(self._key)
 
+    def read_zipmap_lengths(self, zipmap) :
+        """
+        Returns the lengths of the fields and values of the string `zipmap`, as `element_length` measures 
+        them once decoded, but reading only the headers of the entries, and the values that could be integers.
+        """
+        integer_starts = ZIPMAP_INTEGER_STARTS
+        lengths = []
+        append = lengths.append
+        pos = 1
+        while True :
+            # Header : length of the field, field, length of the value, free bytes after the value, value
+            length = ord(zipmap[pos])
+            if length == 255 :
+                break
+            elif length == 254 :
+                length = _unsigned_int.unpack_from(zipmap, pos + 1)[0]
+                pos += 5
+            else :
+                pos += 1
+            append(length)
+            pos += length
+            length = ord(zipmap[pos])
+            if length == 255 :
+                raise Exception('read_zipmap_lengths', 'Unexepcted end of zip map for key %s' % self._key)
+            elif length == 254 :
+                length = _unsigned_int.unpack_from(zipmap, pos + 1)[0]
+                pos += 5
+            else :
+                pos += 1
+            free = ord(zipmap[pos])
+            pos += 1
+            if length and zipmap[pos] in integer_starts :
+                try :
+                    append(element_length(int(zipmap[pos:pos + length])))
+                except ValueError :
+                    append(length)
+            else :
+                append(length)
+            pos += length + free
+        return lengths
+
     def read_zipmap_next_length(self, f) :
-        num = read_unsigned_char(f)[0]
+        num = f.read_unsigned_char()
         if num < 254:
             return num
         elif num == 254:
-            return read_unsigned_int(f)[0]
+            return f.read_unsigned_int()
         else:
             return None
 
@@ -720,8 +1948,24 @@ class RdbParser :
 
     def verify_version(self, version_str) :
         version = int(version_str)
-        if version < 1 or version > 6 : 
+        if version < REDIS_RDB_MIN_VERSION or version > REDIS_RDB_MAX_VERSION : 
             raise Exception('verify_version', 'Invalid RDB version number %d' % version)
+        self._rdb_version = version
+
+    def verify_checksum(self, f) :
+        """
+        Verifies the CRC64 that follows the EOF opcode, which `f` has just read. Dumps older than 
+        RDB version 5 have no checksum, and a checksum of 0 means that it was disabled (rdbchecksum no).
+        """
+        if self._rdb_version < REDIS_RDB_CHECKSUM_VERSION :
+            return
+        computed = f.checksum()
+        expected = f.read(8)
+        if len(expected) != 8 :
+            raise Exception('verify_checksum', 'The dump is truncated, its checksum is missing')
+        expected = _unsigned_long.unpack(expected)[0]
+        if expected != 0 and expected != computed :
+            raise Exception('verify_checksum', 'Checksum mismatch : the dump ends with %016x, but its content has %016x' % (expected, computed))
 
     def init_filter(self, filters):
         self._filters = {}
@@ -737,13 +1981,31 @@ class RdbParser :
         else:
             raise Exception('init_filter', 'invalid value for dbs in filter %s' %filters['dbs'])
         
+        # Key filters are a list of functions that take the key as a string
+        self._key_filters = []
         if not ('keys' in filters and filters['keys']):
             self._filters['keys'] = re.compile(".*")
         else:
             self._filters['keys'] = re.compile(filters['keys'])
+            self._key_filters.append(self._filters['keys'].match)
+
+        if filters.get('prefixes') is not None:
+            self._key_filters.append(as_prefix_set(filters['prefixes']).matches)
+        if filters.get('exclude_prefixes'):
+            excluded_prefixes = as_prefix_set(filters['exclude_prefixes'])
+            self._key_filters.append(lambda key: not excluded_prefixes.matches(key))
+        if filters.get('exact_keys') is not None:
+            self._key_filters.append(as_key_set(filters['exact_keys']).__contains__)
+        if filters.get('exclude_keys'):
+            excluded_keys = as_key_set(filters['exclude_keys'])
+            self._key_filters.append(lambda key: key not in excluded_keys)
+        if filters.get('sample') is not None:
+            sample = KeySample(filters['sample'])
+            if sample.rate < 1:
+                self._key_filters.append(sample.matches)
 
         if not 'types' in filters:
-            self._filters['types'] = ('set', 'hash', 'sortedset', 'string', 'list')
+            self._filters['types'] = ('set', 'hash', 'sortedset', 'string', 'list', 'stream')
         elif isinstance(filters['types'], str):
             self._filters['types'] = (filters['types'], )
         elif isinstance(filters['types'], list):
@@ -753,23 +2015,18 @@ class RdbParser :
 
     def init_ignore(self, ignore):
         if not ignore:
-            return
-
-        if 'real_value' in ignore:
-            self._ignore_real_value = True
-        else:
-            self._ignore_real_value = False
-
-        if 'real_field' in ignore:
-            self._ignore_real_field = True
-        else:
-            self._ignore_real_field = True
+            ignore = ()
+        self._ignore_real_value = 'real_value' in ignore
+        self._ignore_real_field = 'real_field' in ignore
 
     def matches_filter(self, db_number, key=None, data_type=None):
         if self._filters['dbs'] and (not db_number in self._filters['dbs']):
             return False
-        if key and (not self._filters['keys'].match(str(key))):
-            return False
+        if key is not None and self._key_filters:
+            key = str(key)
+            for matches in self._key_filters:
+                if not matches(key):
+                    return False
 
         if data_type is not None and (not self.get_logical_type(data_type) in self._filters['types']):
             return False
@@ -778,107 +2035,763 @@ class RdbParser :
     def get_logical_type(self, data_type):
         return DATA_TYPE_MAPPING[data_type]
         
-    # we can use https://github.com/teepark/python-lzf
-    # it is faster than pure python function below
+    # Uses https://github.com/teepark/python-lzf when it is installed, and the 
+    # pure python `lzf_decompress` below otherwise. Subclasses can override this 
+    # method to plug in another decompressor.
     def lzf_decompress(self, compressed, expected_length):
-        in_stream = bytearray(compressed)
-        in_len = len(in_stream)
-        in_index = 0
-        out_stream = bytearray()
-        out_index = 0
-    
-        while in_index < in_len :
-            ctrl = in_stream[in_index]
-            if not isinstance(ctrl, int) :
-                raise Exception('lzf_decompress', 'ctrl should be a number %s for key %s' % (str(ctrl), self._key))
+        if HAS_PYTHON_LZF :
+            # python-lzf returns None if the output does not fit in expected_length bytes
+            out_stream = lzf.decompress(compressed, expected_length)
+        else :
+            out_stream = lzf_decompress(compressed, expected_length)
+        if out_stream is None or len(out_stream) != expected_length :
+            raise Exception('lzf_decompress', 'Expected %d bytes after decompression for key %s' % (expected_length, self._key))
+        return out_stream
+
+def lzf_decompress(compressed, expected_length):
+    """
+    Decompresses a string compressed with LZF (see lzf_d.c in the redis sources).
+    
+    Literal runs and back references are copied as slices instead of byte by byte. 
+    A back reference may overlap the bytes it produces, i.e. start less than its 
+    length before the end of the output. The bytes it copies then repeat with a 
+    period equal to its distance, so the copy is built by repeating that slice.
+    """
+    in_stream = bytearray(compressed)
+    in_len = len(in_stream)
+    in_index = 0
+    out_stream = bytearray()
+
+    while in_index < in_len :
+        ctrl = in_stream[in_index]
+        in_index = in_index + 1
+        if ctrl < 32 :
+            # Literal run of ctrl + 1 bytes
+            end = in_index + ctrl + 1
+            out_stream += in_stream[in_index:end]
+            in_index = end
+        else :
+            # Back reference of (ctrl >> 5) + 2 bytes, where a length of 7 continues in the next byte
+            length = ctrl >> 5
+            if length == 7 :
+                length = length + in_stream[in_index]
+                in_index = in_index + 1
+            length = length + 2
+            out_len = len(out_stream)
+            ref = out_len - ((ctrl & 0x1f) << 8) - in_stream[in_index] - 1
             in_index = in_index + 1
-            if ctrl < 32 :
-                for x in xrange(0, ctrl + 1) :
-                    out_stream.append(in_stream[in_index])
-                    #sys.stdout.write(chr(in_stream[in_index]))
-                    in_index = in_index + 1
-                    out_index = out_index + 1
+            if ref < 0 :
+                raise Exception('lzf_decompress', 'Invalid back reference %d' % ref)
+            if ref + length <= out_len :
+                out_stream += out_stream[ref:ref + length]
             else :
-                length = ctrl >> 5
-                if length == 7 :
-                    length = length + in_stream[in_index]
-                    in_index = in_index + 1
-                
-                ref = out_index - ((ctrl & 0x1f) << 8) - in_stream[in_index] - 1
-                in_index = in_index + 1
-                for x in xrange(0, length + 2) :
-                    out_stream.append(out_stream[ref])
-                    ref = ref + 1
-                    out_index = out_index + 1
-        if len(out_stream) != expected_length :
-            raise Exception('lzf_decompress', 'Expected lengths do not match %d != %d for key %s' % (len(out_stream), expected_length, self._key))
-        return str(out_stream)
-
-def skip(f, free):
-    if free :
-        f.read(free)
-
-def ntohl(f) :
-    val, orig_val = read_unsigned_int(f)
-    new_val = 0
-    new_val = new_val | ((val & 0x000000ff) << 24)
-    new_val = new_val | ((val & 0xff000000) >> 24)
-    new_val = new_val | ((val & 0x0000ff00) << 8)
-    new_val = new_val | ((val & 0x00ff0000) >> 8)
-    return new_val, orig_val
-
-#def to_datetime(usecs_since_epoch):
-#    seconds_since_epoch = usecs_since_epoch / 1000000
-#    useconds = usecs_since_epoch % 1000000
-#    dt = datetime.datetime.utcfromtimestamp(seconds_since_epoch)
-#    delta = datetime.timedelta(microseconds = useconds)
-#    return dt + delta
- 
-def to_datetime(usecs_since_epoch):
-    seconds_since_epoch = usecs_since_epoch / 1000000
-    return seconds_since_epoch
+                distance = out_len - ref
+                out_stream += (out_stream[ref:] * (length // distance + 1))[:length]
+    return str(out_stream)
+
+# Precompiled structs for the fixed width fields of the dump file.
+# Everything except the 32 bit lengths is stored little endian.
+_signed_char = struct.Struct('<b')
+_unsigned_char = struct.Struct('<B')
+_signed_short = struct.Struct('<h')
+_unsigned_short = struct.Struct('<H')
+_signed_int = struct.Struct('<i')
+_unsigned_int = struct.Struct('<I')
+_big_endian_unsigned_int = struct.Struct('>I')
+_signed_long = struct.Struct('<q')
+_unsigned_long = struct.Struct('<Q')
+_big_endian_unsigned_long = struct.Struct('>Q')
+_double = struct.Struct('<d')
+
+def _unpack_int24(buf, offset):
+    return (_signed_int.unpack('\x00' + buf[offset:offset + 3])[0] >> 8,)
+
+def _ziplist_integers():
+    table = [None] * 256
+    table[0xC0] = (3, _signed_short.unpack_from, None)
+    table[0xD0] = (5, _signed_int.unpack_from, None)
+    table[0xE0] = (9, _signed_long.unpack_from, None)
+    table[0xF0] = (4, _unpack_int24, None)
+    table[0xFE] = (2, _signed_char.unpack_from, None)
+    for header in xrange(0xF1, 0xFE) :
+        # 4 bit immediate integer, between 0 and 12
+        table[header] = (1, None, header - 0xF1)
+    return table
+
+# The integer encodings of ziplist entries, by header : (size of the entry without its previous length, 
+# unpack_from function of the integer after the header, or None for an immediate integer, immediate integer)
+ZIPLIST_INTEGERS = _ziplist_integers()
+
+# The first characters of the strings that `int` may decode : the values of zipmaps are decoded as integers when they can be
+ZIPMAP_INTEGER_STARTS = frozenset('0123456789+- \t\n\r\x0b\x0c')
+
+def element_length(element):
+    """The length of an element of a collection, as the memory profiler counts it"""
+    if isinstance(element, int):
+        return INTEGER_LENGTH
+    if isinstance(element, long):
+        return 16
+    else:
+        return len(element)
+
+def encoded_string_length(f, encoding) :
+    """
+    Returns the number of bytes of a string with a special `encoding` (one of REDIS_RDB_ENC_*), 
+    reading its headers from the reader `f`
+    """
+    if encoding == REDIS_RDB_ENC_INT8 :
+        return 1
+    elif encoding == REDIS_RDB_ENC_INT16 :
+        return 2
+    elif encoding == REDIS_RDB_ENC_INT32 :
+        return 4
+    elif encoding == REDIS_RDB_ENC_LZF :
+        clen = f.read_length_with_encoding()[0]
+        f.read_length_with_encoding()
+        return clen
+    raise Exception('encoded_string_length', 'Invalid string encoding %s' % encoding)
+
+class FileReader(object):
+    """
+    Reads a dump through a file object, issuing one `read` per field.
+    
+    Every reader exposes the same interface, so the parser does not care 
+    where the bytes come from :
+        read(n), skip(n), tell(), seek(offset), raw(start, end), close(), checksum(), size()
+        read_length_with_encoding(), skip_strings(count, scores)
+        read_unsigned_char(), read_signed_int(), ..., read_double() for each fixed width field
+    """
+    def __init__(self, f):
+        self._f = f
+
+    def read(self, n):
+        return self._f.read(n)
+
+    def skip(self, n):
+        if n :
+            self._f.seek(n, 1)
+
+    def tell(self):
+        return self._f.tell()
+
+    def seek(self, offset):
+        self._f.seek(offset)
+
+    def raw(self, start, end = None):
+        """Returns the bytes between the offsets `start` and `end`, which defaults to the current position"""
+        pos = self._f.tell()
+        if end is None:
+            end = pos
+        self._f.seek(start)
+        data = self._f.read(end - start)
+        self._f.seek(pos)
+        return data
+
+    def close(self):
+        pass
+
+    def size(self):
+        """Returns the size of the dump, or None if it is not known"""
+        pos = self._f.tell()
+        self._f.seek(0, 2)
+        size = self._f.tell()
+        self._f.seek(pos)
+        return size
+
+    def checksum(self):
+        """Returns the CRC64 of the bytes before the current position"""
+        pos = self._f.tell()
+        self._f.seek(0)
+        crc = 0
+        while self._f.tell() < pos :
+            data = self._f.read(min(CHECKSUM_BLOCK_SIZE, pos - self._f.tell()))
+            if not data :
+                break
+            crc = crc64(data, crc)
+        self._f.seek(pos)
+        return crc
+
+    def read_length_with_encoding(self) :
+        """
+        Reads a length, returning a tuple (length, is_encoded). When `is_encoded` is True, 
+        `length` is one of the REDIS_RDB_ENC_* special string encodings instead of a length
+        """
+        data = _unsigned_char.unpack(self._f.read(1))[0]
+        enc_type = data >> 6
+        if enc_type == REDIS_RDB_6BITLEN :
+            return data & 0x3F, False
+        elif enc_type == REDIS_RDB_14BITLEN :
+            return ((data & 0x3F) << 8) | _unsigned_char.unpack(self._f.read(1))[0], False
+        elif data == REDIS_RDB_64BITLEN :
+            return _big_endian_unsigned_long.unpack(self._f.read(8))[0], False
+        elif enc_type == REDIS_RDB_32BITLEN :
+            return _big_endian_unsigned_int.unpack(self._f.read(4))[0], False
+        else :
+            return data & 0x3F, True
+
+    def skip_strings(self, count, scores = False) :
+        """
+        Skips `count` strings by seeking past them. Only their length headers are read. 
+        With `scores`, every string is followed by a sorted set score, which is skipped too
+        """
+        for x in xrange(0, count) :
+            length, is_encoded = self.read_length_with_encoding()
+            if is_encoded :
+                length = encoded_string_length(self, length)
+            if scores :
+                self.skip(length)
+                length = self.read_unsigned_char()
+                if length >= 253 :
+                    # NaN and infinities have no payload
+                    length = 0
+            self.skip(length)
+
+    def read_signed_char(self) :
+        return _signed_char.unpack(self._f.read(1))[0]
+
+    def read_unsigned_char(self) :
+        return _unsigned_char.unpack(self._f.read(1))[0]
+
+    def read_signed_short(self) :
+        return _signed_short.unpack(self._f.read(2))[0]
+
+    def read_unsigned_short(self) :
+        return _unsigned_short.unpack(self._f.read(2))[0]
+
+    def read_signed_int(self) :
+        return _signed_int.unpack(self._f.read(4))[0]
+
+    def read_unsigned_int(self) :
+        return _unsigned_int.unpack(self._f.read(4))[0]
+
+    def read_big_endian_unsigned_int(self) :
+        return _big_endian_unsigned_int.unpack(self._f.read(4))[0]
+
+    def read_24bit_signed_number(self) :
+        return _signed_int.unpack('\x00' + self._f.read(3))[0] >> 8
+
+    def read_signed_long(self) :
+        return _signed_long.unpack(self._f.read(8))[0]
+
+    def read_unsigned_long(self) :
+        return _unsigned_long.unpack(self._f.read(8))[0]
+
+    def read_double(self) :
+        return _double.unpack(self._f.read(8))[0]
+
+class BufferReader(object):
+    """
+    Reads a dump from an in-memory buffer (a string or a memory mapped file).
     
-def read_signed_char(f) :
-    data = f.read(1)
-    return struct.unpack('b', data)[0], data
+    Fields are decoded in place with `struct.Struct.unpack_from` at a cursor, 
+    so reading a field costs neither a file call nor a temporary string.
+    See `FileReader` for the interface.
+    """
+    def __init__(self, buf, pos = 0):
+        self._buf = buf
+        self._pos = pos
+
+    def read(self, n):
+        pos = self._pos
+        self._pos = pos + n
+        return self._buf[pos:pos + n]
+
+    def skip(self, n):
+        self._pos += n
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset):
+        self._pos = offset
+
+    def raw(self, start, end = None):
+        if end is None:
+            end = self._pos
+        return self._buf[start:end]
+
+    def close(self):
+        pass
+
+    def size(self):
+        return len(self._buf)
+
+    def checksum(self):
+        pos = self._pos
+        crc = 0
+        for start in xrange(0, pos, CHECKSUM_BLOCK_SIZE) :
+            crc = crc64(self._buf[start:min(start + CHECKSUM_BLOCK_SIZE, pos)], crc)
+        return crc
+
+    def read_length_with_encoding(self) :
+        buf = self._buf
+        pos = self._pos
+        data = ord(buf[pos])
+        enc_type = data >> 6
+        if enc_type == REDIS_RDB_6BITLEN :
+            self._pos = pos + 1
+            return data & 0x3F, False
+        elif enc_type == REDIS_RDB_14BITLEN :
+            self._pos = pos + 2
+            return ((data & 0x3F) << 8) | ord(buf[pos + 1]), False
+        elif data == REDIS_RDB_64BITLEN :
+            self._pos = pos + 9
+            return _big_endian_unsigned_long.unpack_from(buf, pos + 1)[0], False
+        elif enc_type == REDIS_RDB_32BITLEN :
+            self._pos = pos + 5
+            return _big_endian_unsigned_int.unpack_from(buf, pos + 1)[0], False
+        else :
+            self._pos = pos + 1
+            return data & 0x3F, True
+
+    def skip_strings(self, count, scores = False) :
+        buf = self._buf
+        pos = self._pos
+        for x in xrange(0, count) :
+            data = ord(buf[pos])
+            enc_type = data >> 6
+            if enc_type == REDIS_RDB_6BITLEN :
+                pos += 1 + (data & 0x3F)
+            elif enc_type == REDIS_RDB_14BITLEN :
+                pos += 2 + (((data & 0x3F) << 8) | ord(buf[pos + 1]))
+            elif data == REDIS_RDB_64BITLEN :
+                pos += 9 + _big_endian_unsigned_long.unpack_from(buf, pos + 1)[0]
+            elif enc_type == REDIS_RDB_32BITLEN :
+                pos += 5 + _big_endian_unsigned_int.unpack_from(buf, pos + 1)[0]
+            else :
+                self._pos = pos + 1
+                length = encoded_string_length(self, data & 0x3F)
+                pos = self._pos + length
+            if scores :
+                data = ord(buf[pos])
+                pos += 1
+                if data < 253 :
+                    pos += data
+        self._pos = pos
+
+    def read_signed_char(self) :
+        pos = self._pos
+        self._pos = pos + 1
+        return _signed_char.unpack_from(self._buf, pos)[0]
+
+    def read_unsigned_char(self) :
+        # Indexing a single byte is cheaper than unpack_from
+        pos = self._pos
+        self._pos = pos + 1
+        return ord(self._buf[pos])
+
+    def read_signed_short(self) :
+        pos = self._pos
+        self._pos = pos + 2
+        return _signed_short.unpack_from(self._buf, pos)[0]
+
+    def read_unsigned_short(self) :
+        pos = self._pos
+        self._pos = pos + 2
+        return _unsigned_short.unpack_from(self._buf, pos)[0]
+
+    def read_signed_int(self) :
+        pos = self._pos
+        self._pos = pos + 4
+        return _signed_int.unpack_from(self._buf, pos)[0]
+
+    def read_unsigned_int(self) :
+        pos = self._pos
+        self._pos = pos + 4
+        return _unsigned_int.unpack_from(self._buf, pos)[0]
+
+    def read_big_endian_unsigned_int(self) :
+        pos = self._pos
+        self._pos = pos + 4
+        return _big_endian_unsigned_int.unpack_from(self._buf, pos)[0]
+
+    def read_24bit_signed_number(self) :
+        pos = self._pos
+        self._pos = pos + 3
+        return _signed_int.unpack('\x00' + self._buf[pos:pos + 3])[0] >> 8
+
+    def read_signed_long(self) :
+        pos = self._pos
+        self._pos = pos + 8
+        return _signed_long.unpack_from(self._buf, pos)[0]
+
+    def read_unsigned_long(self) :
+        pos = self._pos
+        self._pos = pos + 8
+        return _unsigned_long.unpack_from(self._buf, pos)[0]
+
+    def read_double(self) :
+        pos = self._pos
+        self._pos = pos + 8
+        return _double.unpack_from(self._buf, pos)[0]
+
+class MmapReader(BufferReader):
+    """
+    Memory maps an open file and reads it as a `BufferReader`.
     
-def read_unsigned_char(f) :
-    data = f.read(1)
-    return struct.unpack('B', data)[0], data
+    Python 2 cannot take a memoryview of an mmap, but the mmap object itself 
+    supports the buffer interface; `unpack_from` reads it in place and slicing 
+    it copies only the bytes asked for.
+    """
+    def __init__(self, f):
+        self._mmap = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        BufferReader.__init__(self, self._mmap)
 
-def read_signed_short(f) :
-    data = f.read(2)
-    return struct.unpack('h', data)[0], data
-        
-def read_unsigned_short(f) :
-    data = f.read(2)
-    return struct.unpack('H', data)[0], data
+    def close(self):
+        self._mmap.close()
+
+def _buffered(read, size):
+    """Wraps the `BufferReader` method `read` of a fixed width field, to buffer its `size` bytes first"""
+    def read_buffered(self):
+        if len(self._buf) - self._pos < size :
+            self._fill(size)
+        return read(self)
+    return read_buffered
+
+class StreamReader(BufferReader):
+    """
+    Reads a dump from a stream that cannot seek : a pipe, standard input or a decompressing file object.
+    
+    The stream is read in blocks of `buffer_size` bytes, which are decoded in place as a `BufferReader`. 
+    Skipped strings are read and discarded, and `seek` only moves forward, or back within the block.
 
-def read_signed_int(f) :
-    data = f.read(4)
-    return struct.unpack('i', data)[0], data
+    `raw` can only return bytes that are still buffered. With `keep_raw`, the bytes from the 
+    last `tell` are kept in the buffer, which is what callbacks that want raw bytes need.
     
-def read_unsigned_int(f) :
-    data = f.read(4)
-    return struct.unpack('I', data)[0], data
+    The bytes of a stream cannot be read again, so `checksum` needs `checksum = True` : 
+    the bytes are then folded into a CRC64 as they leave the buffer.
+    """
+    def __init__(self, f, buffer_size = 1 << 20, keep_raw = False, checksum = False):
+        BufferReader.__init__(self, '')
+        self._f = f
+        self._buffer_size = buffer_size
+        self._keep_raw = keep_raw
+        # Offset in the stream of the first byte of the buffer, and of the last `tell`
+        self._base = 0
+        self._mark = 0
+        # CRC64 of the bytes before the buffer
+        self._crc = 0 if checksum else None
+
+    def _fill(self, n):
+        """Reads from the stream until `n` bytes are buffered after the cursor, or the stream ends"""
+        pos = self._pos
+        have = len(self._buf) - pos
+        keep = pos
+        if self._keep_raw :
+            keep = min(pos, self._mark - self._base)
+        if self._crc is not None and keep :
+            self._crc = crc64(self._buf[:keep], self._crc)
+        chunks = [self._buf[keep:]]
+        while have < n :
+            chunk = self._f.read(max(n - have, self._buffer_size))
+            if not chunk :
+                break
+            chunks.append(chunk)
+            have += len(chunk)
+        self._buf = ''.join(chunks)
+        self._base += keep
+        self._pos = pos - keep
+
+    def read(self, n):
+        pos = self._pos
+        if len(self._buf) - pos < n :
+            self._fill(n)
+            pos = self._pos
+        self._pos = pos + n
+        return self._buf[pos:pos + n]
+
+    def skip(self, n):
+        available = len(self._buf) - self._pos
+        if n <= available :
+            self._pos += n
+        elif self._keep_raw :
+            self._fill(n)
+            self._pos = min(self._pos + n, len(self._buf))
+        else :
+            n -= available
+            if self._crc is not None :
+                self._crc = crc64(self._buf, self._crc)
+            self._base += len(self._buf)
+            self._buf = ''
+            self._pos = 0
+            while n > 0 :
+                chunk = self._f.read(min(n, self._buffer_size))
+                if not chunk :
+                    break
+                if self._crc is not None :
+                    self._crc = crc64(chunk, self._crc)
+                self._base += len(chunk)
+                n -= len(chunk)
+
+    def tell(self):
+        offset = self._base + self._pos
+        if self._keep_raw :
+            self._mark = offset
+        return offset
+
+    def seek(self, offset):
+        if offset < self._base :
+            raise Exception('seek', 'Cannot seek back to offset %d of a stream, the buffer starts at %d' % (offset, self._base))
+        self.skip(offset - self._base - self._pos)
+
+    def raw(self, start, end = None):
+        if end is None:
+            end = self._base + self._pos
+        if start < self._base :
+            raise Exception('raw', 'Bytes at offset %d of the stream are no longer buffered' % start)
+        return self._buf[start - self._base:end - self._base]
+
+    def size(self):
+        return None
+
+    def checksum(self):
+        if self._crc is None :
+            raise Exception('checksum', 'The stream is not checksummed, open the StreamReader with checksum = True')
+        return crc64(self._buf[:self._pos], self._crc)
+
+    def read_length_with_encoding(self) :
+        # A length takes at most 9 bytes. Fewer may be left at the end of the stream
+        pos = self._pos
+        if len(self._buf) - pos < 9 :
+            self._fill(9)
+            pos = self._pos
+        buf = self._buf
+        data = ord(buf[pos])
+        enc_type = data >> 6
+        if enc_type == REDIS_RDB_6BITLEN :
+            self._pos = pos + 1
+            return data & 0x3F, False
+        elif enc_type == REDIS_RDB_14BITLEN :
+            self._pos = pos + 2
+            return ((data & 0x3F) << 8) | ord(buf[pos + 1]), False
+        elif data == REDIS_RDB_64BITLEN :
+            self._pos = pos + 9
+            return _big_endian_unsigned_long.unpack_from(buf, pos + 1)[0], False
+        elif enc_type == REDIS_RDB_32BITLEN :
+            self._pos = pos + 5
+            return _big_endian_unsigned_int.unpack_from(buf, pos + 1)[0], False
+        else :
+            self._pos = pos + 1
+            return data & 0x3F, True
+
+    skip_strings = FileReader.skip_strings.im_func
+
+    def read_unsigned_char(self) :
+        pos = self._pos
+        if pos >= len(self._buf) :
+            self._fill(1)
+            pos = self._pos
+        self._pos = pos + 1
+        return ord(self._buf[pos])
+
+    read_signed_char = _buffered(BufferReader.read_signed_char.im_func, 1)
+    read_signed_short = _buffered(BufferReader.read_signed_short.im_func, 2)
+    read_unsigned_short = _buffered(BufferReader.read_unsigned_short.im_func, 2)
+    read_signed_int = _buffered(BufferReader.read_signed_int.im_func, 4)
+    read_unsigned_int = _buffered(BufferReader.read_unsigned_int.im_func, 4)
+    read_big_endian_unsigned_int = _buffered(BufferReader.read_big_endian_unsigned_int.im_func, 4)
+    read_24bit_signed_number = _buffered(BufferReader.read_24bit_signed_number.im_func, 3)
+    read_signed_long = _buffered(BufferReader.read_signed_long.im_func, 8)
+    read_unsigned_long = _buffered(BufferReader.read_unsigned_long.im_func, 8)
+    read_double = _buffered(BufferReader.read_double.im_func, 8)
+
+def is_regular_file(f):
+    """Returns True if `f` is a file object on a regular file, which can be memory mapped and seeked"""
+    if not isinstance(f, file):
+        return False
+    try:
+        return stat.S_ISREG(os.fstat(f.fileno()).st_mode)
+    except EnvironmentError:
+        return False
+
+def open_reader(f, use_mmap = True, keep_raw = False, checksum = False):
+    """
+    Returns a reader for the file object `f`. Regular files are memory mapped, except empty ones
+    which fall back to a `FileReader`. Anything else (pipes, sockets, decompressing or in-memory 
+    file objects) is read as a stream by a `StreamReader`; `keep_raw` and `checksum` are passed on to it.
+    """
+    if not is_regular_file(f):
+        return StreamReader(f, keep_raw = keep_raw, checksum = checksum)
+    if use_mmap:
+        try:
+            return MmapReader(f)
+        except (ValueError, EnvironmentError):
+            pass
+    return FileReader(f)
+
+def open_dump(filename):
+    """
+    Opens the dump file `filename` for reading. Files ending with .gz, .zst and .lz4 are 
+    decompressed as they are read; zstandard and lz4 need the packages of the same name. 
+    """
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rb')
+    elif filename.endswith('.zst'):
+        if not HAS_ZSTANDARD:
+            raise Exception('open_dump', 'Reading %s needs the zstandard package' % filename)
+        return zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'))
+    elif filename.endswith('.lz4'):
+        if not HAS_LZ4:
+            raise Exception('open_dump', 'Reading %s needs the lz4 package' % filename)
+        return lz4.frame.open(filename, 'rb')
+    return open(filename, 'rb')
 
-def read_big_endian_unsigned_int(f):
-    data = f.read(4)
-    return struct.unpack('>I', data)[0], data
+@contextmanager
+def dump_file(source):
+    """
+    Opens `source`, which is the name of a dump file (see `open_dump`), '-' for standard input, 
+    or a file object, and yields the file object. File objects passed in are not closed.
+    """
+    if hasattr(source, 'read'):
+        fp, owned = source, False
+    elif source == '-':
+        fp, owned = sys.stdin, False
+    else:
+        fp, owned = open_dump(source), True
+    try:
+        yield fp
+    finally:
+        if owned:
+            fp.close()
 
-def read_24bit_signed_number(f):
-    data = f.read(3)
-    s = '0' + data
-    num = struct.unpack('i', s)[0]
-    return num >> 8, data
+@contextmanager
+def dump_reader(source, use_mmap = True, keep_raw = False, checksum = False):
+    """Opens a reader on `source`, see `dump_file` and `open_reader`"""
+    with dump_file(source) as fp:
+        f = open_reader(fp, use_mmap, keep_raw, checksum)
+        try:
+            yield f
+        finally:
+            f.close()
+
+def verify_dump(source, block_size = 1 << 20):
+    """
+    Verifies the CRC64 at the end of the dump `source` (see `dump_file`) without parsing it : 
+    the dump is read in blocks, and all of it but the checksum is folded into a CRC64.
     
-def read_signed_long(f) :
-    data = f.read(8)
-    return struct.unpack('q', data)[0], data
+    Returns the checksum, or None if the dump was saved without one (rdbchecksum no).
+    Raises an Exception if the checksum does not match, which happens when the dump is truncated.
+    """
+    with dump_file(source) as fp:
+        header = fp.read(9)
+        if header[:5] != 'REDIS' :
+            raise Exception('verify_dump', 'Invalid File Format')
+        version = int(header[5:])
+        if version < REDIS_RDB_CHECKSUM_VERSION or version > REDIS_RDB_MAX_VERSION :
+            raise Exception('verify_dump', 'Dumps of RDB version %d have no checksum' % version)
+        crc = crc64(header)
+        # The EOF opcode and the checksum, which are the last 9 bytes read so far
+        tail = ''
+        while True :
+            block = fp.read(block_size)
+            if not block :
+                break
+            if len(block) < 9 :
+                block = tail + block
+            else :
+                crc = crc64(tail, crc)
+            crc = crc64(block[:-9], crc)
+            tail = block[-9:]
+    if len(tail) < 9 or tail[0] != chr(REDIS_RDB_OPCODE_EOF) :
+        raise Exception('verify_dump', 'The dump is truncated, it does not end with an EOF opcode and a checksum')
+    crc = crc64(tail[0], crc)
+    expected = _unsigned_long.unpack(tail[1:])[0]
+    if expected == 0 :
+        return None
+    if expected != crc :
+        raise Exception('verify_dump', 'Checksum mismatch : the dump ends with %016x, but its content has %016x' % (expected, crc))
+    return crc
+
+def listpack_backlen_size(size):
+    """Returns the number of bytes of the backlen of a listpack entry of `size` bytes"""
+    if size <= 127 :
+        return 1
+    elif size < 16383 :
+        return 2
+    elif size < 2097151 :
+        return 3
+    elif size < 268435455 :
+        return 4
+    return 5
+
+def to_datetime(usecs_since_epoch):
+    seconds_since_epoch = usecs_since_epoch / 1000000
+    useconds = usecs_since_epoch % 1000000
+    dt = datetime.datetime.utcfromtimestamp(seconds_since_epoch)
+    delta = datetime.timedelta(microseconds = useconds)
+    return dt + delta
     
-def read_unsigned_long(f) :
-    data = f.read(8)
-    return struct.unpack('Q', data)[0], data
+class LazyElements(object):
+    """
+    The elements of a collection yielded by `RdbParser.iter_records(lazy = True)`. 
+    Elements are decoded from the dump as they are iterated, so they can only be read 
+    before the parser moves to the next record.
+    """
+    def __init__(self, elements, key, length):
+        self._elements = elements
+        self._key = key
+        self.remaining = length
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self._elements is None :
+            raise Exception('LazyElements', 'Elements of key %s must be read before the next record' % self._key)
+        if not self.remaining :
+            raise StopIteration()
+        element = self._elements.next()
+        self.remaining -= 1
+        return element
+
+    def invalidate(self):
+        self._elements = None
+
+class ElementCollector(RdbCallback):
+    """Collects the encoding, length and elements of a single object, for `RdbParser.read_records`"""
+    def reset(self):
+        self.encoding = None
+        self.length = None
+        self.elements = []
+
+    def set(self, key, value, expiry, info):
+        self.encoding = info['encoding']
+        self.length = 1
+        self.elements = value
+
+    def start_collection(self, key, length, expiry, info):
+        self.encoding = info['encoding']
+        self.length = length
+
+    def add(self, key, member):
+        self.elements.append(member)
+
+    def add_pair(self, key, field, value):
+        self.elements.append((field, value))
+
+    def zadd(self, key, score, member):
+        self.elements.append((member, score))
+
+    def add_many(self, key, elements):
+        self.elements.extend(elements)
+
+    def zadd_many(self, key, pairs):
+        self.elements.extend([(member, score) for score, member in pairs])
+
+    def end_collection(self, key):
+        pass
+
+    def start_stream(self, key, listpacks_count, expiry, info):
+        self.encoding = info['encoding']
+
+    def end_stream(self, key, info):
+        self.length = info['length']
+
+    start_hash = start_set = start_list = start_sorted_set = start_collection
+    sadd = rpush = add
+    hset = add_pair
+    sadd_many = rpush_many = hset_many = stream_entries = add_many
+    end_hash = end_set = end_list = end_sorted_set = end_collection
 
 def string_as_hexcode(string) :
     for s in string :
@@ -887,5 +2800,54 @@ def string_as_hexcode(string) :
         else :
             print(hex(ord(s)))
 
+class DebugCallback(RdbCallback):
+    def start_rdb(self):
+        print('[')
+    
+    def start_database(self, db_number):
+        print('{')
+    
+    def set(self, key, value, expiry, info):
+        print('"%s" : "%s"' % (str(key), str(value)))
+    
+    def start_hash(self, key, length, expiry, info):
+        print('"%s" : {' % str(key))
+    
+    def hset(self, key, field, value):
+        print('"%s" : "%s"' % (str(field), str(value)))
+    
+    def end_hash(self, key):
+        print('}')
+    
+    def start_set(self, key, cardinality, expiry, info):
+        print('"%s" : [' % str(key))
 
-
+    def sadd(self, key, member):
+        print('"%s"' % str(member))
+    
+    def end_set(self, key):
+        print(']')
+    
+    def start_list(self, key, length, expiry, info):
+        print('"%s" : [' % str(key))
+    
+    def rpush(self, key, value) :
+        print('"%s"' % str(value))
+    
+    def end_list(self, key):
+        print(']')
+    
+    def start_sorted_set(self, key, length, expiry, info):
+        print('"%s" : {' % str(key))
+    
+    def zadd(self, key, score, member):
+        print('"%s" : "%s"' % (str(member), str(score)))
+    
+    def end_sorted_set(self, key):
+        print('}')
+    
+    def end_database(self, db_number):
+        print('}')
+    
+    def end_rdb(self):
+        print(']')
@@ -0,0 +1,154 @@
+import heapq
+from timeit import default_timer
+
+# The decoders that are timed on their own, inside the decoding of a key
+DECODER_METHODS = ('lzf_decompress', 'read_ziplist_entries', 'read_listpack', 'read_stream_entries',
+                   'read_ziplist_lengths', 'read_listpack_lengths')
+
+class ParseProfile(object):
+    """
+    Attributes the time spent parsing a dump to the decoding of every encoding, the decoders
+    in `DECODER_METHODS`, every method of the callback, and the writes to the output.
+
+    Typical usage :
+        profile = ParseProfile()
+        out = profile.wrap_output(out)
+        parser = RdbParser(JSONCallback(out), profile = profile)
+        parser.parse('/var/redis/6379/dump.rdb')
+        profile.write_report(sys.stderr)
+
+    A timer is read around every call, rather than with cProfile, and the time of a call
+    excludes the time of the timed calls it makes : the decoding of a hash excludes the
+    `hset` calls of the callback, which exclude the writes of the callback to the output.
+    The timers cost about a microsecond per element.
+
+    The `top` keys that took the longest to decode, excluding their callbacks, are kept.
+    """
+    def __init__(self, top = 10):
+        self.top = top
+        # name : [calls, seconds]
+        self.rows = {}
+        # (seconds, key, encoding) of the slowest keys, in a heap
+        self.slowest_keys = []
+        # Time spent parsing, by the dumps parsed so far and since the current one started
+        self.seconds = 0.0
+        self._start_time = None
+        # Time spent in the timed calls made by the current call
+        self._inner = 0.0
+        # Time spent in the callback and output by the key being decoded
+        self._inner_callbacks = 0.0
+
+    def start(self):
+        """Called by the parser when it starts parsing a dump"""
+        self._start_time = default_timer()
+
+    def finish(self):
+        """Called by the parser when the dump has been parsed"""
+        self.seconds += default_timer() - self._start_time
+        self._start_time = None
+
+    @property
+    def elapsed(self):
+        if self._start_time is None:
+            return self.seconds
+        return self.seconds + default_timer() - self._start_time
+
+    def timed(self, func, name, callback = False):
+        """Wraps `func`, to count its calls and the time spent in it in the row `name`"""
+        row = self.rows.setdefault(name, [0, 0.0])
+        def timed_call(*args):
+            inner = self._inner
+            self._inner = 0.0
+            start = default_timer()
+            try:
+                return func(*args)
+            finally:
+                elapsed = default_timer() - start
+                row[0] += 1
+                row[1] += elapsed - self._inner
+                self._inner = inner + elapsed
+                if callback:
+                    self._inner_callbacks += elapsed
+        return timed_call
+
+    def wrap_callback(self, callback):
+        """Returns a callback that times the methods of `callback`"""
+        return TimedCallback(callback, self)
+
+    def wrap_output(self, out):
+        """Returns a file object that times the writes to `out`"""
+        return TimedOutput(out, self)
+
+    def wrap_parser(self, parser, encodings):
+        """
+        Times the decoders of `parser` : `read_object` by encoding, and the `DECODER_METHODS`.
+        `encodings` maps the types of the dump to the names of their encodings.
+        """
+        read_object = parser.read_object
+        decoders = dict((data_type, self.timed(read_object, 'decode %s' % encoding))
+                        for data_type, encoding in encodings.iteritems())
+        def timed_read_object(f, enc_type):
+            inner_callbacks = self._inner_callbacks
+            self._inner_callbacks = 0.0
+            start = default_timer()
+            try:
+                decoders[enc_type](f, enc_type)
+            finally:
+                elapsed = default_timer() - start - self._inner_callbacks
+                self._inner_callbacks += inner_callbacks
+                self.key_decoded(parser._key, encodings[enc_type], elapsed)
+        parser.read_object = timed_read_object
+        parser.skip_object = self.timed(parser.skip_object, 'skip')
+        for name in DECODER_METHODS:
+            setattr(parser, name, self.timed(getattr(parser, name), name))
+
+    def key_decoded(self, key, encoding, seconds):
+        if len(self.slowest_keys) < self.top:
+            heapq.heappush(self.slowest_keys, (seconds, key, encoding))
+        elif seconds > self.slowest_keys[0][0]:
+            heapq.heapreplace(self.slowest_keys, (seconds, key, encoding))
+
+    def report(self):
+        """Returns the rows as (name, calls, seconds) tuples, the slowest first"""
+        rows = [(name, calls, seconds) for name, (calls, seconds) in self.rows.iteritems() if calls]
+        rows.sort(key = lambda row: row[2], reverse = True)
+        return rows
+
+    def write_report(self, out):
+        total = self.elapsed
+        out.write('%-40s %12s %12s %7s\n' % ('', 'calls', 'seconds', '%'))
+        timed = 0.0
+        for name, calls, seconds in self.report():
+            timed += seconds
+            out.write('%-40s %12d %12.3f %6.1f%%\n' % (name, calls, seconds, 100.0 * seconds / total if total else 0))
+        # Opcodes, keys and expiries, and the parser loop itself
+        other = max(total - timed, 0.0)
+        out.write('%-40s %12s %12.3f %6.1f%%\n' % ('other', '', other, 100.0 * other / total if total else 0))
+        out.write('%-40s %12s %12.3f\n' % ('total', '', total))
+        if self.slowest_keys:
+            out.write('\nSlowest keys to decode :\n')
+            for seconds, key, encoding in sorted(self.slowest_keys, reverse = True):
+                out.write('%12.6f %-20s %r\n' % (seconds, encoding, key))
+
+class TimedCallback(object):
+    """Forwards the events of a parser to `callback`, timing every method in the rows `callback <method>`"""
+    def __init__(self, callback, profile):
+        self._callback = callback
+        for name in dir(callback):
+            if not name.startswith('_'):
+                attribute = getattr(callback, name)
+                if callable(attribute):
+                    setattr(self, name, profile.timed(attribute, 'callback %s' % name, callback = True))
+
+    def __getattr__(self, name):
+        return getattr(self._callback, name)
+
+class TimedOutput(object):
+    """A file object that times the writes to `out` in the row `output write`"""
+    def __init__(self, out, profile):
+        self._out = out
+        # Writes are made by the callbacks, so their time is already excluded from the decoding of keys
+        self.write = profile.timed(out.write, 'output write')
+
+    def __getattr__(self, name):
+        return getattr(self._out, name)
@@ -0,0 +1,240 @@
+import sys
+import json
+import time
+
+# The callback methods that start a key, the type of the key, and how to find its number of elements
+_START_METHODS = (
+    ('set', 'string', lambda args: 1),
+    ('start_hash', 'hash', lambda args: args[1]),
+    ('start_set', 'set', lambda args: args[1]),
+    ('start_list', 'list', lambda args: args[1]),
+    ('start_sorted_set', 'sortedset', lambda args: args[1]),
+    # The entries of a stream are only known at its end
+    ('end_stream', 'stream', lambda args: args[1]['length']),
+)
+
+class ParseStats(object):
+    """
+    Counts the bytes, keys and elements of every type read by a `RdbParser`, and the time spent.
+
+    Typical usage :
+        stats = ParseStats(on_progress = print_progress)
+        parser = RdbParser(callback, stats = stats)
+        parser.parse('/var/redis/6379/dump.rdb')
+        stats.write_json(open('stats.json', 'w'))
+
+    `on_progress(stats)` is called about every `interval` seconds while the dump is parsed,
+    and once when it is done. The clock is only read every `check_keys` keys, so a single
+    large key delays the next call until it is parsed.
+
+    The size of the dump, and hence the percentage and ETA, are unknown for streams and
+    compressed dumps : `percent` and `eta` are None then.
+    """
+    def __init__(self, on_progress = None, interval = 5.0, check_keys = 1000):
+        self.on_progress = on_progress
+        self.interval = interval
+        self.check_keys = check_keys
+        # Keys and elements read, by type
+        self._counts = {}
+        self.total_bytes = None
+        self.start_time = None
+        self.end_time = None
+        self._reader = None
+        self._bytes_read = 0
+        self._next_report = None
+
+    def start(self, f):
+        """Called by the parser when it starts reading the reader `f`"""
+        self._reader = f
+        self._bytes_read = 0
+        self.total_bytes = f.size()
+        self.start_time = time.time()
+        self.end_time = None
+        self._next_report = self.start_time + self.interval
+
+    def finish(self):
+        """Called by the parser when the dump has been read"""
+        self._bytes_read = self._reader.tell()
+        self._reader = None
+        self.end_time = time.time()
+        if self.on_progress is not None:
+            self.on_progress(self)
+
+    def counter(self, data_type):
+        """Returns the counts of keys and elements of `data_type`, as a list that is updated in place"""
+        return self._counts.setdefault(data_type, [0, 0])
+
+    def add_key(self, data_type, elements):
+        counts = self.counter(data_type)
+        counts[0] += 1
+        counts[1] += elements
+
+    def check(self):
+        """Calls `on_progress` if `interval` has elapsed since the last call"""
+        now = time.time()
+        if now >= self._next_report:
+            self._next_report = now + self.interval
+            if self.on_progress is not None:
+                self.on_progress(self)
+
+    @property
+    def keys(self):
+        """The number of keys read, by type"""
+        return dict((data_type, counts[0]) for data_type, counts in self._counts.iteritems() if counts[0])
+
+    @property
+    def elements(self):
+        """The number of elements of the keys read, by type"""
+        return dict((data_type, counts[1]) for data_type, counts in self._counts.iteritems() if counts[0])
+
+    @property
+    def bytes_read(self):
+        if self._reader is not None:
+            return self._reader.tell()
+        return self._bytes_read
+
+    @property
+    def elapsed(self):
+        if self.start_time is None:
+            return 0.0
+        return (self.end_time or time.time()) - self.start_time
+
+    @property
+    def total_keys(self):
+        return sum(self.keys.itervalues())
+
+    @property
+    def total_elements(self):
+        return sum(self.elements.itervalues())
+
+    @property
+    def percent(self):
+        if not self.total_bytes:
+            return None
+        return 100.0 * self.bytes_read / self.total_bytes
+
+    @property
+    def bytes_per_second(self):
+        elapsed = self.elapsed
+        return self.bytes_read / elapsed if elapsed else 0.0
+
+    @property
+    def keys_per_second(self):
+        elapsed = self.elapsed
+        return self.total_keys / elapsed if elapsed else 0.0
+
+    @property
+    def eta(self):
+        """Seconds left, assuming the rest of the dump is read at the same rate"""
+        rate = self.bytes_per_second
+        if not self.total_bytes or not rate:
+            return None
+        return max(self.total_bytes - self.bytes_read, 0) / rate
+
+    def as_dict(self):
+        return {
+            'bytes_read' : self.bytes_read,
+            'total_bytes' : self.total_bytes,
+            'elapsed_seconds' : self.elapsed,
+            'keys' : self.keys,
+            'elements' : self.elements,
+            'bytes_per_second' : self.bytes_per_second,
+            'keys_per_second' : self.keys_per_second,
+        }
+
+    def format_progress(self):
+        """A one line summary, such as `45.2% 1.23 GB of 2.72 GB, 24.1 MB/s, 120345 keys/s, ETA 0:01:02`"""
+        parts = []
+        if self.total_bytes:
+            parts.append('%.1f%% %s of %s' % (self.percent, format_bytes(self.bytes_read), format_bytes(self.total_bytes)))
+        else:
+            parts.append(format_bytes(self.bytes_read))
+        parts.append('%.1f MB/s' % (self.bytes_per_second / (1024.0 * 1024.0)))
+        parts.append('%d keys, %d keys/s' % (self.total_keys, self.keys_per_second))
+        if self.end_time is not None:
+            parts.append('done in %s' % format_seconds(self.elapsed))
+        elif self.eta is not None:
+            parts.append('ETA %s' % format_seconds(self.eta))
+        return ', '.join(parts)
+
+    def write_json(self, out):
+        json.dump(self.as_dict(), out, indent = 2, sort_keys = True)
+        out.write('\n')
+
+    def write_prometheus(self, out, prefix = 'rdbtools'):
+        """Writes the counters in the Prometheus text format, for the textfile collector of node_exporter"""
+        def metric(name, kind, help, samples):
+            out.write('# HELP %s_%s %s\n' % (prefix, name, help))
+            out.write('# TYPE %s_%s %s\n' % (prefix, name, kind))
+            for labels, value in samples:
+                # repr keeps all the digits of floats
+                out.write('%s_%s%s %s\n' % (prefix, name, labels, repr(value) if isinstance(value, float) else value))
+        metric('bytes_read', 'counter', 'Bytes of the dump read', [('', self.bytes_read)])
+        if self.total_bytes:
+            metric('dump_bytes', 'gauge', 'Size of the dump', [('', self.total_bytes)])
+        metric('parse_seconds', 'gauge', 'Time spent parsing the dump', [('', self.elapsed)])
+        metric('keys', 'counter', 'Keys read, by type',
+               [('{type="%s"}' % data_type, count) for data_type, count in sorted(self.keys.items())])
+        metric('elements', 'counter', 'Elements of the keys read, by type',
+               [('{type="%s"}' % data_type, count) for data_type, count in sorted(self.elements.items())])
+
+    def write_file(self, filename):
+        """Writes the stats to `filename`, in the Prometheus text format if it ends with .prom and in json otherwise"""
+        with open(filename, 'w') as out:
+            if filename.endswith('.prom'):
+                self.write_prometheus(out)
+            else:
+                self.write_json(out)
+
+class StatsCallback(object):
+    """
+    Forwards the events of a parser to `callback`, and counts the keys and elements in `stats`.
+
+    Only the events that start a key are counted, from their lengths, so that elements are
+    not slowed down : the other methods of `callback` are bound to this object as they are.
+    """
+    def __init__(self, callback, stats):
+        self._callback = callback
+        for name in dir(callback):
+            if not name.startswith('_'):
+                attribute = getattr(callback, name)
+                if callable(attribute):
+                    setattr(self, name, attribute)
+        # Shared by the methods, to read the clock every `check_keys` keys
+        countdown = [stats.check_keys]
+        for name, data_type, elements in _START_METHODS:
+            if hasattr(callback, name):
+                setattr(self, name, counting(getattr(callback, name), stats, stats.counter(data_type), elements, countdown))
+
+    def __getattr__(self, name):
+        return getattr(self._callback, name)
+
+def counting(method, stats, counts, elements, countdown):
+    """Wraps the callback method `method`, that starts a key, to count the key and its elements in `counts`"""
+    def counted(*args):
+        counts[0] += 1
+        counts[1] += elements(args)
+        countdown[0] -= 1
+        if not countdown[0]:
+            countdown[0] = stats.check_keys
+            stats.check()
+        method(*args)
+    return counted
+
+def print_progress(stats, out = sys.stderr):
+    """An `on_progress` hook that prints `format_progress` to stderr"""
+    out.write('%s\n' % stats.format_progress())
+    out.flush()
+
+def format_bytes(n):
+    for unit in ('bytes', 'KB', 'MB', 'GB'):
+        if n < 1024 or unit == 'GB':
+            break
+        n /= 1024.0
+    if unit == 'bytes':
+        return '%d bytes' % n
+    return '%.2f %s' % (n, unit)
+
+def format_seconds(seconds):
+    seconds = int(seconds)
+    return '%d:%02d:%02d' % (seconds // 3600, seconds % 3600 // 60, seconds % 60)
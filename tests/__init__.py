@@ -1,9 +1,24 @@
 import unittest
 from tests.parser_tests import RedisParserTestCase
-from tests.memprofiler_tests import MemoryCallbackTestCase
+from tests.memprofiler_tests import MemoryCallbackTestCase, StatsAggregatorTestCase, LargestKeysTestCase, KeyGroupsTestCase, SamplingTestCase, RedisVersionTestCase
+from tests.allocators_tests import AllocatorsTestCase
+from tests.parallel_tests import ParallelParserTestCase
+from tests.index_tests import RdbIndexTestCase
+from tests.progress_tests import ParseStatsTestCase
+from tests.profiling_tests import ParseProfileTestCase
 
 def all_tests():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(RedisParserTestCase))
     suite.addTest(unittest.makeSuite(MemoryCallbackTestCase))
+    suite.addTest(unittest.makeSuite(StatsAggregatorTestCase))
+    suite.addTest(unittest.makeSuite(LargestKeysTestCase))
+    suite.addTest(unittest.makeSuite(KeyGroupsTestCase))
+    suite.addTest(unittest.makeSuite(SamplingTestCase))
+    suite.addTest(unittest.makeSuite(RedisVersionTestCase))
+    suite.addTest(unittest.makeSuite(AllocatorsTestCase))
+    suite.addTest(unittest.makeSuite(ParallelParserTestCase))
+    suite.addTest(unittest.makeSuite(RdbIndexTestCase))
+    suite.addTest(unittest.makeSuite(ParseStatsTestCase))
+    suite.addTest(unittest.makeSuite(ParseProfileTestCase))
     return suite
@@ -0,0 +1,30 @@
+import unittest
+
+from rdbtools.allocators import Jemalloc, Libc, get_allocator
+
+class AllocatorsTestCase(unittest.TestCase):
+    def test_jemalloc_size_classes(self):
+        jemalloc = Jemalloc()
+        classes = [8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384, 448, 512, 640, 768, 896, 1024,
+                   1280, 1536, 1792, 2048, 2560, 3072, 3584, 4096, 5120, 6144, 7168, 8192, 10240, 12288, 14336, 16384]
+        for size in range(0, 16385):
+            expected = [size_class for size_class in classes if size_class >= size][0]
+            self.assertEqual(jemalloc.allocated(size), expected, "%d is allocated in %d" % (size, expected))
+        self.assertEqual(jemalloc.allocated(1 << 20), 1 << 20)
+        self.assertEqual(jemalloc.allocated((1 << 20) + 1), (1 << 20) + (1 << 18))
+
+    def test_libc_chunks(self):
+        libc = Libc()
+        # The usable size of chunks, without their header
+        self.assertEqual([libc.allocated(size) for size in (0, 24, 25, 40, 41, 4096)], [24, 24, 40, 40, 56, 4104])
+        self.assertEqual(libc.allocated(1 << 20), (1 << 20) + 4096 - 16)
+        self.assertEqual([Libc(4).allocated(size) for size in (0, 12, 13)], [12, 12, 20])
+
+    def test_lookup_tables_match_size_classes(self):
+        for allocator in (Jemalloc(table_size = 100), Libc(table_size = 100)):
+            for size in range(0, 300):
+                self.assertEqual(allocator.allocated(size), allocator.size_class(size))
+
+    def test_get_allocator(self):
+        self.assertEqual(get_allocator('libc', 4).size_t, 4)
+        self.assertRaises(Exception, get_allocator, 'tcmalloc')
@@ -0,0 +1,361 @@
+"""
+Writes the dump files of the encodings introduced after RDB version 6 (quicklists, listpacks,
+binary sorted set scores, streams, AUX and RESIZEDB opcodes, LRU and LFU information).
+
+Unlike create_test_rdb.py, no redis server is needed : the dumps are encoded here, byte for byte
+as redis writes them, including the CRC64 checksum. Run it from the root of the source tree :
+    python -m tests.create_modern_rdbs
+"""
+import os
+import struct
+
+def create_test_rdbs(dump_folder) :
+    tests = (
+                quicklist,
+                quicklist_2,
+                hash_as_listpack,
+                sorted_set_as_listpack,
+                set_as_listpack,
+                sorted_set_2,
+                metadata_opcodes,
+                stream,
+                streams_2_and_3,
+                signed_integers,
+            )
+    for t in tests :
+        version, body = t()
+        with open(os.path.join(dump_folder, "%s.rdb" % t.__name__), 'wb') as f :
+            f.write(dump(version, body))
+
+def quicklist() :
+    compressible = ['aaaaaaaaaaaaaaaaaaaa%d' % x for x in range(0, 10)]
+    integers = [0, 12, 13, -128, 127, 255, -32768, 32767, 8388607, -8388608,
+                2147483647, -2147483648, 9223372036854775807, -9223372036854775808]
+    # A 14 bit and a 32 bit string length, and an entry after one of more than 254 bytes
+    strings = ['x' * 100, 'y' * 20000, 'z']
+    nodes = [ziplist(compressible), ziplist(integers), ziplist(strings)]
+    return 7, (aux('redis-ver', '3.2.0') + aux('redis-bits', 64) + aux('ctime', 1500000000) + aux('used-mem', 1023456)
+               + select_db(0) + resize_db(1, 0)
+               + chr(14) + string('quicklist') + length(len(nodes)) + ''.join(string(node, compress = True) for node in nodes))
+
+def quicklist_2() :
+    packed = ['value:%d' % x for x in range(0, 128)]
+    plain = 'p' * 5000
+    integers = [1, -1, 4095, -4096, 4096, 100000, -8388608, 2147483647, -9223372036854775808]
+    nodes = [(2, listpack(packed)), (1, plain), (2, listpack(integers))]
+    return 11, (aux('redis-ver', '7.2.0') + aux('redis-bits', 64)
+                + select_db(0) + resize_db(1, 0)
+                + chr(18) + string('quicklist_2') + length(len(nodes))
+                + ''.join(length(container) + string(node, compress = True) for container, node in nodes))
+
+def hash_as_listpack() :
+    pairs = [('f6', 'short value'), ('f12', 'v' * 100), ('f32', 'w' * 5000), ('int7', 100), ('int13', -3000),
+             ('int16', 30000), ('int24', -8000000), ('int32', 2000000000), ('int64', -9000000000000000000)]
+    return 10, (aux('redis-ver', '7.0.0') + select_db(0) + resize_db(1, 0)
+                + chr(16) + string('hash_as_listpack') + string(listpack(flatten(pairs)), compress = True))
+
+def sorted_set_as_listpack() :
+    # Integral scores are stored as integers, the others as strings
+    pairs = [('one', 1), ('minus', -5), ('half', '0.5'), ('pi', '3.14159'), ('big', '1e+20'), ('infinite', 'inf')]
+    return 10, (aux('redis-ver', '7.0.0') + select_db(0) + resize_db(1, 0)
+                + chr(17) + string('sorted_set_as_listpack') + string(listpack(flatten(pairs))))
+
+def set_as_listpack() :
+    members = ['alpha', 'beta', 7, -20, 70000, 'x' * 70]
+    return 11, (aux('redis-ver', '7.2.0') + select_db(0) + resize_db(1, 0)
+                + chr(20) + string('set_as_listpack') + string(listpack(members)))
+
+def sorted_set_2() :
+    members = [('member:%d' % x, x / 4.0 - 10) for x in range(0, 200)]
+    members += [('+inf', float('inf')), ('-inf', float('-inf'))]
+    return 9, (aux('redis-ver', '5.0.0') + select_db(0) + resize_db(2, 1)
+               # Expiry, then LFU frequency, then the type
+               + chr(252) + struct.pack('<Q', 1671963072573) + chr(249) + chr(5)
+               + chr(5) + string('sorted_set_2') + length(len(members))
+               + ''.join(string(member) + struct.pack('<d', score) for member, score in members)
+               # LRU idle time in seconds
+               + chr(248) + length(1000) + chr(0) + string('idle_string') + string('idle value'))
+
+def metadata_opcodes() :
+    module_aux = (chr(247) + length(0x2b3c4d5e6f7a8b01) + length(2) + length(2)
+                  + length(1) + length(42) + length(3) + struct.pack('<f', 1.5) + length(4) + struct.pack('<d', 2.5)
+                  + length(5) + string('module data') + length(0))
+    function = chr(245) + string("#!lua name=mylib\nredis.register_function('f', function() return 1 end)")
+    return 11, (aux('redis-ver', '7.2.4') + aux('redis-bits', 64) + aux('ctime', 1700000000) + aux('used-mem', 2000000)
+                + aux('aof-base', 0) + module_aux + function
+                + select_db(0) + resize_db(2, 1)
+                + chr(248) + length(3600) + chr(0) + string('with_idle') + string('idle')
+                + chr(252) + struct.pack('<Q', 1671963072573) + chr(249) + chr(200) + chr(0) + string('with_freq') + string('frequent')
+                + select_db(3) + resize_db(1, 0)
+                + chr(0) + string('in_db_3') + string('three'))
+
+def sensor_entries(first_ms, count) :
+    """Stream entries with the same fields, and one with other fields"""
+    entries = [((first_ms + x, x % 2), [('sensor', 'temperature'), ('value', 20 + x)]) for x in range(0, count)]
+    entries.append(((first_ms + count, 0), [('sensor', 'humidity'), ('value', 'x' * 100), ('unit', '%')]))
+    return entries
+
+def stream() :
+    # The second entry of the first node is deleted
+    first = sensor_entries(1700000000000, 5)
+    second = sensor_entries(1700000001000, 3)
+    groups = [('readers', (1700000001000, 0), None,
+               [((1700000000000, 0), 1700000005000, 1), ((1700000000002, 0), 1700000006000, 3)],
+               [('alice', 1700000005000, None, [(1700000000000, 0)]), ('bob', 1700000006000, None, [(1700000000002, 0)]),
+                ('carol', 1700000007000, None, [])]),
+              ('archivers', (0, 0), None, [], [])]
+    return 9, (aux('redis-ver', '5.0.0') + select_db(0) + resize_db(3, 0)
+               + chr(15) + string('stream') + stream_value(15, [(first, [first[1][0]]), (second, [])], groups)
+               + chr(15) + string('empty_stream') + stream_value(15, [], [])
+               + chr(0) + string('after_streams') + string('value'))
+
+def streams_2_and_3() :
+    entries = sensor_entries(1700000000000, 2)
+    groups = [('readers', (1700000000001, 1), 2, [((1700000000001, 1), 1700000005000, 2)],
+               [('alice', 1700000005000, 1700000004000, [(1700000000001, 1)]), ('bob', 1700000006000, -1, [])])]
+    return 11, (aux('redis-ver', '7.2.0') + select_db(0) + resize_db(2, 0)
+                + chr(19) + string('stream_2') + stream_value(19, [(entries, [entries[0][0]])], groups)
+                + chr(21) + string('stream_3') + stream_value(21, [(entries, [entries[0][0]])], groups))
+
+def signed_integers() :
+    # Intsets of every width with negative members, and ziplists with integers of every encoding
+    intsets = [('intset_16_signed', [-32768, -1, 0, 32767]),
+               ('intset_32_signed', [-2147483648, -70000, 5, 2147483647]),
+               ('intset_64_signed', [-9223372036854775808, -5000000000, -1, 9223372036854775807])]
+    integers = [0, 12, 13, -128, 127, 255, -32768, 32767, 8388607, -8388608,
+                2147483647, -2147483648, 9223372036854775807, -9223372036854775808]
+    hash_pairs = [(x, -x) for x in integers[2:-1]] + [('field', 'value')]
+    zset_pairs = [('member:%d' % x, x) for x in integers] + [(-5, '1.5')]
+    body = ''.join(chr(11) + string(key) + string(intset(values)) for key, values in intsets)
+    body += chr(13) + string('hash_with_integers') + string(ziplist(flatten(hash_pairs)))
+    body += chr(12) + string('sorted_set_with_integers') + string(ziplist(flatten(zset_pairs)))
+    return 7, (aux('redis-ver', '3.2.0') + select_db(0) + resize_db(len(intsets) + 2, 0) + body)
+
+def stream_value(data_type, nodes, groups) :
+    """
+    A stream of type 15, 19 or 21. `nodes` are (entries, deleted IDs) tuples, where entries are (ID, pairs) tuples, 
+    and IDs are (milliseconds, sequence) tuples. `groups` are (name, last ID, entries read, pending entries, consumers).
+    """
+    ids = [entry_id for entries, deleted in nodes for entry_id, pairs in entries]
+    deleted = [entry_id for entries, deleted_ids in nodes for entry_id in deleted_ids]
+    live = [entry_id for entry_id in ids if entry_id not in deleted]
+    value = length(len(nodes))
+    for entries, deleted_ids in nodes :
+        value += string(struct.pack('>QQ', *entries[0][0])) + string(stream_listpack(entries, deleted_ids), compress = True)
+    last_id = max(ids or [(0, 0)])
+    value += length(len(live)) + length(last_id[0]) + length(last_id[1])
+    if data_type != 15 :
+        first_id = min(live or [(0, 0)])
+        max_deleted_id = max(deleted or [(0, 0)])
+        value += length(first_id[0]) + length(first_id[1]) + length(max_deleted_id[0]) + length(max_deleted_id[1]) + length(len(ids))
+    value += length(len(groups))
+    for name, group_last_id, entries_read, pending, consumers in groups :
+        value += string(name) + length(group_last_id[0]) + length(group_last_id[1])
+        if data_type != 15 :
+            value += length(entries_read)
+        value += length(len(pending))
+        for entry_id, delivery_time, delivery_count in pending :
+            value += struct.pack('>QQ', *entry_id) + struct.pack('<Q', delivery_time) + length(delivery_count)
+        value += length(len(consumers))
+        for consumer, seen_time, active_time, consumer_pending in consumers :
+            value += string(consumer) + struct.pack('<q', seen_time)
+            if data_type == 21 :
+                value += struct.pack('<q', active_time)
+            value += length(len(consumer_pending)) + ''.join(struct.pack('>QQ', *entry_id) for entry_id in consumer_pending)
+    return value
+
+def stream_listpack(entries, deleted) :
+    """The listpack of a node of a stream. The master entry has the fields of the first entry"""
+    master_ms, master_seq = entries[0][0]
+    master_fields = [field for field, value in entries[0][1]]
+    items = [len(entries) - len(deleted), len(deleted), len(master_fields)] + master_fields + [0]
+    for (ms, seq), pairs in entries :
+        fields = [field for field, value in pairs]
+        flags = (1 if (ms, seq) in deleted else 0) | (2 if fields == master_fields else 0)
+        items += [flags, ms - master_ms, seq - master_seq]
+        if fields == master_fields :
+            items += [value for field, value in pairs] + [len(pairs) + 3]
+        else :
+            items += [len(pairs)] + flatten(pairs) + [2 * len(pairs) + 4]
+    return listpack(items)
+
+def dump(version, body) :
+    data = 'REDIS%04d' % version + body + chr(255)
+    return data + struct.pack('<Q', crc64(data))
+
+def aux(field, value) :
+    return chr(250) + string(field) + string(value)
+
+def select_db(db_number) :
+    return chr(254) + length(db_number)
+
+def resize_db(db_size, expires_size) :
+    return chr(251) + length(db_size) + length(expires_size)
+
+def length(n) :
+    if n < 1 << 6 :
+        return chr(n)
+    elif n < 1 << 14 :
+        return chr(0x40 | (n >> 8)) + chr(n & 0xFF)
+    elif n < 1 << 32 :
+        return chr(0x80) + struct.pack('>I', n)
+    return chr(0x81) + struct.pack('>Q', n)
+
+def string(value, compress = False) :
+    if isinstance(value, (int, long)) :
+        if -(1 << 7) <= value < 1 << 7 :
+            return chr(0xC0) + struct.pack('<b', value)
+        elif -(1 << 15) <= value < 1 << 15 :
+            return chr(0xC1) + struct.pack('<h', value)
+        return chr(0xC2) + struct.pack('<i', value)
+    if compress and len(value) > 20 :
+        compressed = lzf_compress(value)
+        if len(compressed) < len(value) :
+            return chr(0xC3) + length(len(compressed)) + length(len(value)) + compressed
+    return length(len(value)) + value
+
+def flatten(pairs) :
+    return [x for pair in pairs for x in pair]
+
+def ziplist(entries) :
+    body = []
+    prev_length = 0
+    for entry in entries :
+        if prev_length < 254 :
+            encoded = chr(prev_length)
+        else :
+            encoded = chr(254) + struct.pack('<I', prev_length)
+        encoded += ziplist_entry(entry)
+        body.append(encoded)
+        prev_length = len(encoded)
+    tail_offset = 10 + sum(len(encoded) for encoded in body[:-1])
+    body = ''.join(body)
+    return struct.pack('<IIH', 11 + len(body), tail_offset, len(entries)) + body + chr(255)
+
+def ziplist_entry(value) :
+    if isinstance(value, (int, long)) :
+        if 0 <= value <= 12 :
+            return chr(0xF1 + value)
+        elif -(1 << 7) <= value < 1 << 7 :
+            return chr(0xFE) + struct.pack('<b', value)
+        elif -(1 << 15) <= value < 1 << 15 :
+            return chr(0xC0) + struct.pack('<h', value)
+        elif -(1 << 23) <= value < 1 << 23 :
+            return chr(0xF0) + struct.pack('<i', value)[:3]
+        elif -(1 << 31) <= value < 1 << 31 :
+            return chr(0xD0) + struct.pack('<i', value)
+        return chr(0xE0) + struct.pack('<q', value)
+    if len(value) < 1 << 6 :
+        return chr(len(value)) + value
+    elif len(value) < 1 << 14 :
+        return chr(0x40 | (len(value) >> 8)) + chr(len(value) & 0xFF) + value
+    return chr(0x80) + struct.pack('>I', len(value)) + value
+
+def intset(values) :
+    values = sorted(set(values))
+    width = 2
+    for value in values :
+        if not -(1 << 15) <= value < 1 << 15 :
+            width = 4
+        if not -(1 << 31) <= value < 1 << 31 :
+            width = 8
+            break
+    code = {2 : 'h', 4 : 'i', 8 : 'q'}[width]
+    return struct.pack('<II', width, len(values)) + struct.pack('<%d%s' % (len(values), code), *values)
+
+def listpack(entries) :
+    body = ''.join(listpack_entry(entry) for entry in entries)
+    return struct.pack('<IH', 7 + len(body), min(len(entries), 65535)) + body + chr(255)
+
+def listpack_entry(value) :
+    if isinstance(value, (int, long)) :
+        if 0 <= value < 1 << 7 :
+            encoded = chr(value)
+        elif -(1 << 12) <= value < 1 << 12 :
+            value &= 0x1FFF
+            encoded = chr(0xC0 | (value >> 8)) + chr(value & 0xFF)
+        elif -(1 << 15) <= value < 1 << 15 :
+            encoded = chr(0xF1) + struct.pack('<h', value)
+        elif -(1 << 23) <= value < 1 << 23 :
+            encoded = chr(0xF2) + struct.pack('<i', value)[:3]
+        elif -(1 << 31) <= value < 1 << 31 :
+            encoded = chr(0xF3) + struct.pack('<i', value)
+        else :
+            encoded = chr(0xF4) + struct.pack('<q', value)
+    elif len(value) < 1 << 6 :
+        encoded = chr(0x80 | len(value)) + value
+    elif len(value) < 1 << 12 :
+        encoded = chr(0xE0 | (len(value) >> 8)) + chr(len(value) & 0xFF) + value
+    else :
+        encoded = chr(0xF0) + struct.pack('<I', len(value)) + value
+    return encoded + listpack_backlen(len(encoded))
+
+def listpack_backlen(size) :
+    # The size in 7 bit groups, most significant first. All bytes but the first have the high bit set
+    if size <= 127 :
+        return chr(size)
+    groups = []
+    while size :
+        groups.append(size & 127)
+        size >>= 7
+    groups.reverse()
+    return chr(groups[0]) + ''.join(chr(group | 128) for group in groups[1:])
+
+def lzf_compress(data) :
+    """A greedy LZF compressor : literal runs of up to 32 bytes, and back references found with a hash of 3 bytes"""
+    out = []
+    literals = []
+    table = {}
+    pos = 0
+    while pos < len(data) :
+        ref = None
+        if pos + 2 < len(data) :
+            ref = table.get(data[pos:pos + 3])
+            table[data[pos:pos + 3]] = pos
+        if ref is not None and pos - ref - 1 < 8192 :
+            match = 3
+            while match < 264 and pos + match < len(data) and data[ref + match] == data[pos + match] :
+                match += 1
+            flush_literals(out, literals)
+            offset = pos - ref - 1
+            if match - 2 < 7 :
+                out.append(chr(((match - 2) << 5) | (offset >> 8)))
+            else :
+                out.append(chr((7 << 5) | (offset >> 8)) + chr(match - 2 - 7))
+            out.append(chr(offset & 0xFF))
+            pos += match
+        else :
+            literals.append(data[pos])
+            if len(literals) == 32 :
+                flush_literals(out, literals)
+            pos += 1
+    flush_literals(out, literals)
+    return ''.join(out)
+
+def flush_literals(out, literals) :
+    if literals :
+        out.append(chr(len(literals) - 1) + ''.join(literals))
+        del literals[:]
+
+# CRC64 with the Jones polynomial, reflected, as in redis' crc64.c
+_crc64_table = []
+for n in range(0, 256) :
+    crc = n
+    for k in range(0, 8) :
+        if crc & 1 :
+            crc = (crc >> 1) ^ 0x95AC9329AC4BC9B5
+        else :
+            crc >>= 1
+    _crc64_table.append(crc)
+
+def crc64(data, crc = 0) :
+    for c in data :
+        crc = _crc64_table[(crc ^ ord(c)) & 0xFF] ^ (crc >> 8)
+    return crc
+
+def main() :
+    dump_folder = os.path.join(os.path.dirname(__file__), 'dumps')
+    create_test_rdbs(dump_folder)
+
+if __name__ == '__main__' :
+    main()
@@ -0,0 +1,78 @@
+import unittest
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from rdbtools import RdbParser, RdbIndex, JSONCallback
+from rdbtools.index import BloomFilter
+from rdbtools.parser import open_reader
+
+def dump_path(file_name) :
+    return os.path.join(os.path.dirname(__file__), 'dumps', file_name)
+
+def scan_entries(file_name) :
+    with open(dump_path(file_name), "rb") as fp:
+        f = open_reader(fp)
+        try:
+            return list(RdbParser(None).scan_keys(f))
+        finally:
+            f.close()
+
+class RdbIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def build_index(self, file_name, **kwargs) :
+        index_file = os.path.join(self.tmpdir, file_name + '.idx')
+        RdbIndex.build(dump_path(file_name), index_file, **kwargs)
+        return RdbIndex(dump_path(file_name), index_file)
+
+    def test_lookup_finds_every_key(self):
+        for file_name in ('parser_filters.rdb', 'keys_with_expiry.rdb', 'integer_keys.rdb', 'multiple_databases.rdb') :
+            # Runs of 3 keys make the build merge several runs
+            index = self.build_index(file_name, run_size = 3)
+            entries = scan_entries(file_name)
+            self.assertEquals(index.num_records, len(entries))
+            for entry in entries :
+                found = index.lookup(entry.key)
+                self.assertEquals(len(found), 1, msg = "%s not found in %s" % (entry.key, file_name))
+                self.assertEquals(found[0]._replace(key = entry.key), entry)
+
+    def test_lookup_of_missing_key(self):
+        index = self.build_index('parser_filters.rdb')
+        self.assertEquals(index.lookup('no such key'), [])
+
+    def test_empty_database(self):
+        index = self.build_index('empty_database.rdb')
+        self.assertEquals(index.num_records, 0)
+        self.assertEquals(index.lookup('foo'), [])
+
+    def test_parse_entries_matches_full_parse(self):
+        index = self.build_index('multiple_databases.rdb')
+        entries = index.lookup('key_in_second_database') + index.lookup('key_in_zeroth_database')
+        out = StringIO()
+        RdbParser(JSONCallback(out)).parse_entries(dump_path('multiple_databases.rdb'), entries)
+        full = StringIO()
+        RdbParser(JSONCallback(full)).parse(dump_path('multiple_databases.rdb'))
+        self.assertEquals(out.getvalue(), full.getvalue())
+
+    def test_stale_index_is_rejected(self):
+        dump_file = os.path.join(self.tmpdir, 'dump.rdb')
+        shutil.copy(dump_path('multiple_databases.rdb'), dump_file)
+        RdbIndex.build(dump_file)
+        with open(dump_file, 'ab') as f:
+            f.write('\0')
+        self.assertRaises(Exception, RdbIndex, dump_file)
+
+    def test_bloom_filter_error_rate(self):
+        bloom = BloomFilter.for_capacity(1000, 0.01)
+        for i in xrange(0, 1000) :
+            bloom.add('key:%d' % i)
+        for i in xrange(0, 1000) :
+            self.assert_(bloom.might_contain('key:%d' % i))
+        false_positives = sum(1 for i in xrange(0, 10000) if bloom.might_contain('other:%d' % i))
+        self.assert_(false_positives < 300, msg = "%d false positives" % false_positives)
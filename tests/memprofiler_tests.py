@@ -1,8 +1,16 @@
 import unittest
 
 from rdbtools import RdbParser
-from rdbtools import MemoryCallback
+from rdbtools import MemoryCallback, StatsAggregator
+from rdbtools.parser import ELEMENTS_VALUES
+from rdbtools.memprofiler import LogHistogram, Reservoir, MemoryRecord, LargestKeys, PrefixTree, parse_redis_version
+from rdbtools.allocators import Libc
+from rdbtools.filters import KeySample
+import pickle
+from StringIO import StringIO
 import os
+import json
+import random
 
 class Stats():
     def __init__(self):
@@ -11,11 +19,17 @@ class Stats():
     def next_record(self, record):
         self.records[record.key] = record
 
-def get_stats(file_name):
+class ElementsMemoryCallback(MemoryCallback):
+    wants_elements = ELEMENTS_VALUES
+
+class PerElementMemoryCallback(MemoryCallback):
+    wants_batches = False
+
+def get_stats(file_name, callback_class = MemoryCallback, folder = 'dumps', **options):
     stats = Stats()
-    callback = MemoryCallback(stats, 64)
+    callback = callback_class(stats, 64, **options)
     parser = RdbParser(callback)
-    parser.parse(os.path.join(os.path.dirname(__file__), 'dumps', file_name))
+    parser.parse(os.path.join(os.path.dirname(__file__), folder, file_name))
     return stats.records
     
 class MemoryCallbackTestCase(unittest.TestCase):
@@ -25,5 +39,364 @@ class MemoryCallbackTestCase(unittest.TestCase):
     def test_len_largest_element(self):
         stats = get_stats('ziplist_that_compresses_easily.rdb')
         self.assertEqual(stats['ziplist_compresses_easily'].len_largest_element, 36, "Length of largest element does not match")
-        
-    
\ No newline at end of file
+
+    def test_quicklist_overhead(self):
+        stats = get_stats('quicklist.rdb')
+        record = stats['quicklist']
+        self.assertEqual(record.encoding, 'quicklist')
+        self.assertEqual(record.size, 27)
+        self.assertEqual(record.len_largest_element, 20000)
+        # The ziplists of the 3 nodes are stored uncompressed in memory
+        self.assert_(record.bytes > 20000 + 100 + 10 * 21)
+
+    def test_stream(self):
+        stats = get_stats('stream.rdb')
+        record = stats['stream']
+        self.assertEqual((record.type, record.encoding, record.size), ('stream', 'stream', 9))
+        self.assertEqual(record.len_largest_element, 100)
+        # The consumer groups and their pending entries take more than the listpacks
+        empty = stats['empty_stream']
+        self.assert_(record.bytes > 2 * empty.bytes)
+        self.assert_(empty.bytes > 100)
+
+    def test_elements_are_not_needed(self):
+        for file_name in os.listdir(os.path.join(os.path.dirname(__file__), 'dumps')):
+            records = get_stats(file_name)
+            self.assertEqual(records, get_stats(file_name, ElementsMemoryCallback), "%s sized differently" % file_name)
+
+    def test_zipmaps_are_sized_from_their_headers(self):
+        for file_name in ('zipmap_that_compresses_easily.rdb', 'zipmap_that_doesnt_compress.rdb', 'zipmap_with_big_values.rdb'):
+            records = get_stats(file_name)
+            self.assertEqual(records, get_stats(file_name, ElementsMemoryCallback), "%s sized differently" % file_name)
+        self.assertEqual(records['zipmap_with_big_values'].len_largest_element, 20000)
+
+    def test_batches_are_sized_like_elements(self):
+        for file_name in os.listdir(os.path.join(os.path.dirname(__file__), 'dumps')):
+            records, per_element = get_stats(file_name), get_stats(file_name, PerElementMemoryCallback)
+            self.assertEqual(sorted(records), sorted(per_element))
+            for key, record in records.iteritems():
+                # Overheads are added once per element, or once per batch
+                self.assertAlmostEqual(record.bytes, per_element[key].bytes, places = 6, msg = "%s sized differently" % key)
+                self.assertEqual(record._replace(bytes = 0), per_element[key]._replace(bytes = 0))
+
+    def test_sizes_are_deterministic(self):
+        for file_name in ('regular_sorted_set.rdb', 'sorted_set_2.rdb'):
+            self.assertEqual(get_stats(file_name), get_stats(file_name), "%s sized differently" % file_name)
+        callback = MemoryCallback(None, 64)
+        # Levels of 1 + 1/4 + 1/16... of 16 bytes each
+        self.assertAlmostEqual(callback.skiplist_entry_overhead() - (3*8 + 2*8 + 8), 16 * 4 / 3.0)
+
+    def test_sizeof_strings(self):
+        callback = MemoryCallback(None, 64)
+        strings = ['member', '', '12', '123456', '-3', ' 42', '+7', '12a', '1.5', 'x' * 100, 5, 123456, 1 << 70, 
+                   '42 ', '7\n', '007', '-0', '9223372036854775807', '9223372036854775808']
+        self.assertEqual(callback.sizeof_strings(strings), (sum(callback.sizeof_string(s) for s in strings), 100))
+        for string in strings:
+            self.assertEqual(callback.sizeof_strings([string])[0], callback.sizeof_string(string), repr(string))
+        # As Redis, which encodes strings as integers with string2ll, whitespace and signs make strings
+        self.assertEqual([callback.sizeof_string(s) for s in ('42', '42 ', '7\n', ' 42', '+7', '123456')], 
+                         [0, 3 + callback._string_overhead, 2 + callback._string_overhead, 3 + callback._string_overhead, 
+                          2 + callback._string_overhead, 8])
+        self.assertEqual(callback.sizeof_strings([]), (0, 0))
+
+class StatsAggregatorTestCase(unittest.TestCase):
+    def test_histogram_quantiles(self):
+        rng = random.Random(0)
+        values = [int(rng.lognormvariate(8, 2)) for x in range(0, 20000)]
+        histogram = LogHistogram()
+        for value in values:
+            histogram.add(value)
+        values.sort()
+        for q in (0.5, 0.9, 0.99):
+            exact = values[int(q * len(values)) - 1]
+            self.assert_(abs(histogram.quantile(q) - exact) <= exact / 32.0, "p%d is %d, not %d" % (q * 100, histogram.quantile(q), exact))
+        self.assertEqual(histogram.quantile(1.0), values[-1])
+        self.assertEqual((histogram.min, histogram.count), (values[0], len(values)))
+        # 32 buckets per power of 2, and one per value below 64
+        self.assert_(len(histogram.buckets) <= 64 + 32 * values[-1].bit_length())
+        self.assertEqual(LogHistogram().quantile(0.5), None)
+
+    def test_histograms_merge(self):
+        histogram, first, second = LogHistogram(), LogHistogram(), LogHistogram()
+        for value in range(0, 5000, 7):
+            histogram.add(value)
+            (first if value % 2 else second).add(value)
+        first.merge(second)
+        self.assertEqual(histogram.buckets, first.buckets)
+        self.assertEqual((histogram.min, histogram.max, histogram.count), (first.min, first.max, first.count))
+
+    def test_reservoir_is_uniform(self):
+        reservoir = Reservoir(1000)
+        for x in range(0, 100000):
+            reservoir.add(x)
+        self.assertEqual((len(reservoir), reservoir.seen), (1000, 100000))
+        self.assertEqual(len(set(reservoir)), 1000)
+        # The mean of a uniform sample of 1000 is within 3% of 50000, at more than 3 standard deviations
+        self.assert_(abs(sum(reservoir) / 1000.0 - 50000) < 1500)
+
+    def test_reservoirs_merge(self):
+        first, second = Reservoir(1000, seed = 1), Reservoir(1000, seed = 2)
+        for x in range(0, 30000):
+            first.add(x)
+        for x in range(30000, 100000):
+            second.add(x)
+        first.merge(second)
+        self.assertEqual((len(first), first.seen), (1000, 100000))
+        self.assertEqual(len([x for x in first if x < 30000]), 300)
+        # Small samples are kept whole
+        small, other = Reservoir(100), Reservoir(100)
+        small.add(1)
+        other.add(2)
+        small.merge(other)
+        self.assertEqual(sorted(small), [1, 2])
+
+    def test_memory_is_bounded(self):
+        stats = StatsAggregator(scatter_size = 100)
+        for x in range(0, 20000):
+            stats.next_record(MemoryRecord(0, 'string', 'key:%d' % x, 100 + x, 'string', x, x))
+        self.assertEqual(len(stats.scatters['string_memory_by_length']), 100)
+        self.assert_(len(stats.histograms['string_length'].buckets) < 500)
+        report = json.loads(stats.get_json())
+        self.assertEqual(report['quantiles']['string_length']['max'], 19999)
+        self.assertEqual(report['aggregates']['type_count']['string'], 20000)
+        self.assertEqual(len(report['scatters']['string_memory_by_length']), 100)
+
+class LargestKeysTestCase(unittest.TestCase):
+    def records(self):
+        rng = random.Random(0)
+        return [MemoryRecord(x % 3, rng.choice(('string', 'hash', 'list')), 'key:%d' % x, rng.randint(0, 1000),
+                             'hashtable', x, 0) for x in range(0, 5000)]
+
+    def largest(self, records, count):
+        return sorted(records, key = lambda record: (record.bytes, record), reverse = True)[:count]
+
+    def test_largest_keys(self):
+        records = self.records()
+        largest = LargestKeys(5)
+        for record in records:
+            largest.next_record(record)
+        groups = dict(largest.groups())
+        self.assertEqual(groups['all'], self.largest(records, 5))
+        self.assertEqual(groups['type:hash'], self.largest([r for r in records if r.type == 'hash'], 5))
+        self.assertEqual(groups['db:2'], self.largest([r for r in records if r.database == 2], 5))
+        self.assertEqual(len(groups), 1 + 3 + 3)
+
+    def test_merge_keeps_the_largest_of_every_group(self):
+        records = self.records()
+        expected, first, second = LargestKeys(3), LargestKeys(3), LargestKeys(3)
+        for record in records:
+            expected.next_record(record)
+            (first if record.size % 2 else second).next_record(record)
+        second.merge(first)
+        self.assertEqual(expected.groups(), second.groups())
+
+    def test_output(self):
+        largest = LargestKeys(2)
+        for x in range(0, 10):
+            largest.next_record(MemoryRecord(0, 'string', 'key:%d' % x, 10.0 * x, 'string', x, x))
+        out = StringIO()
+        largest.write_csv(out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            'group,database,type,key,size_in_bytes,encoding,num_elements,len_largest_element',
+            'all,0,string,"key:9",90,string,9,9',
+            'all,0,string,"key:8",80,string,8,8',
+            'type:string,0,string,"key:9",90,string,9,9',
+            'type:string,0,string,"key:8",80,string,8,8',
+            'db:0,0,string,"key:9",90,string,9,9',
+            'db:0,0,string,"key:8",80,string,8,8'])
+        out = StringIO()
+        largest.write_json(out)
+        report = json.loads(out.getvalue())
+        self.assertEqual([record['key'] for record in report['all']], ['key:9', 'key:8'])
+        self.assertEqual(report['type:string'][0]['size_in_bytes'], 90)
+
+    def test_stats_aggregator_reports_the_largest_keys(self):
+        stats = StatsAggregator(largest = 3)
+        for x in range(0, 100):
+            stats.next_record(MemoryRecord(0, 'string', 'key:%d' % x, 100 + x, 'string', x, x))
+        report = json.loads(stats.get_json())
+        self.assertEqual([record['key'] for record in report['largest']['all']], ['key:99', 'key:98', 'key:97'])
+        self.assertEqual(json.loads(StatsAggregator().get_json())['largest'], None)
+
+class KeyGroupsTestCase(unittest.TestCase):
+    def children(self, node):
+        return dict((child['prefix'], (child['keys'], child['bytes'], child['elements'])) for child in node['children'])
+
+    def test_prefixes(self):
+        tree = PrefixTree(depth = 2)
+        for key, size_in_bytes in (('user:1:name', 10), ('user:1:email', 20), ('user:2', 5), ('session/abc', 7), 
+                                   ('plain', 1), (1234, 2), ('a.b.c.d', 3)):
+            tree.add(key, size_in_bytes, 1)
+        tree = tree.as_dict()
+        self.assertEqual((tree['keys'], tree['bytes']), (7, 48))
+        self.assertEqual(self.children(tree), {'user:' : (3, 35, 3), 'session/' : (1, 7, 1), 'a.' : (1, 3, 1)})
+        user = [child for child in tree['children'] if child['prefix'] == 'user:'][0]
+        self.assertEqual(self.children(user), {'user:1:' : (2, 30, 2)})
+        self.assertEqual(self.children(tree['children'][-1]), {'a.b.' : (1, 3, 1)})
+
+    def test_prefixes_are_bounded(self):
+        tree = PrefixTree(depth = 2, max_nodes = 100)
+        for x in range(0, 10000):
+            # A few large namespaces, and many small ones
+            tree.add('big%d:%d:field' % (x % 3, x % 40) if x % 2 else 'small%d:%d' % (x, x), 1000 if x % 2 else 1, 1)
+        self.assert_(tree.nodes <= 100)
+        root = tree.as_dict()
+        self.assertEqual(root['keys'], 10000)
+        self.assert_(root['truncated'])
+        children = self.children(root)
+        for x in range(0, 3):
+            # The large namespaces were never pruned, so that their counts are exact
+            self.assertEqual(children['big%d:' % x][0], len([y for y in range(1, 10000, 2) if y % 3 == x]))
+
+    def test_prefixes_are_added_after_pruning(self):
+        tree = PrefixTree(depth = 2, max_nodes = 10)
+        tree.add('lock:a', 1, 1)
+        for x in range(0, 20):
+            tree.add('user:%d:x' % x, 100, 1)
+        tree.add('billing:big:1', 10 ** 9, 1)
+        root = tree.as_dict()
+        self.assert_(root['truncated'])
+        children = self.children(root)
+        self.assertEqual(children['billing:'], (1, 10 ** 9, 1))
+        billing = [child for child in root['children'] if child['prefix'] == 'billing:'][0]
+        self.assertEqual(self.children(billing), {'billing:big:' : (1, 10 ** 9, 1)})
+        # The bound of the memory of its keys seen before is at most the memory of all the keys before
+        self.assert_(0 < billing['missed_bytes'] <= 2001)
+        self.assertEqual(root['children'][0]['prefix'], 'billing:')
+        for x in range(0, 100):
+            tree.add('tiny%d:1' % x, 1, 1)
+        self.assert_(tree.nodes <= 10)
+        self.assertEqual(self.children(tree.as_dict())['billing:'], (1, 10 ** 9, 1))
+
+    def test_prefixes_merge(self):
+        tree, first, second = PrefixTree(max_nodes = 50), PrefixTree(max_nodes = 50), PrefixTree(max_nodes = 50)
+        for x in range(0, 2000):
+            key = 'ns%d:%d:%d' % (x % 7, x % 11, x)
+            tree.add(key, x, 1)
+            (first if x < 700 else second).add(key, x, 1)
+        first.merge(pickle.loads(pickle.dumps(second, 2)))
+        self.assertEqual(tree.as_dict()['keys'], first.as_dict()['keys'])
+        self.assert_(first.nodes <= 50)
+        small, other = PrefixTree(), PrefixTree()
+        small.add('a:b:1', 1, 1)
+        other.add('a:c:1', 2, 1)
+        small.merge(other)
+        self.assertEqual(self.children(small.as_dict()['children'][0]), {'a:b:' : (1, 1, 1), 'a:c:' : (1, 2, 1)})
+
+    def test_stats_aggregator_groups_keys(self):
+        stats = StatsAggregator(key_groupings = ['user:.*', 'user.*', 'session:.*'], prefix_depth = 1)
+        for key, data_type, length in (('user:1', 'hash', 3), ('users', 'list', 4), ('user:2', 'string', 100), ('other', 'set', 2)):
+            stats.next_record(MemoryRecord(0, data_type, key, 100, 'hashtable', length, 1))
+        report = json.loads(stats.get_json())
+        self.assertEqual([(group['pattern'], group['keys'], group['bytes'], group['elements']) for group in report['groups']],
+                         [('user:.*', 2, 200, 4), ('user.*', 1, 100, 4), ('session:.*', 0, 0, 0)])
+        self.assertEqual(self.children(report['prefixes']), {'user:' : (2, 200, 4)})
+        self.assertEqual(json.loads(StatsAggregator().get_json())['prefixes'], None)
+
+class SamplingTestCase(unittest.TestCase):
+    def records(self):
+        rng = random.Random(0)
+        return [MemoryRecord(0, rng.choice(('string', 'hash')), 'key:%d' % x, rng.randint(50, 150) if x % 10 else rng.randint(1000, 5000),
+                             'hashtable', 1, 1) for x in range(0, 20000)]
+
+    def aggregate(self, records, rate, **options):
+        stats = StatsAggregator(sample_rate = rate, key_groupings = ['key:1.*'], prefix_depth = 1, **options)
+        sample = KeySample(rate)
+        for record in records:
+            if sample.matches(record.key):
+                stats.next_record(record)
+        return stats
+
+    def test_estimates(self):
+        records = self.records()
+        report = json.loads(self.aggregate(records, 0.1).get_json())
+        self.assertEqual(report['sample_rate'], 0.1)
+        for data_type in ('string', 'hash'):
+            keys = [record for record in records if record.type == data_type]
+            total = sum(record.bytes for record in keys)
+            self.assert_(abs(report['aggregates']['type_memory'][data_type] - total) <= report['errors']['type_memory'][data_type])
+            self.assert_(abs(report['aggregates']['type_count'][data_type] - len(keys)) <= report['errors']['type_count'][data_type])
+            # The interval is narrow enough to be of use
+            self.assert_(report['errors']['type_memory'][data_type] < 0.2 * total)
+        group = report['groups'][0]
+        keys = [record for record in records if record.key.startswith('key:1')]
+        self.assert_(abs(group['bytes'] - sum(record.bytes for record in keys)) <= group['bytes_error'])
+        self.assert_(abs(group['keys'] - len(keys)) <= group['keys_error'])
+        prefix = report['prefixes']['children'][0]
+        self.assertEqual(prefix['prefix'], 'key:')
+        self.assert_(abs(prefix['bytes'] - sum(record.bytes for record in records)) <= prefix['bytes_error'])
+
+    def test_merge(self):
+        records = self.records()
+        expected, first, second = [self.aggregate(records[start:end], 0.1) for start, end in ((0, 20000), (0, 5000), (5000, 20000))]
+        first.merge(second)
+        self.assertEqual(json.loads(first.get_json())['errors'], json.loads(expected.get_json())['errors'])
+
+    def test_without_sampling(self):
+        records = self.records()[:100]
+        report = json.loads(self.aggregate(records, 1.0).get_json())
+        self.assertEqual(report['errors'], {})
+        self.assertEqual(report['aggregates']['type_count']['hash'], len([record for record in records if record.type == 'hash']))
+        self.assert_('bytes_error' not in report['groups'][0])
+        self.assertRaises(Exception, StatsAggregator, sample_rate = 0)
+
+class RedisVersionTestCase(unittest.TestCase):
+    def test_parse_redis_version(self):
+        self.assertEqual([parse_redis_version(version) for version in ('7', '6.2', '6.2.14', 3.2)], [(7, 0), (6, 2), (6, 2), (3, 2)])
+        self.assertRaises(Exception, parse_redis_version, 'unstable')
+
+    def test_strings(self):
+        callback = MemoryCallback(None, 64, redis_version = '7.0')
+        # Shared integers, integers in the pointer of their object, embedded strings, and objects with their own sds
+        self.assertEqual([callback.sizeof_string_object(value) for value in (42, '9999', '10000', -1, '007', 'x' * 44, 'x' * 45)], 
+                         [0, 0, 16, 16, 24, 64, 16 + 56])
+        # sdshdr5, sdshdr8 and sdshdr16 strings, rounded up to jemalloc size classes
+        self.assertEqual([callback.sizeof_string('x' * length) for length in (0, 5, 31, 32, 255, 256, 5000)], 
+                         [8, 8, 40, 40, 320, 320, 5120])
+        self.assertEqual(callback.sizeof_strings(['x' * 5, 'x' * 32, 12345]), (8 + 40 + 8, 32))
+        old = MemoryCallback(None, 64, redis_version = '2.8')
+        self.assertEqual([old.sizeof_string_object('x' * 5), old.sizeof_string('x' * 5)], [16 + 16, 16])
+
+    def test_allocators(self):
+        jemalloc = MemoryCallback(None, 64, redis_version = '6.2')
+        libc = MemoryCallback(None, 64, redis_version = '6.2', allocator = 'libc')
+        self.assertEqual((jemalloc.hashtable_entry_overhead(), libc.hashtable_entry_overhead()), (24, 24))
+        self.assertEqual((jemalloc.robj_overhead(), libc.robj_overhead()), (16, 24))
+        self.assertEqual(MemoryCallback(None, 64, redis_version = '6.2', allocator = Libc()).robj_overhead(), 24)
+        # The dict struct shrank from 96 to 56 bytes in Redis 7.0
+        self.assertEqual(jemalloc.hashtable_overhead(1000) - MemoryCallback(None, 64, redis_version = '7.0').hashtable_overhead(1000), 40)
+
+    def test_every_dump_is_sized(self):
+        for file_name in os.listdir(os.path.join(os.path.dirname(__file__), 'dumps')):
+            if not file_name.endswith('.rdb'):
+                continue
+            legacy = get_stats(file_name)
+            for version in ('3.0', '6.2', '7.0'):
+                records = get_stats(file_name, redis_version = version)
+                self.assertEqual(sorted(records), sorted(legacy))
+                for key, record in records.iteritems():
+                    self.assertEqual(record._replace(bytes = 0), legacy[key]._replace(bytes = 0))
+                    self.assert_(0 < record.bytes < 2 * legacy[key].bytes, "%s in %s" % (key, file_name))
+
+    def test_estimates_match_recorded_memory_usage(self):
+        # Recorded from live servers by tests/record_memory_usage.py
+        folder = os.path.join(os.path.dirname(__file__), 'memory_usage')
+        recordings = sorted(name for name in os.listdir(folder) if name.endswith('.json'))
+        self.assertEqual(sorted(set(name.split('-')[2] for name in recordings)), ['jemalloc.json', 'libc.json'])
+        for name in recordings:
+            with open(os.path.join(folder, name)) as f:
+                recording = json.load(f)
+            allocator = 'jemalloc' if recording['mem_allocator'].startswith('jemalloc') else 'libc'
+            records = get_stats(name[:-len('.json')] + '.rdb', folder = 'memory_usage',
+                                redis_version = recording['redis_version'], allocator = allocator)
+            self.assertEqual(sorted(records), sorted(recording['memory_usage']))
+            for key, usage in recording['memory_usage'].iteritems():
+                estimate, allocated = records[key].bytes, recording['allocated'][key]
+                # The memory freed by deleting the key is what is estimated. Only the random levels of 
+                # skiplist nodes differ from the expected ones, by about 1%
+                self.assert_(abs(estimate - allocated) <= 0.02 * allocated, 
+                             "%s of %s is estimated at %d bytes, not %d" % (key, name, estimate, allocated))
+                # MEMORY USAGE does not round objects, compact encodings and dictionary entries up to their size 
+                # classes, and counts 16 bytes for shared integers, which adds up to a few dozen bytes per key
+                self.assert_(abs(estimate - usage) <= max(32, 0.05 * usage), 
+                             "%s of %s is estimated at %d bytes, and uses %d" % (key, name, estimate, usage))
@@ -0,0 +1,55 @@
+import unittest
+import os
+from StringIO import StringIO
+
+from rdbtools import RdbParser, ParallelRdbParser, JSONCallback, DiffCallback, MemoryCallback, StatsAggregator
+
+def dump_path(file_name) :
+    return os.path.join(os.path.dirname(__file__), 'dumps', file_name)
+
+def serial_output(callback_class, file_name, filters=None) :
+    out = StringIO()
+    RdbParser(callback_class(out), filters).parse(dump_path(file_name))
+    return out.getvalue()
+
+def parallel_output(callback_class, file_name, filters=None) :
+    out = StringIO()
+    # A chunk size of 1 byte puts every key in a chunk of its own
+    parser = ParallelRdbParser(callback_class(out), callback_class, filters, processes=2, chunk_size=1)
+    parser.parse(dump_path(file_name), out)
+    return out.getvalue()
+
+def stats_callback(out) :
+    return MemoryCallback(StatsAggregator(), 64)
+
+class ParallelParserTestCase(unittest.TestCase):
+    def test_json_output_matches_serial(self):
+        for file_name in ('multiple_databases.rdb', 'parser_filters.rdb', 'keys_with_expiry.rdb', 'empty_database.rdb') :
+            self.assertEquals(serial_output(JSONCallback, file_name), parallel_output(JSONCallback, file_name),
+                              msg = "%s parsed differently" % file_name)
+
+    def test_diff_output_matches_serial(self):
+        for file_name in ('multiple_databases.rdb', 'parser_filters.rdb', 'dictionary.rdb') :
+            self.assertEquals(serial_output(DiffCallback, file_name), parallel_output(DiffCallback, file_name),
+                              msg = "%s parsed differently" % file_name)
+
+    def test_filtered_json_output_matches_serial(self):
+        filters = {"keys" : "k[0-9]"}
+        self.assertEquals(serial_output(JSONCallback, 'parser_filters.rdb', filters), 
+                          parallel_output(JSONCallback, 'parser_filters.rdb', filters))
+
+    def test_prefix_filtered_json_output_matches_serial(self):
+        filters = {"prefixes" : ["k", "z"], "exclude_keys" : ["z2"]}
+        self.assertEquals(serial_output(JSONCallback, 'parser_filters.rdb', filters), 
+                          parallel_output(JSONCallback, 'parser_filters.rdb', filters))
+
+    def test_memory_stats_are_reduced(self):
+        serial = stats_callback(None)
+        RdbParser(serial).parse(dump_path('parser_filters.rdb'))
+        parallel = stats_callback(None)
+        ParallelRdbParser(parallel, stats_callback, processes=2, chunk_size=1).parse(dump_path('parser_filters.rdb'))
+        self.assertEquals(serial._stream.aggregates['type_count'], parallel._stream.aggregates['type_count'])
+        self.assertEquals(serial._stream.aggregates['database_memory'].keys(), 
+                          parallel._stream.aggregates['database_memory'].keys())
+        self.assertEquals(sorted(serial._stream.scatters['string_memory_by_length']), 
+                          sorted(parallel._stream.scatters['string_memory_by_length']))
@@ -1,7 +1,19 @@
 import unittest
 import os
 import math
-from rdbtools import RdbCallback, RdbParser
+import itertools
+import gzip
+import shutil
+import tempfile
+import struct
+from rdbtools import RdbCallback, RdbParser, ProtocolCallback, DiffCallback
+from rdbtools.parser import lzf_decompress, BufferReader, FileReader, StreamReader, verify_dump
+from rdbtools.parser import ELEMENTS_LENGTHS, ELEMENTS_NONE, element_length
+from rdbtools.crc64 import crc64, crc64_python
+from rdbtools.WriteRdbCallback import WriteRdbCallback
+from tests.create_modern_rdbs import ziplist
+from StringIO import StringIO
+from rdbtools.filters import PrefixSet, KeySample
 
 class RedisParserTestCase(unittest.TestCase):
     def setUp(self):
@@ -146,6 +158,26 @@ class RedisParserTestCase(unittest.TestCase):
         for num in (0x7ffefffefffefffe, 0x7ffefffefffefffd, 0x7ffefffefffefffc) :
             self.assert_(num in r.databases[0]["intset_64"])
 
+    def test_signed_integers(self):
+        r = load_rdb('signed_integers.rdb')
+        self.assertEquals(sorted(r.databases[0]['intset_16_signed']), [-32768, -1, 0, 32767])
+        self.assertEquals(sorted(r.databases[0]['intset_32_signed']), [-2147483648, -70000, 5, 2147483647])
+        self.assertEquals(sorted(r.databases[0]['intset_64_signed']), 
+                          [-9223372036854775808, -5000000000, -1, 9223372036854775807])
+        self.assertEquals(r.databases[0]['hash_with_integers'][-8388608], 8388608)
+        self.assertEquals(r.databases[0]['hash_with_integers']['field'], 'value')
+        self.assertEquals(r.databases[0]['sorted_set_with_integers']['member:-9223372036854775808'], -9223372036854775808)
+        self.assertEquals(r.databases[0]['sorted_set_with_integers'][-5], 1.5)
+
+    def test_bulk_decoders_match_entry_decoders(self):
+        for file_name in os.listdir(os.path.join(os.path.dirname(__file__), 'dumps')) :
+            for callback in (MockRedis, BatchingMockRedis) :
+                r, reference = callback(), callback()
+                RdbParser(r).parse(dump_path(file_name))
+                EntryDecodingParser(reference).parse(dump_path(file_name))
+                self.assertEquals(r.databases, reference.databases, msg = "%s parsed differently" % file_name)
+                self.assertEquals(r.lengths, reference.lengths, msg = "%s parsed differently" % file_name)
+
     def test_regular_set(self):
         r = load_rdb('regular_set.rdb')
         self.assertEquals(r.lengths[0]["regular_set"], 6)
@@ -160,6 +192,197 @@ class RedisParserTestCase(unittest.TestCase):
         self.assert_(floateq(zset['cb7a24bb7528f934b841b34c3a73e0c7'], 2.37))
         self.assert_(floateq(zset['523af537946b79c4f8369ed39ba78605'], 3.423))
 
+    def test_quicklist(self):
+        r = load_rdb('quicklist.rdb')
+        values = r.databases[0]["quicklist"]
+        self.assertEquals(r.lengths[0]["quicklist"], 27)
+        self.assertEquals(values[:10], ['aaaaaaaaaaaaaaaaaaaa%d' % x for x in range(0, 10)])
+        self.assertEquals(values[10:24], [0, 12, 13, -128, 127, 255, -32768, 32767, 8388607, -8388608,
+                                          2147483647, -2147483648, 0x7fffffffffffffff, -0x8000000000000000])
+        self.assertEquals(values[24:], ['x' * 100, 'y' * 20000, 'z'])
+
+    def test_quicklist_2(self):
+        r = load_rdb('quicklist_2.rdb')
+        values = r.databases[0]["quicklist_2"]
+        self.assertEquals(r.lengths[0]["quicklist_2"], 138)
+        self.assertEquals(values[:128], ['value:%d' % x for x in range(0, 128)])
+        # A plain node holds a single element
+        self.assertEquals(values[128], 'p' * 5000)
+        self.assertEquals(values[129:], [1, -1, 4095, -4096, 4096, 100000, -8388608, 2147483647, -0x8000000000000000])
+
+    def test_hash_as_listpack(self):
+        r = load_rdb('hash_as_listpack.rdb')
+        self.assertEquals(r.databases[0]["hash_as_listpack"], {
+            'f6' : 'short value', 'f12' : 'v' * 100, 'f32' : 'w' * 5000, 'int7' : 100, 'int13' : -3000,
+            'int16' : 30000, 'int24' : -8000000, 'int32' : 2000000000, 'int64' : -9000000000000000000})
+
+    def test_sorted_set_as_listpack(self):
+        r = load_rdb('sorted_set_as_listpack.rdb')
+        self.assertEquals(r.databases[0]["sorted_set_as_listpack"], {
+            'one' : 1, 'minus' : -5, 'half' : 0.5, 'pi' : 3.14159, 'big' : 1e20, 'infinite' : float('inf')})
+
+    def test_set_as_listpack(self):
+        r = load_rdb('set_as_listpack.rdb')
+        self.assertEquals(r.databases[0]["set_as_listpack"], ['alpha', 'beta', 7, -20, 70000, 'x' * 70])
+
+    def test_sorted_set_2(self):
+        r = load_rdb('sorted_set_2.rdb')
+        zset = r.databases[0]["sorted_set_2"]
+        self.assertEquals(r.lengths[0]["sorted_set_2"], 202)
+        self.assertEquals(zset['member:0'], -10)
+        self.assertEquals(zset['member:199'], 39.75)
+        self.assertEquals(zset['+inf'], float('inf'))
+        self.assertEquals(zset['-inf'], float('-inf'))
+        # Keys with LFU and LRU information
+        self.assertEquals(r.expiry[0]["sorted_set_2"].year, 2022)
+        self.assertEquals(r.databases[0]["idle_string"], 'idle value')
+
+    def test_stream(self):
+        r = load_rdb('stream.rdb')
+        stream = r.databases[0]['stream']
+        self.assertEquals(r.lengths[0]['stream'], 9)
+        self.assertEquals([entry_id for entry_id, pairs in stream['entries']], 
+                          ['1700000000000-0', '1700000000002-0', '1700000000003-1', '1700000000004-0', '1700000000005-0', 
+                           '1700000001000-0', '1700000001001-1', '1700000001002-0', '1700000001003-0'])
+        self.assertEquals(stream['entries'][0][1], [('sensor', 'temperature'), ('value', 20)])
+        self.assertEquals(stream['entries'][4][1], [('sensor', 'humidity'), ('value', 'x' * 100), ('unit', '%')])
+        self.assertEquals(stream['info']['length'], 9)
+        self.assertEquals(stream['info']['last_id'], '1700000001003-0')
+        self.assertEquals(stream['info']['first_id'], None)
+        self.assertEquals(stream['info']['nodes'], 2)
+        readers, archivers = stream['groups']
+        self.assertEquals(readers.name, 'readers')
+        self.assertEquals(readers.last_id, '1700000001000-0')
+        self.assertEquals([(entry.id, entry.delivery_count) for entry in readers.pending], 
+                          [('1700000000000-0', 1), ('1700000000002-0', 3)])
+        self.assertEquals(readers.pending[0].delivery_time.year, 2023)
+        self.assertEquals([(consumer.name, consumer.pending) for consumer in readers.consumers], 
+                          [('alice', ['1700000000000-0']), ('bob', ['1700000000002-0']), ('carol', [])])
+        self.assertEquals((archivers.pending, archivers.consumers), ([], []))
+        self.assertEquals(r.databases[0]['empty_stream'], {'entries': [], 'groups': [], 'info': r.databases[0]['empty_stream']['info']})
+        self.assertEquals(r.databases[0]['after_streams'], 'value')
+
+    def test_streams_2_and_3(self):
+        r = load_rdb('streams_2_and_3.rdb')
+        for key in ('stream_2', 'stream_3') :
+            stream = r.databases[0][key]
+            self.assertEquals([entry_id for entry_id, pairs in stream['entries']], ['1700000000001-1', '1700000000002-0'])
+            self.assertEquals(stream['info']['first_id'], '1700000000001-1')
+            self.assertEquals(stream['info']['max_deleted_entry_id'], '1700000000000-0')
+            self.assertEquals(stream['info']['entries_added'], 3)
+            self.assertEquals(stream['groups'][0].entries_read, 2)
+        alice, bob = r.databases[0]['stream_2']['groups'][0].consumers
+        self.assertEquals(alice.active_time, None)
+        alice, bob = r.databases[0]['stream_3']['groups'][0].consumers
+        self.assertEquals(alice.active_time.year, 2023)
+        self.assertEquals(bob.active_time, None)
+
+    def test_streams_are_skipped(self):
+        for file_name in ('stream.rdb', 'streams_2_and_3.rdb') :
+            r = load_rdb(file_name, filters = {'types' : ['string']})
+            self.assertEquals(r.databases[0], {'after_streams' : 'value'} if file_name == 'stream.rdb' else {})
+            entries = list(RdbParser(None).scan_keys(BufferReader(open(dump_path(file_name), 'rb').read())))
+            self.assertEquals([entry.data_type for entry in entries], [15, 15, 0] if file_name == 'stream.rdb' else [19, 21])
+        records = list(RdbParser(None).iter_records(dump_path('stream.rdb')))
+        self.assertEquals([(record.key, record.data_type, record.encoding, record.length) for record in records], 
+                          [('stream', 'stream', 'stream', 9), ('empty_stream', 'stream', 'stream', 0), ('after_streams', 'string', 'string', 1)])
+        self.assertEquals(records[0].value[1], ('1700000000002-0', [('sensor', 'temperature'), ('value', 22)]))
+
+    def test_streams_as_commands(self):
+        out = StringIO()
+        RdbParser(ProtocolCallback(out)).parse(dump_path('stream.rdb'))
+        commands = [command.split('\r\n')[2::2] for command in out.getvalue().split('*')[1:]]
+        self.assertEquals(commands[1], ['XADD', 'stream', '1700000000000-0', 'sensor', 'temperature', 'value', '20'])
+        self.assertEquals([command[:2] for command in commands[10:]], 
+                          [['XSETID', 'stream'], ['XGROUP', 'CREATE'], ['XCLAIM', 'stream'], ['XCLAIM', 'stream'], 
+                           ['XGROUP', 'CREATECONSUMER'], ['XGROUP', 'CREATE'], ['XADD', 'empty_stream'], 
+                           ['XSETID', 'empty_stream'], ['SET', 'after_streams']])
+        self.assertEquals(commands[12], ['XCLAIM', 'stream', 'readers', 'alice', '0', '1700000000000-0', 
+                                         'TIME', '1700000005000', 'RETRYCOUNT', '1', 'JUSTID', 'FORCE'])
+        out = StringIO()
+        RdbParser(ProtocolCallback(out)).parse(dump_path('streams_2_and_3.rdb'))
+        commands = [command.split('\r\n')[2::2] for command in out.getvalue().split('*')[1:]]
+        self.assertEquals(commands[3], ['XSETID', 'stream_2', '1700000000002-0', 'ENTRIESADDED', '3', 'MAXDELETEDID', '1700000000000-0'])
+        self.assertEquals(commands[4], ['XGROUP', 'CREATE', 'stream_2', 'readers', '1700000000001-1', 'ENTRIESREAD', '2'])
+
+    def test_streams_are_diffed(self):
+        out = StringIO()
+        RdbParser(DiffCallback(out)).parse(dump_path('stream.rdb'))
+        lines = out.getvalue().split('\r\n')
+        self.assertEquals(lines[0], 'db=0 "stream"[1700000000000-0] . "sensor" -> "temperature"')
+        self.assertEquals(lines[20:26], ['db=0 "stream" group "readers" -> last_id=1700000001000-0', 
+                                         'db=0 "stream" group "readers" . "alice" -> pending=[1700000000000-0]', 
+                                         'db=0 "stream" group "readers" . "bob" -> pending=[1700000000002-0]', 
+                                         'db=0 "stream" group "readers" . "carol" -> pending=[]', 
+                                         'db=0 "stream" group "archivers" -> last_id=0-0', 
+                                         'db=0 "stream" -> last_id=1700000001003-0'])
+
+    def test_metadata_opcodes_are_skipped(self):
+        r = load_rdb('metadata_opcodes.rdb')
+        self.assertEquals(r.databases, {0 : {'with_idle' : 'idle', 'with_freq' : 'frequent'}, 3 : {'in_db_3' : 'three'}})
+        self.assertEquals(r.expiry[0]['with_freq'].year, 2022)
+        entries = list(RdbParser(None).scan_keys(BufferReader(open(dump_path('metadata_opcodes.rdb'), 'rb').read())))
+        self.assertEquals([(entry.database, entry.key) for entry in entries], [(0, 'with_idle'), (0, 'with_freq'), (3, 'in_db_3')])
+
+    def test_metadata_opcodes_are_reported(self):
+        class MetadataCallback(RdbCallback):
+            def __init__(self):
+                self.events = []
+            def aux_field(self, key, value):
+                self.events.append(('aux', key, value))
+            def start_database(self, db_number):
+                self.events.append(('db', db_number))
+            def db_size(self, db_size, expires_size):
+                self.events.append(('db_size', db_size, expires_size))
+            def set(self, key, value, expiry, info):
+                self.events.append(('set', key, info))
+        callback = MetadataCallback()
+        RdbParser(callback).parse(dump_path('metadata_opcodes.rdb'))
+        self.assertEquals(callback.events, [
+            ('aux', 'redis-ver', '7.2.4'), ('aux', 'redis-bits', 64), ('aux', 'ctime', 1700000000), 
+            ('aux', 'used-mem', 2000000), ('aux', 'aof-base', 0), 
+            ('db', 0), ('db_size', 2, 1), 
+            ('set', 'with_idle', {'encoding': 'string', 'idle': 3600}), 
+            ('set', 'with_freq', {'encoding': 'string', 'freq': 200}), 
+            ('db', 3), ('db_size', 1, 0), ('set', 'in_db_3', {'encoding': 'string'})])
+
+    def test_summarize(self):
+        def summarize(file_name, filters = None):
+            return RdbParser(None, filters).summarize(BufferReader(open(dump_path(file_name), 'rb').read()))
+        summary = summarize('metadata_opcodes.rdb')
+        self.assertEquals(summary.version, 11)
+        self.assertEquals(summary.aux[0], ('redis-ver', '7.2.4'))
+        self.assertEquals(summary.databases, [(0, 2, 1), (3, 1, 0)])
+        self.assertEquals(summarize('metadata_opcodes.rdb', {'dbs' : [3]}).databases, [(3, 1, 0)])
+        # Without RESIZEDB, the keys are counted
+        summary = summarize('keys_with_expiry.rdb')
+        self.assertEquals((summary.version, summary.aux), (4, []))
+        self.assertEquals(summary.databases, [(0, 1, 1)])
+        self.assertEquals(summarize('multiple_databases.rdb').databases, [(0, 1, 0), (2, 1, 0)])
+        self.assertEquals(summarize('multiple_databases.rdb', {'dbs' : [0]}).databases, [(0, 1, 0)])
+
+    def test_ziplist_entries_match_entry_decoder(self):
+        values = [0, 12, 13, -128, 127, 255, -32768, 32767, 8388607, -8388608, 2147483647, -2147483648,
+                  0x7fffffffffffffff, -0x8000000000000000, '', 'a' * 63, 'b' * 64, 'c' * 300, 'd' * 16384, 'e']
+        zl = ziplist(values)
+        parser = RdbParser(None)
+        buff = BufferReader(zl, 10)
+        self.assertEquals(parser.read_ziplist_entries(zl), [parser.read_ziplist_entry(buff) for value in values])
+        self.assertEquals(parser.read_ziplist_entries(zl), values)
+
+    def test_rdb_versions(self):
+        parser = RdbParser(None)
+        for version in range(1, 12) :
+            parser.verify_version('%04d' % version)
+        self.assertRaises(Exception, parser.verify_version, '0012')
+
+    def test_64bit_lengths(self):
+        buf = '\x81\x00\x00\x00\x01\x00\x00\x00\x00' + '\x81\x00\x00\x00\x00\x00\x00\x00\x03abc' + 'END'
+        for reader in (BufferReader(buf), FileReader(StringIO(buf)), StreamReader(Unseekable(buf), buffer_size = 4)) :
+            self.assertEquals(reader.read_length_with_encoding(), (1 << 32, False))
+            reader.skip_strings(1)
+            self.assertEquals(reader.read(3), 'END')
+
     def test_filtering_by_keys(self):
         r = load_rdb('parser_filters.rdb', filters={"keys":"k[0-9]"})
         self.assertEquals(r.databases[0]['k1'], "ssssssss")
@@ -181,6 +404,50 @@ class RedisParserTestCase(unittest.TestCase):
         self.assertEquals(len(r.databases[0]), 0)
         self.assertEquals(len(r.databases[2]), 1)
 
+    def test_filtering_by_prefixes(self):
+        r = load_rdb('parser_filters.rdb', filters={"prefixes":["k", "z1", "z"]})
+        self.assertEquals(sorted(r.databases[0].keys()), ['k1', 'k3', 'z1', 'z2', 'z3', 'z4'])
+
+    def test_filtering_by_exact_keys(self):
+        r = load_rdb('parser_filters.rdb', filters={"exact_keys":["k1", "z2", "no such key"]})
+        self.assertEquals(sorted(r.databases[0].keys()), ['k1', 'z2'])
+
+    def test_filtering_by_excluded_keys_and_prefixes(self):
+        everything = load_rdb('parser_filters.rdb')
+        r = load_rdb('parser_filters.rdb', filters={"exclude_prefixes":["z", "l"], "exclude_keys":["k1"]})
+        expected = [key for key in everything.databases[0] if not key.startswith(('z', 'l')) and key != 'k1']
+        self.assertEquals(sorted(r.databases[0].keys()), sorted(expected))
+
+    def test_key_filters_are_combined(self):
+        r = load_rdb('parser_filters.rdb', filters={"keys":"[kz]", "prefixes":["k", "z"], "exclude_keys":["z1"], "types":["sortedset"]})
+        self.assertEquals(sorted(r.databases[0].keys()), ['z2', 'z3', 'z4'])
+
+    def test_prefix_set(self):
+        prefixes = PrefixSet(['user:1', 'user:12', 'tenant:', 'a', 'ab'])
+        self.assertEquals(len(prefixes), 3)
+        for key in ('user:1', 'user:123', 'tenant:x', 'a', 'abc') :
+            self.assert_(prefixes.matches(key), msg = key)
+        for key in ('user:', 'user:2', 'tenant', '', 'b', '0') :
+            self.assert_(not prefixes.matches(key), msg = key)
+
+    def test_key_sample(self):
+        keys = ['user:%d' % x for x in range(0, 20000)]
+        for rate in (0.5, 0.1, 0.01):
+            sample = [key for key in keys if KeySample(rate).matches(key)]
+            # Within 4 standard deviations of the expected size of the sample
+            self.assert_(abs(len(sample) - rate * len(keys)) < 4 * (len(keys) * rate * (1 - rate)) ** 0.5, msg = rate)
+            self.assertEquals(sample, [key for key in keys if KeySample(rate).matches(key)])
+        self.assert_(all(KeySample(1).matches(key) for key in keys))
+        for rate in (0, -0.5, 1.5):
+            self.assertRaises(Exception, KeySample, rate)
+
+    def test_filtering_by_sample(self):
+        everything = load_rdb('parser_filters.rdb')
+        self.assertEquals(load_rdb('parser_filters.rdb', filters={"sample":1.0}).databases, everything.databases)
+        r = load_rdb('parser_filters.rdb', filters={"sample":0.5})
+        sample = KeySample(0.5)
+        self.assertEquals(sorted(r.databases[0].keys()), sorted(key for key in everything.databases[0] if sample.matches(key)))
+
     def test_rdb_version_5_with_checksum(self):
         r = load_rdb('rdb_version_5_with_checksum.rdb')
         self.assertEquals(r.databases[0]['abcd'], 'efgh')
@@ -189,13 +456,412 @@ class RedisParserTestCase(unittest.TestCase):
         self.assertEquals(r.databases[0]['abcdef'], 'abcdef')
         self.assertEquals(r.databases[0]['longerstring'], 'thisisalongerstring.idontknowwhatitmeans')
 
+    def test_file_reader_matches_mmap_reader(self):
+        for file_name in os.listdir(os.path.join(os.path.dirname(__file__), 'dumps')) :
+            mapped = load_rdb(file_name, use_mmap=True)
+            read = load_rdb(file_name, use_mmap=False)
+            self.assertEquals(mapped.databases, read.databases, msg = "%s parsed differently" % file_name)
+            self.assertEquals(mapped.lengths, read.lengths, msg = "%s parsed differently" % file_name)
+
+    def test_lzf_decompress_fixtures(self):
+        blobs = []
+        for file_name in os.listdir(os.path.join(os.path.dirname(__file__), 'dumps')) :
+            r = MockRedis()
+            parser = RecordingLzfParser(r, blobs)
+            parser.parse(os.path.join(os.path.dirname(__file__), 'dumps', file_name))
+        self.assert_(len(blobs) > 0, msg = "expected compressed strings in the fixtures")
+        for compressed, expected_length in blobs :
+            self.assertEquals(lzf_decompress(compressed, expected_length), 
+                              reference_lzf_decompress(compressed, expected_length))
+
+    def test_lzf_decompress_overlapping_reference(self):
+        # "ab" as a literal, then a 9 byte back reference starting 2 bytes back
+        compressed = '\x01ab' + chr((7 << 5) | 0) + chr(0) + chr(1)
+        self.assertEquals(lzf_decompress(compressed, 11), 'ab' * 5 + 'a')
+        self.assertEquals(lzf_decompress(compressed, 11), reference_lzf_decompress(compressed, 11))
+
+    def test_iter_records_matches_callbacks(self):
+        for file_name in os.listdir(os.path.join(os.path.dirname(__file__), 'dumps')) :
+            r = load_rdb(file_name)
+            for lazy in (False, True) :
+                databases = {}
+                for record in RdbParser(None).iter_records(dump_path(file_name), lazy = lazy) :
+                    value = record.value
+                    if record.data_type in ('list', 'set') :
+                        value = list(value)
+                    elif record.data_type in ('hash', 'sortedset') :
+                        value = dict(value)
+                    elif record.data_type == 'stream' :
+                        # Records only hold the entries of streams
+                        value = dict(r.databases[record.database][record.key], entries = list(value))
+                    databases.setdefault(record.database, {})[record.key] = value
+                    self.assertEquals(r.lengths[record.database].get(record.key, 1), record.length)
+                    self.assertEquals(r.expiry[record.database].get(record.key), record.expiry)
+                self.assertEquals(r.databases, databases, msg = "%s parsed differently" % file_name)
+
+    def test_iter_records_ignores_the_elements_wanted_by_the_callback(self):
+        for wants_elements in (ELEMENTS_LENGTHS, ELEMENTS_NONE) :
+            census = ElementCensus(wants_elements)
+            parser = RdbParser(census)
+            for file_name in ('ziplist_that_compresses_easily.rdb', 'zipmap_with_big_values.rdb', 'intset_16.rdb') :
+                records = list(RdbParser(None).iter_records(dump_path(file_name)))
+                self.assertEquals(list(parser.iter_records(dump_path(file_name))), records, msg = file_name)
+                self.assert_(records[0].value)
+            # The callback still gets the elements it wants
+            parser.parse(dump_path('ziplist_that_compresses_easily.rdb'))
+            self.assertEquals(census.elements, 0)
+
+    def test_iter_records_skips_unread_lazy_elements(self):
+        records = []
+        for record in RdbParser(None).iter_records(dump_path('parser_filters.rdb'), lazy = True) :
+            if record.data_type != 'string' :
+                # Read a single element of every collection
+                records.append((record.key, list(itertools.islice(record.value, 1))))
+            else :
+                records.append((record.key, record.value))
+        self.assertEquals([key for key, value in records], 
+                          [record.key for record in RdbParser(None).iter_records(dump_path('parser_filters.rdb'))])
+
+    def test_iter_records_lazy_elements_expire(self):
+        r = load_rdb('linkedlist.rdb')
+        records = RdbParser(None).iter_records(dump_path('linkedlist.rdb'), lazy = True)
+        record = records.next()
+        self.assertEquals(record.encoding, 'linkedlist')
+        self.assertEquals(record.value.next(), r.databases[0]['force_linkedlist'][0])
+        self.assertRaises(StopIteration, records.next)
+        self.assertRaises(Exception, record.value.next)
+
+    def test_iter_records_stops_early(self):
+        records = RdbParser(None, {'keys' : 'k[0-9]+'}).iter_records(dump_path('parser_filters.rdb'))
+        first = records.next()
+        self.assertEquals(first.key, 'k1')
+        records.close()
+
+    def test_batches_match_elements(self):
+        for file_name in os.listdir(os.path.join(os.path.dirname(__file__), 'dumps')) :
+            r = load_rdb(file_name)
+            batched = BatchingMockRedis()
+            RdbParser(batched).parse(dump_path(file_name))
+            self.assertEquals(r.databases, batched.databases, msg = "%s parsed differently" % file_name)
+            self.assertEquals(r.lengths, batched.lengths, msg = "%s parsed differently" % file_name)
+
+    def test_hashtables_are_batched_in_chunks(self):
+        r = BatchingMockRedis()
+        r.batch_size = 300
+        RdbParser(r).parse(dump_path('dictionary.rdb'))
+        self.assertEquals(r.batches, [300, 300, 300, 100])
+        self.assertEquals(len(r.databases[0]['force_dictionary']), 1000)
+
+    def test_compact_encodings_are_batched_at_once(self):
+        r = BatchingMockRedis()
+        r.batch_size = 2
+        RdbParser(r).parse(dump_path('ziplist_with_integers.rdb'))
+        self.assertEquals(r.batches, [24])
+
+    def test_element_events_are_not_sent_when_not_wanted(self):
+        for file_name in os.listdir(os.path.join(os.path.dirname(__file__), 'dumps')) :
+            r = load_rdb(file_name)
+            for wants_elements in (ELEMENTS_LENGTHS, ELEMENTS_NONE) :
+                census = ElementCensus(wants_elements)
+                RdbParser(census).parse(dump_path(file_name))
+                msg = "%s parsed differently with %s" % (file_name, wants_elements)
+                self.assertEquals(r.lengths, census.lengths, msg = msg)
+                if wants_elements == ELEMENTS_NONE :
+                    self.assertEquals(census.elements, 0, msg = msg)
+                    self.assertEquals(census.largest, {}, msg = msg)
+                for (dbnum, key), largest in census.largest.iteritems() :
+                    value = r.databases[dbnum][key]
+                    if isinstance(value, dict) and census.types[key] == 'hash' :
+                        elements = value.keys() + value.values()
+                    else :
+                        # The members of sorted sets, without their scores
+                        elements = list(value)
+                    self.assertEquals(max(element_length(e) for e in elements), largest, msg = "%s %s" % (msg, key))
+
+    def test_zipmap_lengths_match_decoded_values(self):
+        pairs = [('a', '12'), ('b', '-7'), ('c', ' 42 '), ('d', '1x'), ('e', ''), 
+                 ('f', '12345678901234567890123'), ('long', 'v' * 300)]
+        buf = zipmap_dump(pairs)
+        r = MockRedis()
+        RdbParser(r).parse(StringIO(buf))
+        # Values are decoded as integers when they can be
+        self.assertEquals(r.databases[0]['zipmap'], {'a': 12, 'b': -7, 'c': 42, 'd': '1x', 'e': '', 
+                                                     'f': 12345678901234567890123, 'long': 'v' * 300})
+        self.assertEquals(RdbParser(None).read_zipmap_lengths(zipmap(pairs)), 
+                          [1, 8, 1, 8, 1, 8, 1, 2, 1, 0, 1, 16, 4, 300])
+        for wants_elements in (ELEMENTS_LENGTHS, ELEMENTS_NONE) :
+            census = ElementCensus(wants_elements)
+            RdbParser(census).parse(StringIO(buf))
+            self.assertEquals(census.lengths, r.lengths)
+            self.assertEquals(census.elements, 0)
+        self.assertEquals(census.largest, {})
+        census = ElementCensus(ELEMENTS_LENGTHS)
+        RdbParser(census).parse(StringIO(buf))
+        self.assertEquals(census.largest, {(0, 'zipmap'): 300})
+
+    def test_wants_elements_is_ignored_with_raw_bytes(self):
+        class RawCensus(ElementCensus) :
+            wants_raw_bytes = True
+            def start_database(self, dbnum, info) :
+                ElementCensus.start_database(self, dbnum)
+            def end_database(self, dbnum, info) :
+                pass
+            def element(self, *args) :
+                self.elements += 1
+            hset = sadd = rpush = zadd = element
+        census = RawCensus(ELEMENTS_NONE)
+        RdbParser(census).parse(dump_path('ziplist_with_integers.rdb'))
+        self.assertEquals(census.elements, 24)
+
+    def test_skip_strings(self):
+        strings = ('\x03abc'                                # 6 bit length
+                   + '\x40\x64' + 'x' * 100                 # 14 bit length
+                   + '\x80\x00\x00\x01\x00' + 'y' * 256    # 32 bit length
+                   + '\xc0\x7f' + '\xc1\x00\x80' + '\xc2\x00\x00\x00\x80' # integers
+                   + '\xc3\x05\x0a' + 'z' * 5)               # lzf, 5 bytes compressed
+        # Sorted set entries, with a regular score and an infinite one
+        zset = '\x01a\x031.5' + '\x01b\xfe'
+        buf = strings + zset + 'END'
+        for reader in (BufferReader(buf), FileReader(StringIO(buf)), StreamReader(Unseekable(buf), buffer_size = 4)) :
+            reader.skip_strings(7)
+            self.assertEquals(reader.tell(), len(strings))
+            reader.skip_strings(2, scores = True)
+            self.assertEquals(reader.read(3), 'END')
+
+    def test_filters_skip_without_decoding(self):
+        r = MockRedis()
+        parser = FailingLzfParser(r, {'types' : ['hash']})
+        parser.parse(dump_path('ziplist_that_compresses_easily.rdb'))
+        self.assertEquals(r.databases[0], {})
+
+    def test_scan_keys_skips_filtered_keys_without_decoding(self):
+        # A string with a LZF compressed key of 25 bytes (one literal run) in database 0, and a hash in database 1
+        compressed_key = '\xc3' + '\x1a' + '\x19' + '\x18' + 'x' * 25
+        hash_value = '\x01' + '\x01f' + '\x01v'
+        buf = 'REDIS0003' + '\xfe\x00' + '\x00' + compressed_key + '\x01v' + '\xfe\x01' + '\x04' + '\x04hash' + hash_value + '\xff'
+        entries = list(RdbParser(None).scan_keys(BufferReader(buf)))
+        self.assertEquals([(entry.database, entry.key) for entry in entries], [(0, 'x' * 25), (1, 'hash')])
+        for filters in ({'types' : ['hash']}, {'dbs' : 1}, {'dbs' : 1, 'keys' : 'h.*'}) :
+            entries = list(FailingLzfParser(None, filters).scan_keys(BufferReader(buf), filtered = True))
+            self.assertEquals([(entry.database, entry.key, entry.offset, entry.length) for entry in entries], 
+                              [(1, 'hash', buf.index('\x04\x04hash'), 11)])
+        self.assertEquals(list(RdbParser(None, {'keys' : 'x+'}).scan_keys(BufferReader(buf), filtered = True))[0].key, 'x' * 25)
+
+    def test_stream_reader_matches_mmap_reader(self):
+        for file_name in os.listdir(os.path.join(os.path.dirname(__file__), 'dumps')) :
+            mapped = load_rdb(file_name)
+            with open(dump_path(file_name), 'rb') as f :
+                data = f.read()
+            # A small buffer makes fields and strings straddle refills
+            for buffer_size in (1, 7, 1 << 20) :
+                r = MockRedis()
+                RdbParser(r).read_rdb(StreamReader(Unseekable(data), buffer_size = buffer_size))
+                self.assertEquals(mapped.databases, r.databases, msg = "%s parsed differently" % file_name)
+                self.assertEquals(mapped.lengths, r.lengths, msg = "%s parsed differently" % file_name)
+
+    def test_parse_file_objects_and_gzip(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for file_name in ('dictionary.rdb', 'parser_filters.rdb', 'multiple_databases.rdb') :
+                mapped = load_rdb(file_name)
+                with open(dump_path(file_name), 'rb') as f :
+                    data = f.read()
+                r = MockRedis()
+                RdbParser(r).parse(Unseekable(data))
+                self.assertEquals(mapped.databases, r.databases, msg = "%s parsed differently" % file_name)
+                compressed = os.path.join(tmpdir, file_name + '.gz')
+                with gzip.open(compressed, 'wb') as f :
+                    f.write(data)
+                r = MockRedis()
+                RdbParser(r).parse(compressed)
+                self.assertEquals(mapped.databases, r.databases, msg = "%s parsed differently" % file_name)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_stream_reader_keeps_raw_bytes(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for file_name in ('dictionary.rdb', 'keys_with_expiry.rdb', 'regular_sorted_set.rdb', 'uncompressible_string_keys.rdb') :
+                mapped = os.path.join(tmpdir, 'mapped.rdb')
+                RdbParser(WriteRdbCallback(mapped)).parse(dump_path(file_name))
+                with open(dump_path(file_name), 'rb') as f :
+                    data = f.read()
+                streamed = os.path.join(tmpdir, 'streamed.rdb')
+                RdbParser(WriteRdbCallback(streamed)).read_rdb(StreamReader(Unseekable(data), buffer_size = 5, keep_raw = True))
+                with open(mapped, 'rb') as f :
+                    expected = f.read()
+                with open(streamed, 'rb') as f :
+                    self.assertEquals(expected, f.read(), msg = "%s written differently" % file_name)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_stream_reader_seeks_forward_only(self):
+        reader = StreamReader(Unseekable('0123456789'), buffer_size = 4)
+        self.assertEquals(reader.read(2), '01')
+        reader.seek(7)
+        self.assertEquals(reader.read(1), '7')
+        reader.seek(7)
+        self.assertEquals(reader.read(3), '789')
+        self.assertRaises(Exception, reader.seek, 0)
+
+    def test_iter_records_on_a_stream(self):
+        with open(dump_path('parser_filters.rdb'), 'rb') as f :
+            data = f.read()
+        keys = [record.key for record in RdbParser(None).iter_records(dump_path('parser_filters.rdb'))]
+        records = RdbParser(None).iter_records(Unseekable(data), lazy = True)
+        self.assertEquals(keys, [record.key for record in records])
+
+    def test_crc64(self):
+        data = '123456789' * 1000
+        for crc in (crc64, crc64_python) :
+            self.assertEquals(crc('123456789'), 0xe9c6d914c4b8d9ca)
+            self.assertEquals(crc(''), 0)
+            self.assertEquals(crc(data[777:], crc(data[:777])), crc64(data))
+            self.assertEquals(crc(buffer(data, 3)), crc64(data[3:]))
+
+    def test_verify_checksum(self):
+        for file_name in CHECKSUMMED_DUMPS :
+            with open(dump_path(file_name), 'rb') as f :
+                data = f.read()
+            self.assertEquals(verify_dump(dump_path(file_name)), struct.unpack('<Q', data[-8:])[0])
+            self.assertEquals(verify_dump(Unseekable(data), block_size = 5), struct.unpack('<Q', data[-8:])[0])
+            for use_mmap in (True, False) :
+                RdbParser(MockRedis(), verify_checksum = True).parse(dump_path(file_name), use_mmap = use_mmap)
+            for buffer_size in (1, 7, 1 << 20) :
+                parser = RdbParser(MockRedis(), verify_checksum = True)
+                parser.read_rdb(StreamReader(Unseekable(data), buffer_size = buffer_size, checksum = True))
+            # Keys are skipped by the scan, and the bytes skipped by the stream are checksummed
+            parser = RdbParser(None, verify_checksum = True)
+            list(parser.scan_keys(StreamReader(Unseekable(data), buffer_size = 3, checksum = True)))
+            list(parser.iter_records(Unseekable(data)))
+
+    def test_corrupted_dump_fails_checksum(self):
+        with open(dump_path('rdb_version_5_with_checksum.rdb'), 'rb') as f :
+            data = f.read()
+        corrupted = data.replace('efgh', 'efgX')
+        truncated = data[:-3]
+        for dump in (corrupted, truncated) :
+            self.assertRaises(Exception, verify_dump, Unseekable(dump))
+            self.assertRaises(Exception, RdbParser(MockRedis(), verify_checksum = True).parse, Unseekable(dump))
+            self.assertRaises(Exception, list, RdbParser(None, verify_checksum = True).iter_records(Unseekable(dump)))
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'corrupted.rdb')
+            with open(path, 'wb') as f :
+                f.write(corrupted)
+            for use_mmap in (True, False) :
+                self.assertRaises(Exception, RdbParser(MockRedis(), verify_checksum = True).parse, path, use_mmap)
+            # The checksum is only verified on demand
+            r = MockRedis()
+            RdbParser(r).parse(path)
+            self.assertEquals(r.databases[0]['abcd'], 'efgX')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_disabled_checksum_is_not_verified(self):
+        with open(dump_path('rdb_version_5_with_checksum.rdb'), 'rb') as f :
+            data = f.read()[:-8] + '\0' * 8
+        self.assertEquals(verify_dump(Unseekable(data)), None)
+        RdbParser(MockRedis(), verify_checksum = True).parse(Unseekable(data))
+        # Older dumps have no checksum
+        RdbParser(MockRedis(), verify_checksum = True).parse(dump_path('keys_with_expiry.rdb'))
+        self.assertRaises(Exception, verify_dump, dump_path('keys_with_expiry.rdb'))
+
+    def test_unchecksummed_stream_has_no_checksum(self):
+        reader = StreamReader(Unseekable('0123456789'), buffer_size = 4)
+        reader.read(6)
+        self.assertRaises(Exception, reader.checksum)
+        reader = StreamReader(Unseekable('0123456789'), buffer_size = 4, checksum = True)
+        reader.read(2)
+        reader.skip(5)
+        self.assertEquals(reader.checksum(), crc64('0123456'))
+        self.assertEquals(BufferReader('0123456789', 7).checksum(), crc64('0123456'))
+
+CHECKSUMMED_DUMPS = ('rdb_version_5_with_checksum.rdb', 'ziplist_with_integers.rdb', 'metadata_opcodes.rdb', 
+                     'quicklist_2.rdb', 'sorted_set_2.rdb', 'stream.rdb', 'streams_2_and_3.rdb')
+
+def dump_path(file_name) :
+    return os.path.join(os.path.dirname(__file__), 'dumps', file_name)
+
+def reference_lzf_decompress(compressed, expected_length) :
+    '''Byte at a time LZF decompression, as in lzf_d.c'''
+    in_stream = bytearray(compressed)
+    out_stream = bytearray()
+    in_index = 0
+    while in_index < len(in_stream) :
+        ctrl = in_stream[in_index]
+        in_index += 1
+        if ctrl < 32 :
+            for x in xrange(ctrl + 1) :
+                out_stream.append(in_stream[in_index])
+                in_index += 1
+        else :
+            length = ctrl >> 5
+            if length == 7 :
+                length += in_stream[in_index]
+                in_index += 1
+            ref = len(out_stream) - ((ctrl & 0x1f) << 8) - in_stream[in_index] - 1
+            in_index += 1
+            for x in xrange(length + 2) :
+                out_stream.append(out_stream[ref])
+                ref += 1
+    return str(out_stream)
+
+class RecordingLzfParser(RdbParser) :
+    def __init__(self, callback, blobs) :
+        RdbParser.__init__(self, callback)
+        self.blobs = blobs
+
+    def lzf_decompress(self, compressed, expected_length) :
+        self.blobs.append((compressed, expected_length))
+        return RdbParser.lzf_decompress(self, compressed, expected_length)
+
+class FailingLzfParser(RdbParser) :
+    def lzf_decompress(self, compressed, expected_length) :
+        raise Exception('lzf_decompress', 'Skipped strings must not be decompressed')
+
+class EntryDecodingParser(RdbParser) :
+    """Decodes ziplists and intsets entry by entry, through a BufferReader, as a reference for the bulk decoders"""
+    def read_ziplist_entries(self, ziplist) :
+        buff = BufferReader(ziplist, 10)
+        values = []
+        while ziplist[buff.tell()] != '\xff' :
+            values.append(self.read_ziplist_entry(buff))
+        return values
+
+    def read_intset_entries(self, intset) :
+        buff = BufferReader(intset)
+        encoding = buff.read_unsigned_int()
+        read_entry = {2 : buff.read_signed_short, 4 : buff.read_signed_int, 8 : buff.read_signed_long}[encoding]
+        return [read_entry() for x in xrange(0, buff.read_unsigned_int())]
+
+class Unseekable(object) :
+    """A file object over a string that can only be read, like a pipe"""
+    def __init__(self, data) :
+        self._f = StringIO(data)
+
+    def read(self, n = -1) :
+        return self._f.read(n)
+
 def floateq(f1, f2) :
     return math.fabs(f1 - f2) < 0.00001
 
-def load_rdb(file_name, filters=None) :
+def zipmap(pairs, free = 1) :
+    """A zipmap of the (field, value) string `pairs`, with `free` bytes after each value"""
+    def length(s) :
+        return chr(len(s)) if len(s) < 254 else '\xfe' + struct.pack('<I', len(s))
+    entries = ''.join(length(key) + key + length(value) + chr(free) + value + '\x00' * free for key, value in pairs)
+    return chr(len(pairs)) + entries + '\xff'
+
+def zipmap_dump(pairs) :
+    """A dump of RDB version 3 with the zipmap of `pairs` at the key 'zipmap'"""
+    blob = zipmap(pairs)
+    return 'REDIS0003' + '\xfe\x00' + '\x09' + '\x06zipmap' + '\x80' + struct.pack('>I', len(blob)) + blob + '\xff'
+
+def load_rdb(file_name, filters=None, use_mmap=True) :
     r = MockRedis()
     parser = RdbParser(r, filters)
-    parser.parse(os.path.join(os.path.dirname(__file__), 'dumps', file_name))
+    parser.parse(os.path.join(os.path.dirname(__file__), 'dumps', file_name), use_mmap=use_mmap)
     return r
     
 class MockRedis(RdbCallback):
@@ -320,6 +986,26 @@ class MockRedis(RdbCallback):
             raise Exception('Lengths mismatch on sortedset %s, expected length = %d, actual = %d'
                                  % (key, self.lengths[self.dbnum][key], len(self.currentdb()[key])))
 
+    def start_stream(self, key, listpacks_count, expiry, info):
+        if key in self.currentdb() :
+            raise Exception('start_stream called with key %s that already exists' % key)
+        self.currentdb()[key] = {'entries' : [], 'groups' : []}
+        if expiry :
+            self.store_expiry(key, expiry)
+    
+    def stream_entries(self, key, entries):
+        self.currentdb()[key]['entries'].extend(entries)
+    
+    def stream_group(self, key, group):
+        self.currentdb()[key]['groups'].append(group)
+    
+    def end_stream(self, key, info):
+        if len(self.currentdb()[key]['entries']) != info['length'] :
+            raise Exception('Lengths mismatch on stream %s, expected length = %d, actual = %d'
+                                 % (key, info['length'], len(self.currentdb()[key]['entries'])))
+        self.currentdb()[key]['info'] = info
+        self.store_length(key, info['length'])
+    
     def end_database(self, dbnum):
         if self.dbnum != dbnum :
             raise Exception('start_database called with %d, but end_database called %d instead' % (self.dbnum, dbnum))
@@ -327,4 +1013,73 @@ class MockRedis(RdbCallback):
     def end_rdb(self):
         self.methods_called.append('end_rdb')
 
+class BatchingMockRedis(MockRedis):
+    wants_batches = True
+
+    def __init__(self) :
+        MockRedis.__init__(self)
+        self.batches = []
+
+    def hset_many(self, key, pairs):
+        self.batches.append(len(pairs))
+        MockRedis.hset_many(self, key, pairs)
+
+    def sadd_many(self, key, members):
+        self.batches.append(len(members))
+        MockRedis.sadd_many(self, key, members)
+
+    def rpush_many(self, key, values):
+        self.batches.append(len(values))
+        MockRedis.rpush_many(self, key, values)
+
+    def zadd_many(self, key, pairs):
+        self.batches.append(len(pairs))
+        MockRedis.zadd_many(self, key, pairs)
+
+class ElementCensus(RdbCallback):
+    """Records the lengths of the collections, and fails on every element, unless its mask lets streams through"""
+    def __init__(self, wants_elements) :
+        self.wants_elements = wants_elements
+        self.lengths = {}
+        self.largest = {}
+        self.types = {}
+        self.elements = 0
+        self.dbnum = 0
+
+    def start_database(self, dbnum):
+        self.dbnum = dbnum
+        self.lengths[dbnum] = {}
+
+    def start_collection(self, data_type, key, length, info) :
+        self.types[key] = data_type
+        self.lengths[self.dbnum][key] = length
+        if 'len_largest_element' in info :
+            self.largest[(self.dbnum, key)] = info['len_largest_element']
+        # Only compact encodings omit their elements when their lengths are wanted
+        self.compact = self.wants_elements == ELEMENTS_NONE or 'sizeof_value' in info
+
+    def start_hash(self, key, length, expiry, info):
+        self.start_collection('hash', key, length, info)
+
+    def start_set(self, key, cardinality, expiry, info):
+        self.start_collection('set', key, cardinality, info)
+
+    def start_list(self, key, length, expiry, info):
+        self.start_collection('list', key, length, info)
+
+    def start_sorted_set(self, key, length, expiry, info):
+        self.start_collection('sortedset', key, length, info)
+
+    def element(self, key, *args) :
+        if self.compact :
+            raise Exception('Unexpected element for key %s' % key)
+        self.elements += 1
+
+    hset = sadd = rpush = zadd = element
+
+    def stream_entries(self, key, entries) :
+        if self.wants_elements == ELEMENTS_NONE :
+            raise Exception('Unexpected entries for key %s' % key)
 
+    def end_stream(self, key, info):
+        self.lengths[self.dbnum][key] = info['length']
@@ -0,0 +1,55 @@
+import unittest
+import os
+from StringIO import StringIO
+
+from rdbtools import RdbParser, JSONCallback
+from rdbtools.profiling import ParseProfile
+from tests.parser_tests import MockRedis, BatchingMockRedis
+
+def dump_path(file_name) :
+    return os.path.join(os.path.dirname(__file__), 'dumps', file_name)
+
+class ParseProfileTestCase(unittest.TestCase):
+    def test_callbacks_receive_the_same_events(self):
+        for file_name in ('parser_filters.rdb', 'stream.rdb', 'ziplist_that_compresses_easily.rdb') :
+            plain = MockRedis()
+            RdbParser(plain).parse(dump_path(file_name))
+            for callback in (MockRedis(), BatchingMockRedis()) :
+                RdbParser(callback, profile = ParseProfile()).parse(dump_path(file_name))
+                self.assertEquals(plain.databases, callback.databases, msg = file_name)
+                self.assertEquals(plain.lengths, callback.lengths, msg = file_name)
+
+    def test_calls_are_counted(self):
+        profile = ParseProfile()
+        RdbParser(MockRedis(), profile = profile).parse(dump_path('dictionary.rdb'))
+        rows = dict((name, calls) for name, calls, seconds in profile.report())
+        self.assertEquals(rows['callback hset'], 1000)
+        self.assertEquals(rows['callback start_hash'], 1)
+        self.assertEquals(rows['decode hash hashtable'], 1)
+        self.assertEquals(rows['callback start_rdb'], 1)
+
+        profile = ParseProfile()
+        RdbParser(MockRedis(), {'types' : ['string']}, profile = profile).parse(dump_path('ziplist_that_compresses_easily.rdb'))
+        rows = dict((name, calls) for name, calls, seconds in profile.report())
+        self.assertEquals(rows['skip'], 1)
+        self.assert_('lzf_decompress' not in rows)
+
+    def test_time_is_not_counted_twice(self):
+        profile = ParseProfile()
+        out = StringIO()
+        RdbParser(JSONCallback(profile.wrap_output(out)), profile = profile).parse(dump_path('parser_filters.rdb'))
+        self.assert_(out.getvalue().startswith('[{'))
+        rows = dict((name, (calls, seconds)) for name, calls, seconds in profile.report())
+        self.assert_(rows['output write'][0] > 0)
+        self.assert_(sum(seconds for calls, seconds in rows.itervalues()) <= profile.elapsed)
+
+    def test_slowest_keys(self):
+        profile = ParseProfile(top = 3)
+        RdbParser(MockRedis(), profile = profile).parse(dump_path('parser_filters.rdb'))
+        self.assertEquals(len(profile.slowest_keys), 3)
+        out = StringIO()
+        profile.write_report(out)
+        report = out.getvalue()
+        self.assert_('Slowest keys to decode' in report)
+        for seconds, key, encoding in profile.slowest_keys :
+            self.assert_(repr(key) in report)
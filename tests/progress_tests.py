@@ -0,0 +1,79 @@
+import unittest
+import os
+import json
+from StringIO import StringIO
+
+from rdbtools import RdbParser
+from rdbtools.progress import ParseStats, format_bytes, format_seconds
+from tests.parser_tests import MockRedis, BatchingMockRedis, Unseekable
+
+def dump_path(file_name) :
+    return os.path.join(os.path.dirname(__file__), 'dumps', file_name)
+
+def parse_with_stats(file_name, callback = None, **kwargs) :
+    stats = ParseStats(**kwargs)
+    r = callback or MockRedis()
+    RdbParser(r, stats = stats).parse(dump_path(file_name))
+    return r, stats
+
+class ParseStatsTestCase(unittest.TestCase):
+    def test_counts_keys_and_elements_by_type(self):
+        for file_name in ('parser_filters.rdb', 'multiple_databases.rdb', 'stream.rdb', 'quicklist_2.rdb', 'dictionary.rdb') :
+            r, stats = parse_with_stats(file_name)
+            keys, elements = {}, {}
+            for record in RdbParser(None).iter_records(dump_path(file_name)) :
+                keys[record.data_type] = keys.get(record.data_type, 0) + 1
+                length = 1 if record.data_type == 'string' else record.length
+                elements[record.data_type] = elements.get(record.data_type, 0) + length
+            self.assertEquals(stats.keys, keys, msg = file_name)
+            self.assertEquals(stats.elements, elements, msg = file_name)
+            self.assertEquals(stats.bytes_read, os.path.getsize(dump_path(file_name)), msg = file_name)
+            self.assertEquals(stats.percent, 100.0)
+
+    def test_callbacks_receive_the_same_events(self):
+        plain = MockRedis()
+        RdbParser(plain).parse(dump_path('parser_filters.rdb'))
+        for callback in (MockRedis(), BatchingMockRedis()) :
+            r, stats = parse_with_stats('parser_filters.rdb', callback)
+            self.assertEquals(plain.databases, r.databases)
+            self.assertEquals(plain.lengths, r.lengths)
+
+    def test_progress_is_reported(self):
+        reports = []
+        def on_progress(stats) :
+            reports.append((stats.total_keys, stats.end_time is not None))
+        # Every key reads the clock, and every read reports
+        r, stats = parse_with_stats('parser_filters.rdb', on_progress = on_progress, interval = 0, check_keys = 1)
+        self.assertEquals(len(reports), stats.total_keys + 1)
+        self.assertEquals(reports[-1], (stats.total_keys, True))
+        self.assert_(not any(done for keys, done in reports[:-1]))
+        self.assert_('done in' in stats.format_progress())
+
+    def test_stream_has_no_size(self):
+        with open(dump_path('parser_filters.rdb'), 'rb') as f :
+            data = f.read()
+        stats = ParseStats()
+        RdbParser(MockRedis(), stats = stats).parse(Unseekable(data))
+        self.assertEquals(stats.bytes_read, len(data))
+        self.assertEquals(stats.percent, None)
+        self.assertEquals(stats.eta, None)
+        self.assert_('%' not in stats.format_progress())
+
+    def test_stats_files(self):
+        r, stats = parse_with_stats('stream.rdb')
+        out = StringIO()
+        stats.write_json(out)
+        written = json.loads(out.getvalue())
+        self.assertEquals(written['keys'], {'string' : 1, 'stream' : 2})
+        self.assertEquals(written['bytes_read'], os.path.getsize(dump_path('stream.rdb')))
+        out = StringIO()
+        stats.write_prometheus(out)
+        lines = out.getvalue().splitlines()
+        self.assert_('rdbtools_keys{type="stream"} 2' in lines)
+        self.assert_('rdbtools_bytes_read %d' % os.path.getsize(dump_path('stream.rdb')) in lines)
+        self.assert_('# TYPE rdbtools_elements counter' in lines)
+
+    def test_format(self):
+        self.assertEquals(format_bytes(100), '100 bytes')
+        self.assertEquals(format_bytes(3 * 1024 * 1024 * 1024), '3.00 GB')
+        self.assertEquals(format_seconds(3725.5), '1:02:05')
@@ -0,0 +1,82 @@
+"""
+Records the memory Redis reports for keys of every encoding, to calibrate the memory estimates of
+MemoryCallback against. The keys are written to a redis server, which reloads them from its dump as
+rdbtools models them. Their MEMORY USAGE, and the memory freed by deleting each of them, are recorded
+with the dump in tests/memory_usage, as redis-<version>-<allocator>.json and .rdb.
+
+Like create_test_rdb.py, it needs a redis server of version 4.0 or more, which it flushes. The server
+must accept DEBUG RELOAD, with --enable-debug-command local from Redis 7.0 :
+    python -m tests.record_memory_usage [host] [port]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+
+import redis
+
+def create_keys(r):
+    r.set('string_shared_integer', 42)
+    r.set('string_integer', 123456789)
+    r.set('string_empty', '')
+    r.set('string_embedded', 'x' * 44)
+    r.set('string_raw', 'x' * 45)
+    for size in (100, 1000, 10000, 100000):
+        r.set('string_%d' % size, 'y' * size)
+    # Commands are sent as they are, as their signatures differ between versions of redis-py.
+    # Collections are compact up to 512 elements (128 for sorted sets) in the default configuration
+    for key, size in (('hash_compact', 10), ('hash_hashtable_1000', 1000), ('hash_hashtable_5000', 5000)):
+        r.execute_command('HSET', key, *[part for x in xrange(size) for part in ('field:%d' % x, 'value:%d' % x)])
+    r.sadd('set_intset', *range(0, 100))
+    # Sets of strings are hashtables before Redis 7.2
+    r.sadd('set_compact', *['member:%d' % x for x in xrange(10)])
+    for size in (1000, 5000):
+        r.sadd('set_hashtable_%d' % size, *['member:%d' % x for x in xrange(size)])
+    for key, size in (('sorted_set_compact', 10), ('sorted_set_skiplist_200', 200), ('sorted_set_skiplist_5000', 5000)):
+        r.execute_command('ZADD', key, *[part for x in xrange(size) for part in (x, 'member:%d' % x)])
+    for size in (10, 1000, 20000):
+        r.rpush('list_%d' % size, *['element:%d' % x for x in xrange(size)])
+
+def allocated(r, keys):
+    """The used memory freed by deleting each of `keys`"""
+    # Padding keys keep the keyspace from being resized while the keys are deleted
+    r.mset(dict(('padding:%d' % x, 'x') for x in xrange(4 * len(keys))))
+    freed = {}
+    for key in keys:
+        before = r.info('memory')['used_memory']
+        r.delete(key)
+        freed[key] = before - r.info('memory')['used_memory']
+    return freed
+
+def record(r, folder):
+    info = r.info()
+    name = 'redis-%s-%s' % (info['redis_version'], info['mem_allocator'].split('-')[0])
+    r.flushall()
+    create_keys(r)
+    # Objects are allocated as the server allocates them when it loads a dump, e.g. hashtables of the size of the
+    # collection rather than grown and rehashing, and large strings without the free space of the query buffer
+    r.execute_command('DEBUG', 'RELOAD')
+    keys = sorted(r.keys('*'))
+    usage = dict((key, r.execute_command('MEMORY', 'USAGE', key, 'SAMPLES', 0)) for key in keys)
+    config = r.config_get('dir')
+    config.update(r.config_get('dbfilename'))
+    shutil.copy(os.path.join(config['dir'], config['dbfilename']), os.path.join(folder, '%s.rdb' % name))
+    with open(os.path.join(folder, '%s.json' % name), 'w') as out:
+        json.dump({'redis_version' : info['redis_version'], 'mem_allocator' : info['mem_allocator'],
+                   'recorded' : time.strftime('%Y-%m-%d'), 'memory_usage' : usage, 'allocated' : allocated(r, keys)},
+                  out, indent = 2, sort_keys = True)
+        out.write('\n')
+    r.flushall()
+    return name
+
+def main():
+    host = sys.argv[1] if len(sys.argv) > 1 else 'localhost'
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 6379
+    folder = os.path.join(os.path.dirname(__file__), 'memory_usage')
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    print('Recorded %s' % record(redis.StrictRedis(host, port), folder))
+
+if __name__ == '__main__':
+    main()